@@ -2,32 +2,169 @@
 Streamlit Dashboard for Data-Cleaning Project
 ---------------------------------------------
 Explores the validated dataset stored in data/warehouse/data-cleaning.duckdb.
+
+The first render comes from the serving snapshot written at load time
+(see warehouse/serving.py): slider bounds, the country list, the default
+selection's totals and the chart series are read from one memory-mapped
+Arrow file, so a cold dashboard process paints without opening DuckDB,
+and as fast for a large warehouse as for a small one. plotly is only
+imported once the metrics are on screen.
+
+Views the snapshot does not cover (another country selection, or a
+warehouse without a valid snapshot) are parameterized DuckDB queries run
+on a pooled read-only cursor (see warehouse/connect.py), imported on
+first use. Results stay Arrow tables end to end (plotly and st.dataframe
+take them as is) and are cached as memory-mapped Arrow IPC files (see
+warehouse/results.py) keyed on the query, its parameters and the database
+version, so dashboard processes share one copy and a reload of the
+warehouse invalidates them automatically. Charts read the rollup tables
+built at load time when they exist and fall back to aggregating
+clean_data otherwise.
 """
 
+import bisect
+import functools
+import sys
+
 import streamlit as st
-import duckdb
-import pandas as pd
-import plotly.express as px
+import pyarrow as pa
 from pathlib import Path
 
+# `streamlit run app/streamlit_app.py` only puts app/ on the path.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from warehouse import serving
+from warehouse.config import DB_PATH
+
 # ───────────────────────────────
 # Setup
 # ───────────────────────────────
 st.set_page_config(page_title="Global Data Dashboard", layout="wide")
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = PROJECT_ROOT / "data" / "warehouse" / "data-cleaning.duckdb"
-
-# ───────────────────────────────
-# Connect and load data
-# ───────────────────────────────
-@st.cache_data
-def load_data():
-    con = duckdb.connect(str(DB_PATH))
-    df = con.execute("SELECT * FROM clean_data;").fetchdf()
-    con.close()
-    return df
-
-df = load_data()
+QUERY_CACHE_SIZE = 256
+ZERO_TOTALS = {"population": 0, "gdp": 0, "co2_emissions": 0}
+
+# The warehouse is built locally (it is not in the repository).
+if not DB_PATH.exists():
+    st.error(f" No warehouse at {DB_PATH}: run `python pipelines/flow.py` "
+             "(or `python pipelines/load_to_duckdb.py`) first.")
+    st.stop()
+
+# Precomputed views of the current warehouse version (None: query DuckDB instead).
+SNAPSHOT = serving.read_snapshot(DB_PATH)
+
+# ───────────────────────────────
+# Shared connection and query cache
+# ───────────────────────────────
+def _results():
+    # Imported on first use: DuckDB is not needed while the snapshot covers the view.
+    from warehouse.results import ResultCache
+    return ResultCache(db_path=DB_PATH)
+
+def _db_stamp() -> int:
+    return DB_PATH.stat().st_mtime_ns
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _cached_query(sql: str, params: tuple, stamp: int) -> pa.Table:
+    # The pool hands each session thread its own cursor and reopens the
+    # shared connection when the DB file changes (stamp is only the cache key).
+    # The table is memory-mapped, so this in-process layer holds no copy of the data.
+    return _results().query(sql, [list(p) if isinstance(p, tuple) else p for p in params])
+
+def query(sql: str, params=()) -> pa.Table:
+    """Run sql with params; results are shared across sessions and processes (read-only)."""
+    return _cached_query(sql, tuple(params), _db_stamp())
+
+def first_row(table: pa.Table) -> dict:
+    return table.slice(0, 1).to_pylist()[0]
+
+def query_rollup(rollup: str, rollup_sql: str, base_sql: str, params=()) -> pa.Table:
+    """Query a rollup table if the warehouse has it, else the equivalent over clean_data."""
+    tables = query("SELECT table_name FROM information_schema.tables;")["table_name"]
+    return query(rollup_sql if rollup in set(tables.to_pylist()) else base_sql, params)
+
+def for_year(table: pa.Table, year: int) -> pa.Table:
+    """Rows of year in a snapshot series (sorted by year)."""
+    # Slicing a plain list keeps pandas unloaded: pyarrow imports it to convert a scalar or to_numpy().
+    years = table["year"].to_pylist()
+    start = bisect.bisect_left(years, year)
+    return table.slice(start, bisect.bisect_right(years, year) - start)
+
+# ───────────────────────────────
+# Views: from the snapshot when it covers them, else queried
+# ───────────────────────────────
+def year_bounds() -> tuple:
+    if SNAPSHOT is not None:
+        years = SNAPSHOT["years"]["year"]
+        return years[0].as_py(), years[-1].as_py()
+    years = first_row(query("SELECT MIN(year) AS min_year, MAX(year) AS max_year FROM clean_data;"))
+    return years["min_year"], years["max_year"]
+
+def country_list() -> list:
+    if SNAPSHOT is not None:
+        return SNAPSHOT["countries"]["country_name"].to_pylist()
+    return query(
+        "SELECT DISTINCT country_name FROM clean_data WHERE country_name IS NOT NULL ORDER BY 1;"
+    )["country_name"].to_pylist()
+
+def selection_totals(year: int, selected: list, default: list) -> dict:
+    if SNAPSHOT is not None and sorted(selected) == sorted(default):
+        rows = for_year(SNAPSHOT["default_totals"], year).drop_columns(["year"])
+        return first_row(rows) if rows.num_rows else ZERO_TOTALS
+    return first_row(query("""
+        SELECT COALESCE(SUM(population), 0)    AS population,
+               COALESCE(SUM(gdp), 0)           AS gdp,
+               COALESCE(SUM(co2_emissions), 0) AS co2_emissions
+        FROM clean_data
+        WHERE year = ? AND country_name = ANY(?);
+    """, (year, tuple(sorted(selected)))))
+
+def top_gdp(year: int) -> pa.Table:
+    if SNAPSHOT is not None:
+        return for_year(SNAPSHOT["top_gdp"], year).select(["country_name", "gdp"])
+    return query_rollup("rollup_gdp_rank", f"""
+        SELECT country_name, gdp
+        FROM rollup_gdp_rank
+        WHERE year = ? AND gdp_rank <= {serving.TOP_N}
+        ORDER BY gdp_rank;
+    """, f"""
+        SELECT country_name, gdp
+        FROM clean_data
+        WHERE year = ?
+        ORDER BY gdp DESC NULLS LAST
+        LIMIT {serving.TOP_N};
+    """, (year,))
+
+def co2_trend() -> pa.Table:
+    if SNAPSHOT is not None:
+        return SNAPSHOT["co2_trend"]
+    return query_rollup("rollup_yearly_totals", """
+        SELECT year, COALESCE(total_co2, 0) AS co2_emissions
+        FROM rollup_yearly_totals
+        ORDER BY year;
+    """, """
+        SELECT year, COALESCE(SUM(co2_emissions), 0) AS co2_emissions
+        FROM clean_data
+        GROUP BY year
+        ORDER BY year;
+    """)
+
+def gdp_vs_co2() -> pa.Table:
+    if SNAPSHOT is not None:
+        return SNAPSHOT["gdp_co2"]
+    return query_rollup("rollup_gdp_co2", """
+        SELECT year, gdp, co2_emissions
+        FROM rollup_gdp_co2
+        WHERE year >= ?;
+    """, """
+        SELECT year, gdp, co2_emissions
+        FROM clean_data
+        WHERE year >= ? AND gdp IS NOT NULL AND co2_emissions IS NOT NULL;
+    """, (serving.SCATTER_MIN_YEAR,))
+
+def preview() -> pa.Table:
+    if SNAPSHOT is not None:
+        return SNAPSHOT["preview"]
+    return query(f"SELECT * FROM clean_data LIMIT {serving.PREVIEW_ROWS};")
 
 st.title(" Global Data Explorer")
 st.caption("Data from validated DuckDB database — GDP, Population, and CO₂ emissions")
@@ -35,14 +172,15 @@ st.caption("Data from validated DuckDB database — GDP, Population, and CO₂ e
 # ───────────────────────────────
 # Sidebar filters
 # ───────────────────────────────
-years = sorted(df["year"].dropna().unique())
-countries = sorted(df["country_name"].dropna().unique())
+min_year, max_year = year_bounds()
+countries = country_list()
+default_countries = countries[:serving.DEFAULT_COUNTRIES]
 
 st.sidebar.header("Filters")
-year_sel = st.sidebar.slider("Select Year", int(min(years)), int(max(years)), int(max(years)))
-country_sel = st.sidebar.multiselect("Select Countries", countries, default=countries[:5])
+year_sel = st.sidebar.slider("Select Year", int(min_year), int(max_year), int(max_year))
+country_sel = st.sidebar.multiselect("Select Countries", countries, default=default_countries)
 
-filtered = df[(df["year"] == year_sel) & (df["country_name"].isin(country_sel))]
+totals = selection_totals(year_sel, country_sel, default_countries)
 
 # ───────────────────────────────
 # Layout: 3 columns
@@ -50,35 +188,29 @@ filtered = df[(df["year"] == year_sel) & (df["country_name"].isin(country_sel))]
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.metric("Total Population", f"{filtered['population'].sum():,.0f}")
+    st.metric("Total Population", f"{totals['population']:,.0f}")
 with col2:
-    st.metric("Total GDP (USD)", f"{filtered['gdp'].sum():,.0f}")
+    st.metric("Total GDP (USD)", f"{totals['gdp']:,.0f}")
 with col3:
-    st.metric("Total CO₂ (kt)", f"{filtered['co2_emissions'].sum():,.0f}")
+    st.metric("Total CO₂ (kt)", f"{totals['co2_emissions']:,.0f}")
 
 st.divider()
 
+# Imported here, once the metrics are on screen: plotly is the slowest import of the page.
+import plotly.express as px
+
 # ───────────────────────────────
 # Chart 1: Top 10 GDP countries (selected year)
 # ───────────────────────────────
-top_gdp = (
-    df[df["year"] == year_sel]
-    .sort_values("gdp", ascending=False)
-    .head(10)
-)
-fig1 = px.bar(top_gdp, x="gdp", y="country_name",
-              orientation="h", title=f"Top 10 GDP Countries ({year_sel})",
+fig1 = px.bar(top_gdp(year_sel), x="gdp", y="country_name",
+              orientation="h", title=f"Top {serving.TOP_N} GDP Countries ({year_sel})",
               labels={"gdp": "GDP (USD)", "country_name": "Country"})
 st.plotly_chart(fig1, use_container_width=True)
 
 # ───────────────────────────────
 # Chart 2: Global CO₂ emissions trend
 # ───────────────────────────────
-global_co2 = (
-    df.groupby("year", as_index=False)["co2_emissions"].sum()
-    .sort_values("year")
-)
-fig2 = px.line(global_co2, x="year", y="co2_emissions",
+fig2 = px.line(co2_trend(), x="year", y="co2_emissions",
                title="Global CO₂ Emissions Over Time",
                labels={"co2_emissions": "CO₂ (kt)", "year": "Year"})
 st.plotly_chart(fig2, use_container_width=True)
@@ -87,10 +219,10 @@ st.plotly_chart(fig2, use_container_width=True)
 # Chart 3: GDP vs CO₂ scatter
 # ───────────────────────────────
 fig3 = px.scatter(
-    df[df["year"] >= 2000],
+    gdp_vs_co2(),
     x="gdp", y="co2_emissions",
     color="year",
-    title="GDP vs CO₂ Emissions (2000+)",
+    title=f"GDP vs CO₂ Emissions ({serving.SCATTER_MIN_YEAR}+)",
     labels={"gdp": "GDP (USD)", "co2_emissions": "CO₂ (kt)"}
 )
 st.plotly_chart(fig3, use_container_width=True)
@@ -101,4 +233,4 @@ st.divider()
 # Data preview
 # ───────────────────────────────
 st.subheader("Raw Data Preview")
-st.dataframe(df.head(20))
+st.dataframe(preview())
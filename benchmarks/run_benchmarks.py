@@ -0,0 +1,220 @@
+"""
+Pipeline benchmarks
+-------------------
+Generates synthetic raw files at each requested scale (see synthetic.py)
+and times every stage on them:
+
+  load_and_clean   every source, one after another (pandas)
+  merge_datasets   clean + join + gap fill + Parquet write, per --engine
+  profile          streaming data profile of the processed Parquet
+  load_to_duckdb   replace load of the processed Parquet (incl. rollups)
+  validate         the declarative validation rules (one DuckDB scan)
+  stage_version    staging the loaded warehouse for the next load: a
+                   copy-on-write clone where the filesystem supports it,
+                   else a full copy (see warehouse/versions.py)
+
+Each stage runs --repeat times and the median is reported. With
+--baseline, medians are compared to a previous results file and the run
+exits with status 1 if any stage is more than --threshold slower.
+
+Usage:
+  python benchmarks/run_benchmarks.py --rows 10000 100000 1000000
+  python benchmarks/run_benchmarks.py --rows 100000 --save benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --rows 100000 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT / "pipelines"))
+
+import pyarrow.parquet as pq
+
+import profiler
+import transform_clean
+import validate_data
+from load_to_duckdb import load_to_duckdb
+from synthetic import extra_indicator_names, generate, shape_for
+from warehouse import connect as warehouse
+from warehouse import versions
+
+RESULTS_PATH = PROJECT_ROOT / "benchmarks" / "results" / "latest.json"
+DEFAULT_THRESHOLD = 0.25
+
+# ───────────────────────────────
+# Timing helpers
+# ───────────────────────────────
+def _timed(fn, repeat: int) -> list:
+    """Run fn repeat times with its output silenced; returns wall times in seconds."""
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+    return times
+
+def _result(stage, rows, engine, times, rows_processed):
+    median = statistics.median(times)
+    return {
+        "key": f"{stage}|{rows}|{engine}",
+        "stage": stage,
+        "rows": rows,
+        "engine": engine,
+        "median_s": median,
+        "min_s": min(times),
+        "rows_per_s": rows_processed / median if median else None,
+    }
+
+# ───────────────────────────────
+# One scale
+# ───────────────────────────────
+def bench_scale(rows: int, engines: list, repeat: int, countries: int = None,
+                extra_indicators: int = 0, workdir: Path = None) -> list:
+    """Benchmark all stages on freshly generated data of about rows rows per file."""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir, prefix="bench_") as tmp:
+        tmp = Path(tmp)
+        files = generate(tmp / "data" / "raw", rows, countries, extra_indicators)
+        total_rows = sum(sum(1 for _ in open(p)) - 1 for p in files.values())
+        n_countries, n_years = shape_for(rows, countries)
+        print(f"\n {rows:,} rows/file: {n_countries:,} countries × {n_years} years, "
+              f"{len(files)} indicators ({total_rows:,} raw rows)")
+
+        for name in extra_indicator_names(extra_indicators):
+            transform_clean.register_indicator(name, f"{name}_*.csv")
+
+        transform_clean.use_data_dir(tmp / "data")
+        try:
+            def clean_each():
+                for name, path in files.items():
+                    transform_clean.load_and_clean(path, name)
+            results.append(_result("load_and_clean", rows, "pandas",
+                                   _timed(clean_each, repeat), total_rows))
+
+            for engine in engines:
+                merge = lambda: transform_clean.merge_datasets(engine=engine)
+                results.append(_result("merge_datasets", rows, engine,
+                                       _timed(merge, repeat), total_rows))
+
+            processed = tmp / "data" / "processed" / "clean_data.parquet"
+            profile = lambda: profiler.profile_parquet(processed)
+            results.append(_result("profile", rows, "streaming", _timed(profile, repeat),
+                                   pq.read_metadata(processed).num_rows))
+
+            db_path = tmp / "bench.duckdb"
+            load = lambda: load_to_duckdb(processed, db_path, validate=False)
+            load_times = _timed(load, repeat)
+            con = warehouse.reader(db_path)
+            loaded = con.execute("SELECT COUNT(*) FROM clean_data;").fetchone()[0]
+            validate = lambda: validate_data.run_validation(con, validate_data.DEFAULT_RULES)
+            validate_times = _timed(validate, repeat)
+            warehouse.close(db_path)
+            results.append(_result("load_to_duckdb", rows, "duckdb", load_times, loaded))
+            results.append(_result("validate", rows, "duckdb", validate_times, loaded))
+
+            stage = lambda: versions.discard(versions.stage(db_path))
+            results.append(_result("stage_version", rows, "versions", _timed(stage, repeat), loaded))
+        finally:
+            transform_clean.use_data_dir(transform_clean.PROJECT_ROOT / "data")
+            for name in extra_indicator_names(extra_indicators):
+                transform_clean.INDICATORS.pop(name, None)
+    return results
+
+# ───────────────────────────────
+# Baseline comparison
+# ───────────────────────────────
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """Annotate results with their baseline; returns the keys that regressed."""
+    previous = {r["key"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        base = previous.get(r["key"])
+        if base is None:
+            r["baseline_s"] = r["change"] = None
+            continue
+        r["baseline_s"] = base["median_s"]
+        r["change"] = r["median_s"] / base["median_s"] - 1 if base["median_s"] else 0.0
+        if r["change"] > threshold:
+            regressions.append(r["key"])
+    return regressions
+
+def print_table(results: list):
+    print(f"\n {'stage':<16}{'rows':>12}  {'engine':<8}{'median s':>10}{'rows/s':>14}"
+          f"{'baseline s':>12}{'change':>9}")
+    print(" " + "-" * 81)
+    for r in results:
+        base = f"{r['baseline_s']:.3f}" if r.get("baseline_s") is not None else "-"
+        change = f"{r['change']:+.0%}" if r.get("change") is not None else "-"
+        rate = f"{r['rows_per_s']:,.0f}" if r["rows_per_s"] else "-"
+        print(f" {r['stage']:<16}{r['rows']:>12,}  {r['engine']:<8}{r['median_s']:>10.3f}"
+              f"{rate:>14}{base:>12}{change:>9}")
+
+# ───────────────────────────────
+# Main
+# ───────────────────────────────
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Rows per country-level raw file, one benchmark per value.")
+    parser.add_argument("--countries", type=int, default=None,
+                        help="Number of countries (default: derived from --rows, up to 300 years each).")
+    parser.add_argument("--extra-indicators", type=int, default=0,
+                        help="Additional synthetic indicators beyond population/gdp/co2.")
+    parser.add_argument("--engine", nargs="+", default=["pandas", "duckdb", "chunked"],
+                        choices=["pandas", "duckdb", "chunked"], help="merge_datasets engines to time.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (median reported).")
+    parser.add_argument("--workdir", type=Path, default=None,
+                        help="Where to generate the synthetic data (default: system temp dir).")
+    parser.add_argument("--out", type=Path, default=RESULTS_PATH, help="Results JSON to write.")
+    parser.add_argument("--save", type=Path, default=None,
+                        help="Also write the results here (e.g. to use as a baseline later).")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown vs the baseline before failing (0.25 = 25%%).")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        results += bench_scale(rows, args.engine, args.repeat, args.countries,
+                               args.extra_indicators, args.workdir)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    print_table(results)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "settings": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "results": results,
+        "regressions": regressions,
+    }
+    for path in filter(None, [args.out, args.save]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"\n Results saved to {args.out}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
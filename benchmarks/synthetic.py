@@ -0,0 +1,103 @@
+"""
+Synthetic raw datasets for benchmarks
+-------------------------------------
+Writes population / gdp / co2_emissions snapshots (plus any number of
+extra indicators) at a configurable scale, in the same layouts as the real
+downloads so they go through the normal cleaning code:
+
+  population, gdp   Country Name,Country Code,Year,Value
+  co2_emissions     Year,Total,Gas Fuel,...   (country-less → "World"; one row per year)
+  indicator_<k>     Country Name,Country Code,Year,Value  (even k)
+                    Country,Year,Total                    (odd k)
+
+A small share of values is blank or negative, like the real files.
+
+Used by: benchmarks/run_benchmarks.py
+"""
+
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1750
+MAX_YEARS = 300
+MISSING_SHARE = 0.03
+NEGATIVE_SHARE = 0.01
+SNAPSHOT_DATE = "20000101"
+COUNTRIES_PER_BLOCK = 2_000
+
+CO2_COLUMNS = ["Year", "Total", "Gas Fuel", "Liquid Fuel", "Solid Fuel",
+               "Cement", "Gas Flaring", "Per Capita"]
+
+def shape_for(rows: int, countries: int = None) -> tuple:
+    """(countries, years) giving about rows rows per country-level file."""
+    if countries:
+        return countries, max(1, min(MAX_YEARS, math.ceil(rows / countries)))
+    years = min(MAX_YEARS, rows)
+    return math.ceil(rows / years), years
+
+def extra_indicator_names(n: int) -> list:
+    return [f"indicator_{k}" for k in range(n)]
+
+def _dirty(values: np.ndarray, rng) -> np.ndarray:
+    values = values.astype("float64")
+    draw = rng.random(len(values))
+    values[draw < NEGATIVE_SHARE] *= -1
+    values[draw > 1 - MISSING_SHARE] = np.nan
+    return values
+
+def _write_country_file(path: Path, countries: int, years: int, rng, base: float,
+                        growth: float, integer: bool, layout: str = "value"):
+    """Stream a long-format file in blocks of countries (bounded memory at any scale)."""
+    year_values = np.arange(FIRST_YEAR, FIRST_YEAR + years)
+    header = True
+    with open(path, "w", newline="") as f:
+        for start in range(0, countries, COUNTRIES_PER_BLOCK):
+            ids = np.arange(start, min(start + COUNTRIES_PER_BLOCK, countries))
+            names = np.repeat([f"Country {i:07d}" for i in ids], years)
+            year = np.tile(year_values, len(ids))
+            scale = np.repeat(base * rng.uniform(0.1, 10, len(ids)), years)
+            values = scale * (1 + growth) ** (year - FIRST_YEAR)
+            if integer:
+                values = np.round(values)
+            values = _dirty(values, rng)
+            if layout == "value":
+                block = pd.DataFrame({"Country Name": names,
+                                      "Country Code": np.repeat([f"C{i:07d}" for i in ids], years),
+                                      "Year": year, "Value": values})
+            else:
+                block = pd.DataFrame({"Country": names, "Year": year, "Total": values})
+            if integer:
+                last = block.columns[-1]
+                block[last] = block[last].astype("Int64")
+            block.to_csv(f, header=header, index=False)
+            header = False
+
+def _write_co2_file(path: Path, years: int, rng):
+    year = np.arange(FIRST_YEAR, FIRST_YEAR + years)
+    total = _dirty(np.round(3 * 1.03 ** (year - FIRST_YEAR)), rng)
+    df = pd.DataFrame({"Year": year, "Total": total})
+    for col in CO2_COLUMNS[2:]:
+        df[col] = np.round(total * rng.uniform(0, 0.5, years))
+    df[CO2_COLUMNS].to_csv(path, index=False)
+
+def generate(raw_dir: Path, rows: int, countries: int = None, extra_indicators: int = 0,
+             seed: int = 0) -> dict:
+    """Write one snapshot per indicator into raw_dir; returns {name: path}."""
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    countries, years = shape_for(rows, countries)
+    files = {name: raw_dir / f"{name}_{SNAPSHOT_DATE}.csv"
+             for name in ["population", "gdp", "co2_emissions", *extra_indicator_names(extra_indicators)]}
+
+    _write_country_file(files["population"], countries, years, rng,
+                        base=1e6, growth=0.015, integer=True)
+    _write_country_file(files["gdp"], countries, years, rng,
+                        base=1e10, growth=0.03, integer=False)
+    _write_co2_file(files["co2_emissions"], years, rng)
+    for k, name in enumerate(extra_indicator_names(extra_indicators)):
+        _write_country_file(files[name], countries, years, rng, base=100.0, growth=0.01,
+                            integer=False, layout="value" if k % 2 == 0 else "total")
+    return files
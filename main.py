@@ -1,10 +1,7 @@
-import duckdb
+from warehouse import connect as warehouse
 
-con = duckdb.connect("data/warehouse/chaos_to_clean.duckdb")
+con = warehouse.reader()
 
 # example queries
 print(con.execute("SHOW TABLES").fetchdf())
 print(con.execute("SELECT * FROM clean_data LIMIT 5").fetchdf())
-
-con.close()
-
@@ -3,93 +3,221 @@ Step 7: Data Exploration & Visualization
 ----------------------------------------
 Explores the validated DuckDB database and creates charts
 for GDP, CO₂, and Population trends.
+
+Charts are declared in a registry (CHARTS, filled by @chart). Each chart's
+query reads the rollup tables built at load time (see rollups.py) and
+falls back to aggregating clean_data when a rollup is missing. Queries run
+in this process and come back as Arrow tables (no pandas conversion);
+charts whose query result hash matches the last run (kept in
+data/reports/chart_manifest.json) are skipped, and the rest are rendered
+in parallel worker processes on the headless Agg backend.
 """
 
-import duckdb
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import pyarrow as pa
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import project_path  # noqa: F401  (makes the warehouse package importable)
+from instrumentation import attach, capture, pipeline_run, span
+from rollups import table_exists
+from warehouse import connect as warehouse
+
 # ───────────────────────────────
 # Setup
 # ───────────────────────────────
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = PROJECT_ROOT / "data" / "warehouse" / "data-cleaning.duckdb"
+DB_PATH = warehouse.DB_PATH
 REPORT_DIR = PROJECT_ROOT / "data" / "reports"
-REPORT_DIR.mkdir(parents=True, exist_ok=True)
+MANIFEST_NAME = "chart_manifest.json"
 
 # ───────────────────────────────
-# Connect to DuckDB
+# Chart registry
 # ───────────────────────────────
-con = duckdb.connect(str(DB_PATH))
-print(f" Connected to {DB_PATH}")
+CHARTS = {}
+
+def chart(filename: str, rollup: str, rollup_sql: str, base_sql: str):
+    """Register a renderer(table, out_path) for filename, fed by rollup_sql (or base_sql)."""
+    def register(render):
+        CHARTS[filename] = {"rollup": rollup, "rollup_sql": rollup_sql,
+                            "base_sql": base_sql, "render": render}
+        return render
+    return register
+
+def _rollup_or_base(con, rollup: str, rollup_sql: str, base_sql: str) -> pa.Table:
+    """Query the rollup table if it exists, otherwise the equivalent over clean_data."""
+    return con.execute(rollup_sql if table_exists(con, rollup) else base_sql).fetch_arrow_table()
 
 # ───────────────────────────────
 # 1️⃣ Top 10 GDP Countries (Latest Year)
 # ───────────────────────────────
-top_gdp = con.execute("""
+@chart("top10_gdp.png", "rollup_gdp_rank", """
+    SELECT country_name, year, gdp
+    FROM rollup_gdp_rank
+    WHERE year = (SELECT MAX(year) FROM rollup_yearly_totals)
+    AND gdp_rank <= 10
+    ORDER BY gdp_rank;
+""", """
     SELECT country_name, year, gdp
     FROM clean_data
     WHERE year = (SELECT MAX(year) FROM clean_data)
     AND gdp IS NOT NULL
     ORDER BY gdp DESC
     LIMIT 10;
-""").fetchdf()
-
-plt.figure(figsize=(10,6))
-plt.barh(top_gdp["country_name"], top_gdp["gdp"]/1e12)
-plt.gca().invert_yaxis()
-plt.xlabel("GDP (Trillions USD)")
-plt.title(f"Top 10 GDP Countries – {int(top_gdp['year'].iloc[0])}")
-plt.tight_layout()
-plt.savefig(REPORT_DIR / "top10_gdp.png")
-plt.close()
-print(" Saved: top10_gdp.png")
+""")
+def render_top10_gdp(top_gdp: pa.Table, out_path: Path):
+    plt.figure(figsize=(10,6))
+    plt.barh(top_gdp["country_name"].to_pylist(), top_gdp["gdp"].to_numpy()/1e12)
+    plt.gca().invert_yaxis()
+    plt.xlabel("GDP (Trillions USD)")
+    plt.title(f"Top 10 GDP Countries – {top_gdp['year'][0].as_py()}")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close()
 
 # ───────────────────────────────
 # 2️⃣ Global CO₂ Emissions Trend
 # ───────────────────────────────
-global_co2 = con.execute("""
+@chart("global_co2_trend.png", "rollup_yearly_totals", """
+    SELECT year, total_co2
+    FROM rollup_yearly_totals
+    WHERE total_co2 IS NOT NULL
+    ORDER BY year;
+""", """
     SELECT year, SUM(co2_emissions) AS total_co2
     FROM clean_data
     WHERE co2_emissions IS NOT NULL
     GROUP BY year
     ORDER BY year;
-""").fetchdf()
-
-plt.figure(figsize=(10,6))
-plt.plot(global_co2["year"], global_co2["total_co2"]/1e6, marker="o")
-plt.xlabel("Year")
-plt.ylabel("Total CO₂ Emissions (Million Tons)")
-plt.title("Global CO₂ Emissions Over Time")
-plt.grid(True, alpha=0.3)
-plt.tight_layout()
-plt.savefig(REPORT_DIR / "global_co2_trend.png")
-plt.close()
-print(" Saved: global_co2_trend.png")
+""")
+def render_global_co2(global_co2: pa.Table, out_path: Path):
+    plt.figure(figsize=(10,6))
+    plt.plot(global_co2["year"].to_numpy(), global_co2["total_co2"].to_numpy()/1e6, marker="o")
+    plt.xlabel("Year")
+    plt.ylabel("Total CO₂ Emissions (Million Tons)")
+    plt.title("Global CO₂ Emissions Over Time")
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close()
 
 # ───────────────────────────────
 # 3️⃣ GDP vs CO₂ Relationship (Scatter)
 # ───────────────────────────────
-scatter_df = con.execute("""
+@chart("gdp_vs_co2.png", "rollup_gdp_co2", """
+    SELECT gdp, co2_emissions
+    FROM rollup_gdp_co2
+    ORDER BY year, country_name;
+""", """
     SELECT gdp, co2_emissions
     FROM clean_data
     WHERE gdp IS NOT NULL AND co2_emissions IS NOT NULL
-    AND year >= 2000;
-""").fetchdf()
-
-plt.figure(figsize=(8,6))
-plt.scatter(scatter_df["gdp"]/1e9, scatter_df["co2_emissions"], alpha=0.4)
-plt.xlabel("GDP (Billions USD)")
-plt.ylabel("CO₂ Emissions (kt)")
-plt.title("GDP vs CO₂ Emissions (2000+)")
-plt.tight_layout()
-plt.savefig(REPORT_DIR / "gdp_vs_co2.png")
-plt.close()
-print(" Saved: gdp_vs_co2.png")
+    AND year >= 2000
+    ORDER BY year, country_name;
+""")
+def render_gdp_vs_co2(scatter: pa.Table, out_path: Path):
+    plt.figure(figsize=(8,6))
+    plt.scatter(scatter["gdp"].to_numpy()/1e9, scatter["co2_emissions"].to_numpy(), alpha=0.4)
+    plt.xlabel("GDP (Billions USD)")
+    plt.ylabel("CO₂ Emissions (kt)")
+    plt.title("GDP vs CO₂ Emissions (2000+)")
+    plt.tight_layout()
+    plt.savefig(out_path)
+    plt.close()
 
 # ───────────────────────────────
-# Wrap up
+# Skip-if-unchanged
 # ───────────────────────────────
-con.close()
-print("\n Visualization complete — charts saved to data/reports/")
+def _result_hash(table: pa.Table) -> str:
+    """Hash of a query result (values, column names and types)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([[f.name, str(f.type)] for f in table.schema]).encode())
+    for column in table.columns:
+        # Python values, not raw buffers: chunking and padding do not change the hash.
+        h.update(json.dumps(column.to_pylist(), default=str).encode())
+    return h.hexdigest()
+
+def _load_manifest(path: Path) -> dict:
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def _save_manifest(manifest: dict, path: Path):
+    tmp_path = path.with_suffix(".json.part")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _render(filename: str, table: pa.Table, out_path: Path) -> tuple:
+    with capture() as records, span("analyze.render", chart=filename, rows_in=table.num_rows):
+        CHARTS[filename]["render"](table, out_path)
+    return filename, records
+
+# ───────────────────────────────
+# Report generation
+# ───────────────────────────────
+def generate_reports(db_path: Path = DB_PATH, report_dir: Path = REPORT_DIR,
+                     workers: int = None, force: bool = False) -> list:
+    """Render every registered chart whose data changed; returns the files rendered."""
+    report_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = report_dir / MANIFEST_NAME
+    manifest = {} if force else _load_manifest(manifest_path)
+
+    # ───────────────────────────────
+    # Query DuckDB (pooled read-only cursor, this process)
+    # ───────────────────────────────
+    con = warehouse.reader(db_path)
+    print(f" Connected to {db_path}")
+    results = {}
+    for name, spec in CHARTS.items():
+        with span("analyze.query", chart=name) as s:
+            results[name] = _rollup_or_base(con, spec["rollup"], spec["rollup_sql"],
+                                            spec["base_sql"])
+            s.count(rows_out=len(results[name]))
+
+    pending = {}
+    for name, table in results.items():
+        digest = _result_hash(table)
+        if manifest.get(name) == digest and (report_dir / name).exists():
+            print(f" Unchanged: {name}")
+            continue
+        pending[name] = (table, digest)
+
+    # ───────────────────────────────
+    # Render changed charts in parallel
+    # ───────────────────────────────
+    if pending:
+        workers = workers or min(len(pending), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render, name, table, report_dir / name)
+                       for name, (table, _) in pending.items()]
+            for future in futures:
+                name, records = future.result()
+                attach(records)
+                manifest[name] = pending[name][1]
+                print(f" Saved: {name}")
+        _save_manifest(manifest, manifest_path)
+
+    # ───────────────────────────────
+    # Wrap up
+    # ───────────────────────────────
+    print(f"\n Visualization complete — {len(pending)} of {len(CHARTS)} charts "
+          f"rendered to {report_dir}/")
+    return list(pending)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render report charts from the warehouse.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Rendering processes (default: one per changed chart, up to CPU count).")
+    parser.add_argument("--force", action="store_true", help="Re-render every chart.")
+    args = parser.parse_args()
+    with pipeline_run("analyze_duckdb"):
+        generate_reports(workers=args.workers, force=args.force)
@@ -0,0 +1,170 @@
+"""
+Country canonicalization
+------------------------
+Maps the free-text country names (and ISO3 codes, where a source has
+them) of every raw file to one canonical key, so the same country joins
+across sources even when their spellings differ.
+
+The alias index has two maps:
+  names    ISO3 code → canonical display name (the first source's spelling,
+           else the first SEED_ALIASES entry)
+  aliases  normalized name → ISO3 code, from SEED_ALIASES plus every
+           (name, code) pair found in the raw files
+
+A row resolves by its code when the index knows it, otherwise by its
+normalized name; names that resolve to nothing are kept as they are and
+reported as unmatched. canonicalize() works on the distinct (name, code)
+pairs of a column and maps the results back, so its cost scales with the
+number of countries, not rows.
+
+Used by: transform_clean.py (index built and cached per raw snapshot set),
+transform_duckdb.py, transform_chunked.py
+"""
+
+import json
+import re
+import unicodedata
+
+import pandas as pd
+
+# Well-known spellings that differ between sources (World Bank, UN, Our
+# World in Data, datahub). The first alias is the fallback display name.
+SEED_ALIASES = {
+    "WLD": ["World"],
+    "USA": ["United States", "United States of America", "USA", "U.S.", "US"],
+    "GBR": ["United Kingdom", "UK", "Great Britain", "Britain"],
+    "RUS": ["Russian Federation", "Russia"],
+    "KOR": ["Korea, Rep.", "South Korea", "Republic of Korea", "Korea (Republic of)"],
+    "PRK": ["Korea, Dem. People's Rep.", "North Korea",
+            "Democratic People's Republic of Korea"],
+    "IRN": ["Iran, Islamic Rep.", "Iran", "Islamic Republic of Iran"],
+    "EGY": ["Egypt, Arab Rep.", "Egypt"],
+    "VEN": ["Venezuela, RB", "Venezuela"],
+    "SYR": ["Syrian Arab Republic", "Syria"],
+    "LAO": ["Lao PDR", "Laos", "Lao People's Democratic Republic"],
+    "VNM": ["Viet Nam", "Vietnam"],
+    "CZE": ["Czechia", "Czech Republic"],
+    "TUR": ["Turkiye", "Türkiye", "Turkey"],
+    "COD": ["Congo, Dem. Rep.", "Democratic Republic of the Congo", "DR Congo"],
+    "COG": ["Congo, Rep.", "Republic of the Congo"],
+    "CIV": ["Cote d'Ivoire", "Côte d'Ivoire", "Ivory Coast"],
+    "GMB": ["Gambia, The", "The Gambia", "Gambia"],
+    "BHS": ["Bahamas, The", "The Bahamas", "Bahamas"],
+    "YEM": ["Yemen, Rep.", "Yemen"],
+    "KGZ": ["Kyrgyz Republic", "Kyrgyzstan"],
+    "SVK": ["Slovak Republic", "Slovakia"],
+    "MKD": ["North Macedonia", "Macedonia", "Macedonia, FYR"],
+    "BOL": ["Bolivia", "Plurinational State of Bolivia"],
+    "TZA": ["Tanzania", "United Republic of Tanzania"],
+    "HKG": ["Hong Kong SAR, China", "Hong Kong"],
+    "MAC": ["Macao SAR, China", "Macao", "Macau"],
+    "CHN": ["China", "People's Republic of China"],
+    "MMR": ["Myanmar", "Burma"],
+    "SWZ": ["Eswatini", "Swaziland"],
+    "CPV": ["Cabo Verde", "Cape Verde"],
+    "TLS": ["Timor-Leste", "East Timor"],
+    "FSM": ["Micronesia, Fed. Sts.", "Micronesia"],
+    "KNA": ["St. Kitts and Nevis", "Saint Kitts and Nevis"],
+    "LCA": ["St. Lucia", "Saint Lucia"],
+    "VCT": ["St. Vincent and the Grenadines", "Saint Vincent and the Grenadines"],
+    "PSE": ["West Bank and Gaza", "Palestine", "State of Palestine"],
+}
+
+def normalize_name(name: str) -> str:
+    """Case-, accent-, punctuation- and whitespace-insensitive form of a name."""
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    name = name.casefold().replace("&", " and ")
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(name.split())
+
+def _clean_code(code):
+    if code is None or (isinstance(code, float) and code != code):
+        return None
+    code = str(code).strip().upper()
+    return code or None
+
+# ───────────────────────────────
+# Alias index
+# ───────────────────────────────
+class CountryIndex:
+    """ISO3 code → canonical name, and normalized alias → ISO3 code."""
+
+    def __init__(self, names: dict = None, aliases: dict = None):
+        self.names = dict(names or {})
+        self.aliases = dict(aliases or {})
+
+    @classmethod
+    def build(cls, pairs: list) -> "CountryIndex":
+        """Index from SEED_ALIASES plus (name, code) pairs, earliest pair first."""
+        index = cls()
+        for name, code in pairs:
+            code = _clean_code(code)
+            if code is None or name is None:
+                continue
+            index.names.setdefault(code, str(name).strip())
+            index.aliases.setdefault(normalize_name(name), code)
+        for code, aliases in SEED_ALIASES.items():
+            index.names.setdefault(code, aliases[0])
+            for alias in aliases:
+                index.aliases.setdefault(normalize_name(alias), code)
+        return index
+
+    def resolve(self, name, code=None):
+        """ISO3 code for a (name, code) pair, or None if unmatched."""
+        code = _clean_code(code)
+        if code in self.names:
+            return code
+        return self.aliases.get(normalize_name(name))
+
+    def canonical_name(self, name, code=None) -> str:
+        """Canonical display name; unmatched names come back stripped, unchanged."""
+        resolved = self.resolve(name, code)
+        return self.names[resolved] if resolved else str(name).strip()
+
+    def canonicalize(self, names: pd.Series, codes: pd.Series = None) -> pd.Series:
+        """Vectorized canonical_name over a column (one lookup per distinct pair)."""
+        name_labels, name_uniques = pd.factorize(names)
+        if codes is None:
+            labels = name_labels
+            mapped = [self.canonical_name(n) for n in name_uniques]
+        else:
+            # Factorize (name, code) pairs through their integer labels.
+            code_labels, code_uniques = pd.factorize(codes.fillna(""))
+            pair_labels, pairs = pd.factorize(name_labels.astype("int64") * len(code_uniques)
+                                              + code_labels)
+            labels = pair_labels
+            mapped = [self.canonical_name(name_uniques[k // len(code_uniques)],
+                                          code_uniques[k % len(code_uniques)])
+                      for k in pairs]
+        out = pd.Series(pd.Index(mapped, dtype=object).take(labels), index=names.index)
+        return out.where(name_labels >= 0, names)
+
+    def to_json(self) -> dict:
+        return {"names": self.names, "aliases": self.aliases}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CountryIndex":
+        return cls(data["names"], data["aliases"])
+
+def unmatched(index: CountryIndex, pairs: pd.DataFrame) -> pd.DataFrame:
+    """Rows of pairs (country_name, country_code, rows) that the index cannot resolve."""
+    if pairs.empty:
+        return pairs
+    codes = pairs["country_code"] if "country_code" in pairs else [None] * len(pairs)
+    hit = [index.resolve(n, c) is not None for n, c in zip(pairs["country_name"], codes)]
+    return pairs[~pd.Series(hit, index=pairs.index)]
+
+def save_index(index: CountryIndex, key: str, unmatched_rows: list, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"key": key, "index": index.to_json(), "unmatched": unmatched_rows}, f)
+
+def load_index(key: str, path):
+    """(index, unmatched rows) cached for key, or None."""
+    if not path.exists():
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("key") != key:
+        return None
+    return CountryIndex.from_json(data["index"]), data["unmatched"]
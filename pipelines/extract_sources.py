@@ -1,28 +1,58 @@
 """
 Extract public datasets (CSV files) and store them in data/raw/.
 Works with verified open data URLs (no API keys needed).
+
+Downloads run concurrently over one pooled HTTP session, stream to disk
+in chunks, and are conditional: the ETag / Last-Modified of each source is
+kept in data/raw/manifest.json so unchanged sources are skipped (HTTP 304).
+Payloads are compressed and deduplicated into the raw snapshot store
+(see raw_store.py): a dated snapshot identical to an earlier one costs a
+symlink, not another copy.
 """
 
 import os
+import json
+import time
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+
+import raw_store
+from instrumentation import pipeline_run, span
 
 # -----------------------------
 # Setup directories and logging
 # -----------------------------
-RAW_DIR = Path("data/raw")
-LOG_DIR = Path("logs")
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+RAW_DIR = raw_store.RAW_DIR
+LOG_DIR = PROJECT_ROOT / "logs"
+MANIFEST_NAME = "manifest.json"
+
+logger = logging.getLogger("extract_sources")
 
-RAW_DIR.mkdir(parents=True, exist_ok=True)
-LOG_DIR.mkdir(parents=True, exist_ok=True)
+def _setup_logging():
+    """Attach the extraction.log handler once (on first use, not at import)."""
+    if logger.handlers:
+        return
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    handler = logging.FileHandler(LOG_DIR / "extraction.log")
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
 
-logging.basicConfig(
-    filename=LOG_DIR / "extraction.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# -----------------------------
+# Download tuning
+# -----------------------------
+MAX_WORKERS = 4
+CHUNK_SIZE = 1 << 16          # 64 KB per streamed chunk
+TIMEOUT = 60                  # seconds (connect + read)
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1.0         # 1s, 2s, 4s, ...
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 # -----------------------------
 # Verified working data sources
@@ -33,42 +63,147 @@ DATASETS = {
     "co2_emissions": "https://datahub.io/core/co2-fossil-global/r/global.csv"
 }
 
+# -----------------------------
+# Manifest (ETag / Last-Modified per source)
+# -----------------------------
+def load_manifest(path: Path) -> dict:
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest: dict, path: Path):
+    tmp_path = path.with_suffix(".json.part")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _conditional_headers(entry: dict, url: str) -> dict:
+    """Validators from the last successful download of the same URL, if its file still exists."""
+    if not entry or entry.get("url") != url or not Path(entry.get("path", "")).exists():
+        return {}
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """One session shared by all workers so connections are pooled and reused."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class _RetryableStatus(Exception):
+    pass
+
+# Transient failures worth another attempt, including a connection dropped
+# mid-stream (requests wraps urllib3's ProtocolError / IncompleteRead in
+# ChunkedEncodingError; the bare ProtocolError is kept in case it escapes).
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError, ProtocolError, _RetryableStatus)
+
 # -----------------------------
 # Helper: download a single CSV
 # -----------------------------
-def download_csv(name, url):
-    """Download a CSV file and save it to data/raw/."""
-    try:
-        response = requests.get(url, timeout=60)
-        response.raise_for_status()
+def download_csv(name, url, session=None, manifest=None, raw_dir=RAW_DIR,
+                 retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """Stream a CSV into the raw store as snapshot raw_dir/<name>_<YYYYMMDD>.csv[.zst|.gz].
 
-        filename = f"{name}_{datetime.now().strftime('%Y%m%d')}.csv"
-        dest_path = RAW_DIR / filename
+    Returns the snapshot path (the previous one if the source answered
+    304 Not Modified) or None on failure. Updates manifest[name] in place.
+    """
+    _setup_logging()
+    session = session or make_session(1)
+    manifest = manifest if manifest is not None else {}
+    entry = manifest.get(name, {})
+    headers = _conditional_headers(entry, url)
 
-        with open(dest_path, "wb") as f:
-            f.write(response.content)
+    with span("extract.download", dataset=name) as s:
+        for attempt in range(retries + 1):
+            s.count(attempts=1)
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                    if response.status_code == 304:
+                        s.count(not_modified=True)
+                        logger.info(f"Not modified: {name} (keeping {entry['path']})")
+                        print(f" Unchanged: {name}")
+                        return Path(entry["path"])
+                    if response.status_code in RETRY_STATUSES:
+                        raise _RetryableStatus(f"HTTP {response.status_code}")
+                    response.raise_for_status()
 
-        logging.info(f"s Saved {name} to {dest_path} ({len(response.content)/1024:.1f} KB)")
-        print(f" Downloaded: {name}")
-        return dest_path
+                    filename = f"{name}_{datetime.now().strftime('%Y%m%d')}.csv"
+                    # store() deletes its .part file if the stream breaks, so a retry starts clean.
+                    stored = raw_store.store(response.iter_content(chunk_size=CHUNK_SIZE),
+                                             raw_dir, filename)
+                    dest_path, size = stored["path"], stored["bytes"]
+                    s.count(bytes_read=size, bytes_written=stored["stored_bytes"])
 
-    except Exception as e:
-        logging.error(f"❌ Failed to download {name}: {e}")
-        print(f"❌ Failed to download {name}: {e}")
-        return None
+                manifest[name] = {
+                    "url": url,
+                    "path": str(dest_path),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "bytes": size,
+                    "sha256": stored["sha256"],
+                    "downloaded_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                if stored["new"]:
+                    logger.info(f"s Saved {name} to {dest_path} ({size/1024:.1f} KB, "
+                                f"{stored['stored_bytes']/1024:.1f} KB compressed)")
+                    print(f" Downloaded: {name}")
+                else:
+                    logger.info(f"Saved {name} to {dest_path} (same content as an earlier snapshot)")
+                    print(f" Downloaded: {name} (unchanged content, stored once)")
+                return dest_path
+
+            except RETRYABLE_ERRORS as e:
+                if attempt == retries:
+                    logger.error(f"❌ Failed to download {name} after {retries + 1} attempts: {e}")
+                    print(f"❌ Failed to download {name}: {e}")
+                    return None
+                delay = backoff * 2 ** attempt
+                logger.warning(f"Retrying {name} in {delay:.1f}s ({e})")
+                time.sleep(delay)
+
+            except Exception as e:
+                logger.error(f"❌ Failed to download {name}: {e}")
+                print(f"❌ Failed to download {name}: {e}")
+                return None
 
 # -----------------------------
 # Main extraction routine
 # -----------------------------
-def extract_all():
-    """Download all datasets defined in DATASETS."""
+def extract_all(datasets=DATASETS, raw_dir=RAW_DIR, max_workers=MAX_WORKERS):
+    """Download all datasets concurrently; returns {name: snapshot path or None}."""
+    _setup_logging()
     print("Starting data extraction...\n")
-    for name, url in DATASETS.items():
-        download_csv(name, url)
-    print("\nAll downloads completed! Check data/raw/")
+    raw_dir = Path(raw_dir)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = raw_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+
+    session = make_session(max_workers)
+    with span("extract", datasets=len(datasets)) as s, session, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            name: pool.submit(download_csv, name, url, session, manifest, raw_dir)
+            for name, url in datasets.items()
+        }
+        results = {name: future.result() for name, future in futures.items()}
+        s.count(failed=sum(path is None for path in results.values()))
+
+    save_manifest(manifest, manifest_path)
+    print(f"\nAll downloads completed! Check {raw_dir}/")
+    return results
 
 # -----------------------------
 # Entry point
 # -----------------------------
 if __name__ == "__main__":
-    extract_all()
+    with pipeline_run("extract_sources"):
+        extract_all()
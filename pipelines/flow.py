@@ -3,50 +3,165 @@ Step 6: Automate the Data-Cleaning Pipeline with Prefect
 --------------------------------------------------------
 Runs all pipeline steps (end to end):
   Extract → Transform/Clean → Load → Validate
+
+Stages run in-process by default: each task calls the stage module's
+function directly and the merged data is handed from transform to load as
+an Arrow table in memory. in_process=False (or --subprocess) runs each
+stage as a separate Python process instead, for isolation.
+
+incremental=True (or --incremental) re-transforms only the countries whose
+raw rows changed since the last run and loads just that slice (see
+transform_incremental.py); it falls back to a full run when it cannot.
+
+Transform, Load and Validate are skipped when the content hash of their
+inputs and code matches the last successful run (see stage_cache.py).
+Pass force=True (or --force) to run every stage regardless.
+
+Each run appends a JSON record of per-stage and per-step timings, memory
+high-water marks and row/byte counts to logs/metrics.jsonl
+(see instrumentation.py).
 """
 
+import argparse
 from prefect import flow, task
 import subprocess
+import sys
 from pathlib import Path
 
+import extract_sources
+import load_to_duckdb as loader
+import transform_clean as transformer
+import validate_data
+from instrumentation import pipeline_run, span
+from stage_cache import StageCache, stage_key
+from transform_clean import latest_raw_files
+from transform_incremental import changes_scope, with_scope
+
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PIPELINES_DIR = PROJECT_ROOT / "pipelines"
+PROCESSED_PATH = PROJECT_ROOT / "data" / "processed" / "clean_data.parquet"
+DB_PATH = loader.DB_PATH
+
+# ───────────────────────────────
+# Stage cache helper
+# ───────────────────────────────
+def _run_cached(stage, key, run, outputs=(), force=False):
+    """Run a stage unless its key matches the last successful run.
+
+    Returns run()'s result, or None when the stage was skipped.
+    """
+    cache = StageCache()
+    with span(f"stage.{stage}") as s:
+        if not force and cache.is_fresh(stage, key, outputs):
+            print(f" Cache hit: {stage} ({key[:12]}) — skipped")
+            s.count(cache="hit")
+            return None
+        print(f" Cache miss: {stage} ({key[:12]}) — running")
+        s.count(cache="miss")
+        cache.invalidate(stage)
+        result = run()
+        cache.record(stage, key, outputs)
+        return result
+
+def _run_script(name, *args):
+    subprocess.run([sys.executable, str(PIPELINES_DIR / name), *args], check=True)
 
 # ───────────────────────────────
 # Tasks – each stage is a task
 # ───────────────────────────────
 @task(name="Extract Data")
-def extract():
+def extract(in_process=True):
     print(" Running Step 1: Extract")
-    subprocess.run(["python", str(PROJECT_ROOT / "pipelines" / "extract_sources.py")], check=True)
+    if in_process:
+        extract_sources.extract_all()
+    else:
+        _run_script("extract_sources.py")
 
 @task(name="Transform & Clean Data")
-def transform_clean():
+def transform_clean(force=False, in_process=True, incremental=False):
+    """Returns the merged data as an Arrow table (None if skipped or run out of process).
+
+    For an incremental run that is only the changed slice, its scope in the schema metadata.
+    """
     print(" Running Step 2: Transform + Clean")
-    subprocess.run(["python", str(PROJECT_ROOT / "pipelines" / "transform_clean.py")], check=True)
+    key = stage_key(
+        "transform",
+        inputs=latest_raw_files().values(),
+        code=transformer.transform_code(),
+    )
+
+    def run():
+        if not in_process:
+            _run_script("transform_clean.py", *(["--incremental"] if incremental else []))
+            return None
+        df = transformer.run(incremental=incremental)
+        if df is None:
+            return None
+        table = transformer.to_arrow(df)
+        return with_scope(table, df.attrs["scope"]) if "scope" in df.attrs else table
+
+    return _run_cached("transform", key, run, outputs=[PROCESSED_PATH], force=force)
 
 @task(name="Load to DuckDB")
-def load_to_duckdb():
+def load_to_duckdb(data=None, force=False, in_process=True, incremental=False):
     print(" Running Step 3: Load")
-    subprocess.run(["python", str(PROJECT_ROOT / "pipelines" / "load_to_duckdb.py")], check=True)
+    # Keyed on the processed output itself, so a re-run transform that
+    # produced identical data does not trigger a reload.
+    key = stage_key("load", inputs=[PROCESSED_PATH], code=loader.LOAD_CODE)
+
+    def run():
+        if not in_process:
+            _run_script("load_to_duckdb.py", *(["--changes"] if incremental else []))
+            return
+        # In-memory hand-off when transform just ran; otherwise read the Parquet file.
+        scope = None if data is None else changes_scope(data)
+        if scope is not None:
+            loader.load_to_duckdb(PROCESSED_PATH, DB_PATH, mode="incremental", data=data, scope=scope)
+        else:
+            loader.load_to_duckdb(PROCESSED_PATH, DB_PATH, data=data)
+
+    # DB_PATH links to the published version and the cache compares its target,
+    # so after a --rollback the next run reloads instead of hitting the cache.
+    _run_cached("load", key, run, outputs=[DB_PATH], force=force)
+    return key
 
 @task(name="Validate Data")
-def validate():
+def validate(load_key, force=False, in_process=True):
     print(" Running Step 4: Validate")
-    subprocess.run(["python", str(PROJECT_ROOT / "pipelines" / "validate_data.py")], check=True)
+    key = stage_key("validate", code=[PIPELINES_DIR / "validate_data.py"], upstream=[load_key])
+
+    def run():
+        if not in_process:
+            _run_script("validate_data.py")
+        else:
+            validate_data.main(DB_PATH)
+
+    _run_cached("validate", key, run, force=force)
+    return key
 
 # ───────────────────────────────
 # Flow definition (ETL + Validate)
 # ───────────────────────────────
-@flow(name="Data-Cleaning Pipeline")
-def data_cleaning_pipeline():
-    extract()
-    transform_clean()
-    load_to_duckdb()
-    validate()
+@flow(name="Data-Cleaning Pipeline", log_prints=True)
+def data_cleaning_pipeline(force: bool = False, in_process: bool = True, incremental: bool = False):
+    with pipeline_run("data_cleaning_pipeline", force=force, in_process=in_process,
+                      incremental=incremental):
+        extract(in_process=in_process)
+        clean = transform_clean(force=force, in_process=in_process, incremental=incremental)
+        load_key = load_to_duckdb(clean, force=force, in_process=in_process, incremental=incremental)
+        validate(load_key, force=force, in_process=in_process)
     print(" Pipeline complete — all steps succeeded!")
 
 # ───────────────────────────────
 # Run locally
 # ───────────────────────────────
 if __name__ == "__main__":
-    data_cleaning_pipeline()
+    parser = argparse.ArgumentParser(description="Run the data-cleaning pipeline.")
+    parser.add_argument("--force", action="store_true", help="Ignore the stage cache.")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="Run each stage in its own Python process.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-transform and load only the countries whose raw data changed.")
+    args = parser.parse_args()
+    data_cleaning_pipeline(force=args.force, in_process=not args.subprocess,
+                           incremental=args.incremental)
@@ -0,0 +1,77 @@
+"""
+Gap filling
+-----------
+Fills missing indicator values per country on the merged frame, which is
+sorted by (country_name, year). Every country is a contiguous segment of
+the NumPy arrays, so all countries are filled at once: one searchsorted
+of the missing rows into the observed rows gives each gap its previous
+and next observation, which it only uses when they lie inside its own
+segment. Work beyond that one lookup is proportional to the gaps.
+
+Strategies (per indicator, see transform_clean.register_indicator):
+
+  ffill        carry the last observed value forward, at most max_gap
+               years past it
+  interpolate  linear in year between the surrounding observed values,
+               only across gaps of at most max_gap missing years (never
+               before the first or after the last observation)
+  none         leave missing values missing
+
+Next to each indicator, <name>_imputed is True where the value was filled
+rather than observed.
+"""
+
+import numpy as np
+
+STRATEGIES = ("ffill", "interpolate", "none")
+IMPUTED_SUFFIX = "_imputed"
+
+def imputed_column(name: str) -> str:
+    return f"{name}{IMPUTED_SUFFIX}"
+
+def segment_bounds(codes: np.ndarray) -> tuple:
+    """(first row, last row) of each row's segment of equal, contiguous codes."""
+    n = len(codes)
+    rows = np.arange(n)
+    changes = codes[1:] != codes[:-1]
+    first = np.maximum.accumulate(np.where(np.r_[True, changes], rows, 0))
+    last = np.minimum.accumulate(np.where(np.r_[changes, True], rows, n)[::-1])[::-1]
+    return first, last
+
+def fill_gaps(values: np.ndarray, years: np.ndarray, first: np.ndarray, last: np.ndarray,
+              strategy: str = "ffill", max_gap: int = None) -> tuple:
+    """(filled values, imputed mask) for float values with NaN gaps.
+
+    first/last come from segment_bounds(); years are sorted within each segment.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown gap-fill strategy: {strategy}")
+    missing = np.isnan(values)
+    imputed = np.zeros(len(values), dtype=bool)
+    if strategy == "none" or not missing.any():
+        return values, imputed
+    holes, observed = np.flatnonzero(missing), np.flatnonzero(~missing)
+    # Observed rows before and after each hole (only the holes are touched from here on).
+    after = np.searchsorted(observed, holes)
+    prev = observed[np.maximum(after - 1, 0)] if len(observed) else holes
+    fill = (after > 0) & (prev >= first[holes])
+    year = years[holes].astype(np.float64)
+    prev_year = years[prev].astype(np.float64)
+    if strategy == "ffill":
+        if max_gap is not None:
+            fill &= year - prev_year <= max_gap
+        line = values[prev]
+    else:
+        nxt = observed[np.minimum(after, len(observed) - 1)] if len(observed) else holes
+        fill &= (after < len(observed)) & (nxt <= last[holes])
+        next_year = years[nxt].astype(np.float64)
+        if max_gap is not None:
+            fill &= next_year - prev_year - 1 <= max_gap
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Same operation order as the DuckDB engine's SQL, so both agree bit for bit.
+            line = values[prev] + (values[nxt] - values[prev]) * (year - prev_year) \
+                / (next_year - prev_year)
+    values = values.copy()
+    values[holes[fill]] = line[fill]
+    imputed[holes[fill]] = True
+    return values, imputed
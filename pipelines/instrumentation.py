@@ -0,0 +1,168 @@
+"""
+Pipeline instrumentation
+------------------------
+Timing spans, memory high-water marks and row/byte counters for every
+stage and sub-step, exported as one JSON run record per pipeline run
+(appended to logs/metrics.jsonl).
+
+    with pipeline_run("transform_clean"):          # one record per run
+        with span("transform.load_and_clean", source="gdp") as s:
+            df = ...
+            s.count(rows_out=len(df), bytes_read=path.stat().st_size)
+
+Spans nest per thread (each record names its parent). Spans finished
+outside a pipeline_run are dropped, so library calls stay silent unless an
+entry point (a stage's __main__ or the Prefect flow) opens a run. Worker
+processes wrap their work in capture() and hand the records back to the
+parent, which attach()es them to its run.
+
+Used by: every module under pipelines/
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, memory is not recorded
+    resource = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+METRICS_PATH = PROJECT_ROOT / "logs" / "metrics.jsonl"
+
+_lock = threading.Lock()
+_collectors = []              # innermost last; finished spans go to _collectors[-1]
+_local = threading.local()    # per-thread stack of open span names
+
+def _peak_rss_mb(who=None) -> float:
+    """High-water RSS of this process (or its children) in MB; ru_maxrss is KB on Linux."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    return round(usage.ru_maxrss / 1024, 1)
+
+def _stack() -> list:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+# ───────────────────────────────
+# Spans
+# ───────────────────────────────
+class Span:
+    def __init__(self, name: str, counters: dict):
+        self.name = name
+        self.counters = dict(counters)
+        self.record = None
+
+    def count(self, **counters):
+        """Add to (numbers) or set (anything else) counters on this span."""
+        for key, value in counters.items():
+            if isinstance(value, (int, float)) and isinstance(self.counters.get(key), (int, float)):
+                self.counters[key] += value
+            else:
+                self.counters[key] = value
+
+def _emit(record: dict):
+    with _lock:
+        if _collectors:
+            _collectors[-1].append(record)
+
+@contextmanager
+def span(name: str, **counters):
+    """Time a block; yields a Span whose counters end up in the run record."""
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    s = Span(name, counters)
+    started_at = datetime.now().isoformat(timespec="milliseconds")
+    rss_before = _peak_rss_mb()
+    t0 = time.perf_counter()
+    stack.append(name)
+    status = "ok"
+    try:
+        yield s
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        stack.pop()
+        rss_after = _peak_rss_mb()
+        s.record = {
+            "name": name,
+            "parent": parent,
+            "started_at": started_at,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3),
+            "peak_rss_mb": rss_after,
+            "peak_rss_growth_mb": None if rss_after is None else round(rss_after - rss_before, 1),
+            "pid": os.getpid(),
+            "status": status,
+            **s.counters,
+        }
+        _emit(s.record)
+
+# ───────────────────────────────
+# Collecting records
+# ───────────────────────────────
+@contextmanager
+def capture():
+    """Collect the records of spans finished inside the block (e.g. in a worker process)."""
+    records = []
+    with _lock:
+        _collectors.append(records)
+    try:
+        yield records
+    finally:
+        with _lock:
+            _collectors.remove(records)
+
+def attach(records: list):
+    """Add records captured elsewhere to the current run, under the current span."""
+    stack = _stack()
+    for record in records:
+        if record["parent"] is None and stack:
+            record = {**record, "parent": stack[-1]}
+        _emit(record)
+
+@contextmanager
+def pipeline_run(name: str, path: Path = METRICS_PATH, **attrs):
+    """Collect every span of the block and append one JSON run record to path.
+
+    Nested inside another run it is just a span of that run.
+    """
+    with _lock:
+        nested = bool(_collectors)
+    if nested:
+        with span(name, **attrs) as s:
+            yield s
+        return
+
+    started_at = datetime.now().isoformat(timespec="seconds")
+    t0 = time.perf_counter()
+    status = "ok"
+    with capture() as records:
+        try:
+            with span(name, **attrs) as s:
+                yield s
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            run = {
+                "run_id": uuid.uuid4().hex[:12],
+                "name": name,
+                "started_at": started_at,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3),
+                "status": status,
+                "peak_rss_mb": _peak_rss_mb(),
+                "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+                "spans": records,
+            }
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a") as f:
+                f.write(json.dumps(run, default=str) + "\n")
@@ -1,47 +1,432 @@
 """
 Step 4: Load Cleaned Data into DuckDB (final version)
 -----------------------------------------------------
-Creates data/warehouse/data-cleaning.duckdb from processed CSV.
+Creates data/warehouse/data-cleaning.duckdb from the processed Parquet
+output (a single file or a year-partitioned dataset). CSV input is still
+accepted for ad-hoc loads, and an in-memory DataFrame / Arrow table can be
+passed directly (as the Prefect flow does) to skip the file round-trip.
+
+Two load modes are supported:
+  replace      – drop and rebuild the table from the whole file (default)
+  incremental  – upsert only new or changed rows keyed on (country_name, year)
+
+--changes loads clean_data_changes.parquet, the slice written by
+`transform_clean.py --incremental`, incrementally: the countries it covers
+are replaced (upserted, and rows it no longer has deleted), the rest of
+the table is left as is.
+
+Loading clean_data also refreshes the rollup tables (see rollups.py) in
+the same transaction — in full on replace, only for the changed years /
+countries on an incremental load.
+
+clean_data can be stored as a regular table (default) or, with
+--layout partitioned, as year-partitioned Parquet files behind a view
+(see warehouse/partitions.py): queries filtering on year read only the
+matching files, and an incremental load rewrites only the years it
+touches. The layout is chosen on a full load and kept by later loads.
+
+Loads are blue/green: they run on a copy of the current warehouse,
+clean_data is validated there (validate_data.DEFAULT_RULES) and the copy
+is then swapped in atomically, so a long load never blocks or breaks the
+dashboard. Before the swap, the dashboard's serving snapshot of the new
+version is written next to it (see warehouse/serving.py). --list-versions
+shows the kept versions, --rollback restores an older one.
 """
 
-import duckdb
+import argparse
+from datetime import datetime
 from pathlib import Path
 
+import project_path  # noqa: F401  (makes the warehouse package importable)
+import rollups
+import validate_data
+from instrumentation import pipeline_run, span
+from warehouse import connect as warehouse
+from warehouse import partitions, serving, versions
+
 # ───────────────────────────────
 # Robust project-root path logic
 # ───────────────────────────────
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DATA_PATH = PROJECT_ROOT / "data" / "processed" / "clean_data.csv"
-DB_PATH = PROJECT_ROOT / "data" / "warehouse" / "data-cleaning.duckdb"
+DATA_PATH = PROJECT_ROOT / "data" / "processed" / "clean_data.parquet"
+CHANGES_PATH = PROJECT_ROOT / "data" / "processed" / "clean_data_changes.parquet"
+DB_PATH = warehouse.DB_PATH
+
+# Every module whose code shapes the published warehouse: the flow's stage
+# cache key hashes them, so a new helper module of the load goes here.
+LOAD_CODE = [
+    PROJECT_ROOT / "pipelines" / "load_to_duckdb.py",
+    PROJECT_ROOT / "pipelines" / "rollups.py",
+    PROJECT_ROOT / "pipelines" / "validate_data.py",
+    PROJECT_ROOT / "warehouse" / "config.py",
+    PROJECT_ROOT / "warehouse" / "connect.py",
+    PROJECT_ROOT / "warehouse" / "partitions.py",
+    PROJECT_ROOT / "warehouse" / "versions.py",
+    PROJECT_ROOT / "warehouse" / "serving.py",
+]
+
+KEY_COLUMNS = ["country_name", "year"]
+METADATA_TABLE = "load_metadata"
+CHANGED_KEYS_TABLE = "_changed_keys"
+
+# ───────────────────────────────
+# Load metadata / watermark
+# ───────────────────────────────
+def _ensure_metadata_table(con):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+            loaded_at    TIMESTAMP,
+            table_name   VARCHAR,
+            source       VARCHAR,
+            source_mtime TIMESTAMP,
+            mode         VARCHAR,
+            inserted     BIGINT,
+            updated      BIGINT,
+            unchanged    BIGINT,
+            max_year     BIGINT
+        );
+    """)
+
+def _record_load(con, table_name, data_path, mode, stats):
+    max_year = con.execute(f"SELECT MAX(year) FROM {table_name};").fetchone()[0]
+    if data_path is None:
+        source, source_mtime = "<in-memory>", datetime.now()
+    else:
+        source, source_mtime = str(data_path), datetime.fromtimestamp(data_path.stat().st_mtime)
+    con.execute(
+        f"INSERT INTO {METADATA_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);",
+        [
+            datetime.now(),
+            table_name,
+            source,
+            source_mtime,
+            mode,
+            stats["inserted"],
+            stats["updated"],
+            stats["unchanged"],
+            max_year,
+        ],
+    )
+
+def last_load(con, table_name="clean_data"):
+    """Return the most recent load_metadata row for a table (or None)."""
+    _ensure_metadata_table(con)
+    return con.execute(f"""
+        SELECT * FROM {METADATA_TABLE}
+        WHERE table_name = ?
+        ORDER BY loaded_at DESC
+        LIMIT 1;
+    """, [table_name]).fetchone()
+
+# ───────────────────────────────
+# Source readers
+# ───────────────────────────────
+IN_MEMORY_VIEW = "_incoming_data"
+
+def _source_sql(data_path) -> str:
+    """SELECT over the processed data, keys first whatever the layout.
+
+    data_path=None reads the DataFrame / Arrow table registered as IN_MEMORY_VIEW.
+    """
+    if data_path is None:
+        reader = IN_MEMORY_VIEW
+    elif data_path.is_dir():
+        # Hive-partitioned dataset written by transform_clean --partition-by-year
+        reader = (f"read_parquet('{data_path}/**/*.parquet', hive_partitioning = true, "
+                  "hive_types = {'year': INTEGER})")
+    elif data_path.suffix == ".parquet":
+        reader = f"read_parquet('{data_path}')"
+    else:
+        reader = f"read_csv_auto('{data_path}')"
+    keys = ", ".join(KEY_COLUMNS)
+    return f"SELECT {keys}, * EXCLUDE ({keys}) FROM {reader}"
+
+# ───────────────────────────────
+# Load modes
+# ───────────────────────────────
+def _table_exists(con, table_name):
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?;",
+        [table_name],
+    ).fetchone()[0] > 0
+
+def _replace(con, data_path, table_name, layout=None):
+    layout = layout or partitions.layout(con, table_name) or "table"
+    with span("load.ctas", layout=layout) as s:
+        if layout == "partitioned":
+            s.count(files=partitions.write_partitions(con, table_name, _source_sql(data_path)))
+        else:
+            partitions.drop(con, table_name)
+            con.execute(f"CREATE TABLE {table_name} AS {_source_sql(data_path)};")
+        count = con.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
+        s.count(rows_out=count)
+    return {"inserted": count, "updated": 0, "unchanged": 0}
+
+def _add_new_columns(con, table_name):
+    """Add columns of _incoming that table_name lacks (NULL in existing rows, so they update)."""
+    existing = {r[0] for r in con.execute(f"DESCRIBE {table_name};").fetchall()}
+    new = [(name, dtype) for name, dtype, *_ in con.execute("DESCRIBE _incoming;").fetchall()
+           if name not in existing]
+    if not new:
+        return
+    if partitions.layout(con, table_name) == "partitioned":
+        raise RuntimeError(f" {table_name} lacks columns {[n for n, _ in new]}; "
+                           "run a full (non-incremental) load first")
+    for name, dtype in new:
+        con.execute(f"ALTER TABLE {table_name} ADD COLUMN {name} {dtype};")
+
+def _upsert(con, data_path, table_name, scope=None):
+    """Merge new/changed rows from data_path into table_name, keyed on KEY_COLUMNS.
+
+    scope ({column: values}) marks the incoming data as complete for those
+    values: rows of table_name within scope that are missing from it are deleted.
+    """
+    with span("load.stage_incoming") as s:
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _incoming AS {_source_sql(data_path)};")
+        s.count(rows_in=con.execute("SELECT COUNT(*) FROM _incoming;").fetchone()[0])
+    if not _table_exists(con, table_name):
+        con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM _incoming WHERE false;")
+    _add_new_columns(con, table_name)
+
+    columns = [r[0] for r in con.execute("DESCRIBE _incoming;").fetchall()]
+    value_cols = [c for c in columns if c not in KEY_COLUMNS]
+    on_keys = " AND ".join(f"t.{k} = s.{k}" for k in KEY_COLUMNS)
+    changed = " OR ".join(f"t.{c} IS DISTINCT FROM s.{c}" for c in value_cols) or "false"
+
+    inserted, updated, unchanged = con.execute(f"""
+        SELECT
+            COUNT(*) FILTER (WHERE t.{KEY_COLUMNS[0]} IS NULL),
+            COUNT(*) FILTER (WHERE t.{KEY_COLUMNS[0]} IS NOT NULL AND ({changed})),
+            COUNT(*) FILTER (WHERE t.{KEY_COLUMNS[0]} IS NOT NULL AND NOT ({changed}))
+        FROM _incoming s
+        LEFT JOIN {table_name} t ON {on_keys};
+    """).fetchone()
+
+    # Keys of new or changed rows, used to refresh only the affected rollups.
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE {CHANGED_KEYS_TABLE} AS
+        SELECT {", ".join(f"s.{k}" for k in KEY_COLUMNS)}
+        FROM _incoming s
+        LEFT JOIN {table_name} t ON {on_keys}
+        WHERE t.{KEY_COLUMNS[0]} IS NULL OR ({changed});
+    """)
+
+    deleted = 0
+    scope = {col: list(values) for col, values in (scope or {}).items() if len(values)}
+    if scope:
+        in_scope = " AND ".join(f"t.{col} IN ({', '.join('?' * len(values))})"
+                                for col, values in scope.items())
+        params = [v for values in scope.values() for v in values]
+        stale = f"{in_scope} AND NOT EXISTS (SELECT 1 FROM _incoming s WHERE {on_keys})"
+        deleted = con.execute(f"""
+            INSERT INTO {CHANGED_KEYS_TABLE}
+            SELECT {", ".join(f"t.{k}" for k in KEY_COLUMNS)} FROM {table_name} t WHERE {stale};
+        """, params).fetchone()[0]
 
-print(f" Project root detected: {PROJECT_ROOT}")
-print(f" Input CSV: {DATA_PATH}")
-print(f" Output DuckDB: {DB_PATH}")
+    if partitions.layout(con, table_name) == "partitioned":
+        _rewrite_partitions(con, table_name)
+        con.execute("DROP TABLE _incoming;")
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged, "deleted": deleted}
 
-# Ensure directories exist
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    if deleted:
+        with span("load.delete", rows_out=deleted):
+            con.execute(f"DELETE FROM {table_name} AS t WHERE {stale};", params)
+    if updated:
+        assignments = ", ".join(f"{c} = s.{c}" for c in value_cols)
+        with span("load.update", rows_out=updated):
+            con.execute(f"""
+                UPDATE {table_name} AS t SET {assignments}
+                FROM _incoming s
+                WHERE {on_keys} AND ({changed});
+            """)
+    if inserted:
+        with span("load.insert", rows_out=inserted):
+            con.execute(f"""
+                INSERT INTO {table_name} ({", ".join(columns)})
+                SELECT s.* FROM _incoming s
+                ANTI JOIN {table_name} t ON {on_keys};
+            """)
+    con.execute("DROP TABLE _incoming;")
+    return {"inserted": inserted, "updated": updated, "unchanged": unchanged, "deleted": deleted}
+
+def _rewrite_partitions(con, table_name):
+    """Rewrite the partitions of the years in CHANGED_KEYS_TABLE from the table and _incoming."""
+    year = partitions.PARTITION_COLUMN
+    years = [r[0] for r in con.execute(
+        f"SELECT DISTINCT {year} FROM {CHANGED_KEYS_TABLE} ORDER BY 1;").fetchall()]
+    if not years:
+        return
+    in_keys = " AND ".join(f"k.{k} = t.{k}" for k in KEY_COLUMNS)
+    with span("load.rewrite_partitions", years=len(years)) as s:
+        s.count(files=partitions.write_partitions(con, table_name, f"""
+            SELECT t.* FROM {table_name} t
+            WHERE t.{year} IN ({", ".join(str(int(y)) for y in years)})
+              AND NOT EXISTS (SELECT 1 FROM {CHANGED_KEYS_TABLE} k WHERE {in_keys})
+            UNION ALL BY NAME
+            SELECT t.* FROM _incoming t SEMI JOIN {CHANGED_KEYS_TABLE} k ON {in_keys}
+        """, years))
 
 # ───────────────────────────────
-# Load CSV into DuckDB
+# Load processed data into DuckDB
 # ───────────────────────────────
-def load_to_duckdb(csv_path=DATA_PATH, db_path=DB_PATH, table_name="clean_data"):
-    if not csv_path.exists():
-        raise FileNotFoundError(f" CSV file not found: {csv_path.resolve()}")
-    print(f" Loading {csv_path.name} into {db_path.name} ...")
+def _load(con, data_path, table_name, mode, data, scope=None, layout=None) -> dict:
+    """Run one load (and the rollup refresh) in a single transaction on con."""
+    with span("load", mode=mode, table=table_name) as load_span:
+        if data is not None:
+            con.register(IN_MEMORY_VIEW, data)
+        try:
+            con.execute("BEGIN TRANSACTION;")
+            _ensure_metadata_table(con)
+            if mode == "incremental":
+                stats = _upsert(con, data_path, table_name, scope)
+            else:
+                stats = _replace(con, data_path, table_name, layout)
+            if table_name == rollups.SOURCE_TABLE:
+                changed = CHANGED_KEYS_TABLE if mode == "incremental" else None
+                with span("load.rollups", incremental=changed is not None) as s:
+                    stats["rollups"] = rollups.refresh_rollups(con, changed)
+                    s.count(rows_out=sum(stats["rollups"].values()))
+            _record_load(con, table_name, data_path, mode, stats)
+            con.execute("COMMIT;")
+        except Exception:
+            con.execute("ROLLBACK;")
+            raise
+
+        load_span.count(rows_out=stats["inserted"] + stats["updated"])
+        if data_path is not None:
+            files = data_path.rglob("*.parquet") if data_path.is_dir() else [data_path]
+            load_span.count(bytes_read=sum(f.stat().st_size for f in files))
+    return stats
+
+def _validate_staged(con, rules: list):
+    """Run the validation rules on the staged data; raise instead of publishing on failure."""
+    with span("load.validate", rules=len(rules)):
+        report = validate_data.run_validation(con, rules)
+    failed = [r["name"] for r in report["rules"] if r["status"] == "fail"]
+    if failed:
+        raise RuntimeError(f" Staged data failed validation, not published: {', '.join(failed)}")
+    print(f" Staged data passed {len(report['rules'])} validation rules")
+
+def load_to_duckdb(data_path=DATA_PATH, db_path=DB_PATH, table_name="clean_data",
+                   mode="replace", data=None, validate=True, keep=versions.KEEP_VERSIONS,
+                   scope=None, layout=None):
+    """Load the processed data into DuckDB and return inserted/updated/unchanged counts.
+
+    If ``data`` (a pandas DataFrame or pyarrow Table) is given it is loaded
+    directly — Arrow tables are scanned zero-copy — and data_path is ignored.
+
+    The load runs on a staged copy of the warehouse (see warehouse/versions.py)
+    that is validated (clean_data only, unless validate=False) and then
+    published with an atomic swap, so readers never see a half-loaded
+    table; the previous ``keep`` versions are kept for rollback.
+
+    scope ({column: values}, incremental mode only) declares the data complete
+    for those values, e.g. the countries re-transformed by an incremental
+    transform: existing rows in scope that it lacks are deleted.
+
+    layout ("table" or "partitioned", replace mode only) sets how the table
+    is stored; by default a replace keeps the current layout.
+    """
+    if mode not in ("replace", "incremental"):
+        raise ValueError(f" Unknown load mode: {mode}")
+    if layout not in (None, "table", "partitioned"):
+        raise ValueError(f" Unknown table layout: {layout}")
+    if layout is not None and mode != "replace":
+        raise ValueError(" The table layout can only be changed by a replace load")
+    if data is None:
+        data_path = Path(data_path)
+        if not data_path.exists():
+            raise FileNotFoundError(f" Processed data not found: {data_path.resolve()}")
+        source_label = data_path.name
+    else:
+        data_path = None
+        source_label = "in-memory data"
+    db_path = Path(db_path)
+    print(f" Loading {source_label} into {db_path.name} ({mode}) ...")
+
+    staged = versions.stage(db_path)
+    try:
+        with warehouse.writer(staged) as con:
+            stats = _load(con, data_path, table_name, mode, data, scope, layout)
+            if validate and table_name == rollups.SOURCE_TABLE:
+                _validate_staged(con, validate_data.DEFAULT_RULES)
 
-    con = duckdb.connect(str(db_path))
-    con.execute(f"DROP TABLE IF EXISTS {table_name};")
-    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM read_csv_auto('{csv_path}');")
+            count = con.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
+            print(f" Loaded {count:,} rows into table '{table_name}'")
+            print(f" Inserted: {stats['inserted']:,}  Updated: {stats['updated']:,}  Unchanged: {stats['unchanged']:,}"
+                  + (f"  Deleted: {stats['deleted']:,}" if stats.get("deleted") else ""))
+            for name, rows in stats.get("rollups", {}).items():
+                print(f" Refreshed {name}: {rows:,} rows")
 
-    count = con.execute(f"SELECT COUNT(*) FROM {table_name};").fetchone()[0]
-    print(f" Loaded {count:,} rows into table '{table_name}'")
+            sample = con.execute(f"SELECT * FROM {table_name} LIMIT 5;").fetchdf()
+            print("\n Sample rows:")
+            print(sample)
+    except Exception:
+        warehouse.close(staged)
+        versions.discard(staged)
+        raise
+    # Close (and checkpoint) the staged file before anyone else opens it.
+    warehouse.close(staged)
+    if table_name == rollups.SOURCE_TABLE:
+        try:
+            with span("load.serving_snapshot") as s:
+                snapshot = serving.write_snapshot(warehouse.reader(staged), staged)
+                s.count(bytes_written=snapshot.stat().st_size)
+        except Exception:
+            warehouse.close(staged)
+            versions.discard(staged)
+            raise
+        warehouse.close(staged)
 
-    sample = con.execute(f"SELECT * FROM {table_name} LIMIT 5;").fetchdf()
-    print("\n Sample rows:")
-    print(sample)
-    con.close()
+    with span("load.publish"):
+        pruned = versions.publish(db_path, staged, keep)
+        removed = partitions.collect_garbage(versions.list_versions(db_path))
+    print(f"\n Published {staged.name} as {db_path}"
+          f" ({len(pruned)} old version(s) pruned)")
+    if removed:
+        print(f" Removed {removed} partition file(s) no kept version uses")
+    return stats
 
-    print(f"\n Database created at: {db_path.resolve()}")
+def _print_versions(db_path: Path):
+    live = versions.current(db_path)
+    for version in versions.list_versions(db_path):
+        marker = "*" if live is not None and version.name == live.name else " "
+        print(f" {marker} {version.name}")
 
 if __name__ == "__main__":
-    load_to_duckdb()
+    parser = argparse.ArgumentParser(description="Load processed data into DuckDB.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Upsert new/changed rows instead of rebuilding the table.")
+    parser.add_argument("--input", type=Path, default=DATA_PATH,
+                        help="Processed Parquet file/dataset (or a CSV export) to load.")
+    parser.add_argument("--changes", action="store_true",
+                        help="Load only the slice from the last incremental transform "
+                             "(a full replace if there is none).")
+    parser.add_argument("--layout", choices=["table", "partitioned"], default=None,
+                        help="Store clean_data as a table or as year-partitioned Parquet "
+                             "(full loads only; default: keep the current layout).")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="Publish without running the validation rules on the staged data.")
+    parser.add_argument("--keep", type=int, default=versions.KEEP_VERSIONS,
+                        help="Previous warehouse versions to keep for rollback.")
+    parser.add_argument("--rollback", nargs="?", const="", default=None, metavar="VERSION",
+                        help="Point the warehouse back at VERSION (default: the previous one) and exit.")
+    parser.add_argument("--list-versions", action="store_true",
+                        help="List warehouse versions (* = current) and exit.")
+    args = parser.parse_args()
+    if args.list_versions:
+        _print_versions(DB_PATH)
+    elif args.rollback is not None:
+        target = versions.rollback(DB_PATH, args.rollback or None)
+        print(f" Warehouse now points at {target.name}")
+    else:
+        mode, scope = "incremental" if args.incremental else "replace", None
+        if args.changes and CHANGES_PATH.exists():
+            from transform_incremental import changes_scope
+            args.input, mode, scope = CHANGES_PATH, "incremental", changes_scope(CHANGES_PATH)
+        print(f" Project root detected: {PROJECT_ROOT}")
+        print(f" Input data: {args.input}")
+        print(f" Output DuckDB: {DB_PATH}")
+        with pipeline_run("load_to_duckdb"):
+            load_to_duckdb(args.input, mode=mode, validate=not args.no_validate, keep=args.keep,
+                           scope=scope, layout=args.layout)
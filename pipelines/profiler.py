@@ -0,0 +1,414 @@
+"""
+Streaming data profiler
+-----------------------
+Profiles a dataset chunk by chunk in one pass, per column and per country:
+
+  count / nulls         exact
+  min / max             exact
+  mean / variance       exact, merged with Chan's parallel update
+  quantiles             DDSketch (log-spaced buckets): every reported
+                        quantile is within RELATIVE_ACCURACY of a true value
+  distinct              HyperLogLog registers
+
+Every statistic is mergeable: DataProfile.update() folds in one chunk and
+DataProfile.merge() combines profiles built from other chunks, files or
+worker processes, with the same result as profiling everything at once.
+The state grows with the number of countries (and of distinct value
+buckets per country), never with the number of rows; per-country
+sketches use coarser settings to keep that small.
+
+write_profile() saves the structured profile as data_quality_profile.json
+and the usual data_quality_summary.txt.
+"""
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+RELATIVE_ACCURACY = 0.01
+HLL_PRECISION = 12            # 4,096 registers, ~1.6% standard error
+GROUP_RELATIVE_ACCURACY = 0.05
+GROUP_HLL_PRECISION = 8       # 256 registers per country and column
+CHUNK_ROWS = 100_000
+
+# ───────────────────────────────
+# Sketches for many groups at once
+# ───────────────────────────────
+def _hll_ranks(hashes: np.ndarray, precision: int) -> tuple:
+    """(register, rank) per uint64 hash: the top bits pick the register, the
+    rank is the position of the first 1 bit among the next 53 (exact as float64)."""
+    p = np.uint64(precision)
+    register = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+    rest = ((hashes << p) >> np.uint64(11)) | np.uint64(1)
+    _, bit_length = np.frexp(rest.astype(np.float64))
+    return register, (54 - bit_length).astype(np.uint8)
+
+def _merge_counts(keys: np.ndarray, counts: np.ndarray) -> tuple:
+    """Sorted unique keys with their summed counts."""
+    if not len(keys):
+        return keys, counts
+    order = np.argsort(keys, kind="stable")   # linear when keys are a few sorted runs
+    keys, counts = keys[order], counts[order]
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[first], np.add.reduceat(counts, first)
+
+def _scatter(values: np.ndarray, slots: np.ndarray, size: int, fill) -> np.ndarray:
+    out = np.full(size, fill, dtype=values.dtype)
+    out[slots] = values
+    return out
+
+class _Stats:
+    """Mergeable statistics of one column, one slot per group."""
+
+    def __init__(self, numeric: bool, relative_accuracy: float, hll_precision: int):
+        self.numeric = numeric
+        self.relative_accuracy = relative_accuracy
+        self.hll_precision = hll_precision
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # Bucket index range wide enough for every finite float64 magnitude.
+        self.max_key = int(math.ceil(750 / math.log(self.gamma)))
+        self.width = 4 * self.max_key + 3
+        self.nulls = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.bucket_keys = np.zeros(0, dtype=np.int64)     # slot * width + bucket, sorted
+        self.bucket_counts = np.zeros(0, dtype=np.int64)
+        self.registers = np.zeros((0, 1 << hll_precision), dtype=np.uint8)
+
+    def _grow(self, slots: int):
+        extra = slots - len(self.count)
+        if extra <= 0:
+            return
+        self.nulls = np.append(self.nulls, np.zeros(extra, dtype=np.int64))
+        self.count = np.append(self.count, np.zeros(extra, dtype=np.int64))
+        self.mean = np.append(self.mean, np.zeros(extra))
+        self.m2 = np.append(self.m2, np.zeros(extra))
+        self.min = np.append(self.min, np.full(extra, np.inf))
+        self.max = np.append(self.max, np.full(extra, -np.inf))
+        self.registers = np.vstack(
+            [self.registers, np.zeros((extra, self.registers.shape[1]), dtype=np.uint8)])
+
+    # Quantile buckets: negative values, zero, positive values in value order.
+    def _buckets(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore"):
+            k = np.ceil(np.log(np.abs(values)) / np.log(self.gamma))
+        k = np.clip(k, -self.max_key, self.max_key).astype(np.int64)
+        zero = 2 * self.max_key + 1
+        return np.where(values > 0, zero + 1 + self.max_key + k,
+                        np.where(values < 0, self.max_key - k, zero))
+
+    def _bucket_values(self, buckets: np.ndarray) -> np.ndarray:
+        zero = 2 * self.max_key + 1
+        k = np.where(buckets > zero, buckets - zero - 1 - self.max_key, self.max_key - buckets)
+        magnitude = 2 * self.gamma ** k.astype(np.float64) / (self.gamma + 1)
+        return np.where(buckets > zero, magnitude, np.where(buckets < zero, -magnitude, 0.0))
+
+    def _add_buckets(self, keys: np.ndarray, counts: np.ndarray):
+        self.bucket_keys, self.bucket_counts = _merge_counts(
+            np.concatenate([self.bucket_keys, keys]), np.concatenate([self.bucket_counts, counts]))
+
+    def _add_moments(self, count, mean, m2, minimum, maximum):
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean
+            share = np.where(total > 0, count / total, 0.0)
+            self.mean = self.mean + delta * share
+            self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.count = total
+        self.min = np.fmin(self.min, minimum)
+        self.max = np.fmax(self.max, maximum)
+
+    def update(self, slots: np.ndarray, n_slots: int, missing: np.ndarray,
+               values: np.ndarray, hashes: np.ndarray):
+        """Fold in one chunk: slot per row, its null flag, float values (numeric) and hashes."""
+        self._grow(n_slots)
+        self.nulls += np.bincount(slots[missing], minlength=n_slots)
+        present = slots[~missing]
+        if self.numeric:
+            v = values[~missing]
+            count = np.bincount(present, minlength=n_slots)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.bincount(present, weights=v, minlength=n_slots) / count
+            m2 = np.bincount(present, weights=(v - mean[present]) ** 2, minlength=n_slots)
+            minimum, maximum = np.full(n_slots, np.inf), np.full(n_slots, -np.inf)
+            buckets = self._buckets(v)
+            if n_slots == 1:
+                if len(v):
+                    minimum[0], maximum[0] = v.min(), v.max()
+                lo = buckets.min() if len(v) else 0
+                counts = np.bincount(buckets - lo)
+                keys = np.flatnonzero(counts)
+                keys, counts = keys + lo, counts[keys]
+            else:
+                np.minimum.at(minimum, present, v)
+                np.maximum.at(maximum, present, v)
+                keys, counts = np.unique(present * self.width + buckets, return_counts=True)
+            self._add_moments(count, np.nan_to_num(mean), m2, minimum, maximum)
+            self._add_buckets(keys, counts)
+        else:
+            self.count += np.bincount(present, minlength=n_slots)
+        register, rank = _hll_ranks(hashes, self.hll_precision)
+        np.maximum.at(self.registers.reshape(-1), present * self.registers.shape[1] + register, rank)
+
+    def merge(self, other: "_Stats", slot_map: np.ndarray, n_slots: int):
+        """Fold in other, whose slot i is slot slot_map[i] here."""
+        if (other.relative_accuracy, other.hll_precision) != (self.relative_accuracy, self.hll_precision):
+            raise ValueError(" Cannot merge profiles built with different sketch settings")
+        self._grow(n_slots)
+        slot_map = slot_map[:len(other.count)]
+        self.nulls += _scatter(other.nulls, slot_map, n_slots, 0)
+        if self.numeric:
+            self._add_moments(*(_scatter(a, slot_map, n_slots, fill) for a, fill in (
+                (other.count, 0), (other.mean, 0.0), (other.m2, 0.0),
+                (other.min, np.inf), (other.max, -np.inf))))
+            slot, bucket = np.divmod(other.bucket_keys, other.width)
+            self._add_buckets(slot_map[slot] * self.width + bucket, other.bucket_counts)
+        else:
+            self.count += _scatter(other.count, slot_map, n_slots, 0)
+        self.registers[slot_map] = np.maximum(self.registers[slot_map], other.registers)
+
+    def distinct(self) -> np.ndarray:
+        """HyperLogLog estimate per slot (linear counting for small counts)."""
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64), axis=1)
+        zeros = np.count_nonzero(self.registers == 0, axis=1)
+        with np.errstate(divide="ignore"):
+            small = m * np.log(m / np.maximum(zeros, 1))
+        estimate = np.where((estimate <= 2.5 * m) & (zeros > 0), small, estimate)
+        return np.minimum(np.round(estimate), self.count).astype(np.int64)
+
+    def quantiles(self, qs) -> np.ndarray:
+        """(slots × len(qs)) quantile estimates; NaN for slots without values."""
+        out = np.full((len(self.count), len(qs)), np.nan)
+        if not self.numeric or not len(self.bucket_keys):
+            return out
+        slot, bucket = np.divmod(self.bucket_keys, self.width)
+        cum = np.cumsum(self.bucket_counts)
+        # Keys are sorted by slot: each slot's ranks start after the earlier slots' counts.
+        start = np.concatenate([[0], cum])[np.searchsorted(slot, np.arange(len(self.count)))]
+        filled = np.flatnonzero(self.count)
+        values = self._bucket_values(bucket)
+        for j, q in enumerate(qs):
+            rank = start[filled] + np.floor(q * (self.count[filled] - 1)).astype(np.int64)
+            estimate = values[np.searchsorted(cum, rank, side="right")]
+            out[filled, j] = np.clip(estimate, self.min[filled], self.max[filled])
+        return out
+
+    def summary(self, qs) -> list:
+        """One dict of statistics per slot."""
+        distinct, quantiles = self.distinct(), self.quantiles(qs)
+        rows = []
+        for i in range(len(self.count)):
+            row = {"count": int(self.count[i]), "nulls": int(self.nulls[i]),
+                   "distinct": int(distinct[i])}
+            if self.numeric and self.count[i]:
+                variance = float(self.m2[i] / (self.count[i] - 1)) if self.count[i] > 1 else None
+                row.update(min=float(self.min[i]), max=float(self.max[i]),
+                           mean=float(self.mean[i]), variance=variance,
+                           quantiles={f"{q:g}": float(v) for q, v in zip(qs, quantiles[i])})
+            rows.append(row)
+        return rows
+
+# ───────────────────────────────
+# Dataset profile
+# ───────────────────────────────
+class DataProfile:
+    """Per-column and per-group profile, built one chunk at a time."""
+
+    def __init__(self, group_by: str = "country_name", quantiles=QUANTILES):
+        self.group_by = group_by
+        self.quantiles = tuple(quantiles)
+        self.rows = 0
+        self.dtypes = {}
+        self.groups = {}          # group value → slot
+        self.columns = {}         # column → _Stats over one slot (the whole column)
+        self.by_group = {}        # column → _Stats with a slot per group
+
+    def _add_column(self, name: str, numeric: bool):
+        if name in self.columns:
+            return
+        self.columns[name] = _Stats(numeric, RELATIVE_ACCURACY, HLL_PRECISION)
+        if name != self.group_by:
+            self.by_group[name] = _Stats(numeric, GROUP_RELATIVE_ACCURACY, GROUP_HLL_PRECISION)
+
+    def _add_dtype(self, name: str, dtype: str):
+        """Record a chunk's dtype, promoted as concatenating the chunks would (int64 + float64)."""
+        known = self.dtypes.setdefault(name, dtype)
+        if known != dtype:
+            try:
+                self.dtypes[name] = np.promote_types(known, dtype).name
+            except TypeError:
+                self.dtypes[name] = "object"
+
+    def _slots(self, keys: pd.Series) -> np.ndarray:
+        codes, uniques = pd.factorize(keys)
+        names = [str(u) for u in uniques] + ["<missing>"] * bool((codes < 0).any())
+        # Code -1 (missing key) picks the last entry.
+        slot_map = np.array([self.groups.setdefault(g, len(self.groups)) for g in names],
+                            dtype=np.int64)
+        return slot_map[codes] if len(codes) else codes.astype(np.int64)
+
+    def update(self, df: pd.DataFrame) -> "DataProfile":
+        """Fold one chunk (a DataFrame) into the profile."""
+        self.rows += len(df)
+        slots = self._slots(df[self.group_by]) if self.group_by in df else None
+        single = np.zeros(len(df), dtype=np.int64)
+        for name in df.columns:
+            col = df[name]
+            numeric = pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+            self._add_dtype(name, str(col.dtype))
+            self._add_column(name, numeric)
+            missing = col.isna().to_numpy()
+            values = col.to_numpy(dtype=np.float64, na_value=np.nan) if numeric else None
+            if numeric:
+                hashes = pd.util.hash_array(values[~missing])
+            else:
+                hashes = pd.util.hash_pandas_object(col[~missing], index=False).to_numpy()
+            self.columns[name].update(single, 1, missing, values, hashes)
+            if name in self.by_group and slots is not None:
+                self.by_group[name].update(slots, len(self.groups), missing, values, hashes)
+        return self
+
+    def merge(self, other: "DataProfile") -> "DataProfile":
+        """Fold in a profile of other rows (another chunk, file or process)."""
+        self.rows += other.rows
+        for name, dtype in other.dtypes.items():
+            self._add_dtype(name, dtype)
+        slot_map = np.array([self.groups.setdefault(g, len(self.groups)) for g in other.groups],
+                            dtype=np.int64)
+        for name, stats in other.columns.items():
+            self._add_column(name, stats.numeric)
+            self.columns[name].merge(stats, np.zeros(1, dtype=np.int64), 1)
+            if name in other.by_group:
+                self.by_group[name].merge(other.by_group[name], slot_map, len(self.groups))
+        return self
+
+    def null_counts(self) -> pd.Series:
+        return pd.Series({name: int(s.nulls.sum()) for name, s in self.columns.items()}, dtype="int64")
+
+    def numeric_summary(self) -> pd.DataFrame:
+        """Per numeric column, in the layout of DataFrame.describe().T."""
+        qs = (0.25, 0.5, 0.75)
+        rows = {}
+        for name, stats in self.columns.items():
+            if not stats.numeric:
+                continue
+            s = stats.summary(qs)[0]
+            variance = s.get("variance")
+            rows[name] = {"count": float(s["count"]), "mean": s.get("mean", np.nan),
+                          "std": math.sqrt(variance) if variance is not None else np.nan,
+                          "min": s.get("min", np.nan),
+                          **{f"{q * 100:g}%": s.get("quantiles", {}).get(f"{q:g}", np.nan) for q in qs},
+                          "max": s.get("max", np.nan)}
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def to_dict(self) -> dict:
+        groups = list(self.groups)
+        by_group = {g: {} for g in groups}
+        for name, stats in self.by_group.items():
+            stats._grow(len(groups))
+            for g, row in zip(groups, stats.summary(self.quantiles)):
+                by_group[g][name] = row
+        return {
+            "rows": self.rows,
+            "columns": {name: {"dtype": self.dtypes[name], **stats.summary(self.quantiles)[0]}
+                        for name, stats in self.columns.items()},
+            "group_by": self.group_by,
+            "groups": by_group,
+            "sketches": {"relative_accuracy": RELATIVE_ACCURACY, "hll_precision": HLL_PRECISION,
+                         "group_relative_accuracy": GROUP_RELATIVE_ACCURACY,
+                         "group_hll_precision": GROUP_HLL_PRECISION},
+        }
+
+    def summary_text(self) -> str:
+        return "".join([
+            "=== Basic Dataset Summary ===\n",
+            f"Rows: {self.rows}\nColumns: {list(self.columns)}\n\n",
+            "=== Missing Values ===\n",
+            str(self.null_counts()),
+            "\n\n=== Data Types ===\n",
+            str(pd.Series(self.dtypes, dtype=object)),
+            "\n\n=== Numeric Summary ===\n",
+            str(self.numeric_summary()),
+        ])
+
+# ───────────────────────────────
+# Profiling sources
+# ───────────────────────────────
+def profile_frame(df: pd.DataFrame, chunk_rows: int = CHUNK_ROWS, **options) -> DataProfile:
+    """Profile an in-memory frame slice by slice (no full-frame temporaries)."""
+    profile = DataProfile(**options)
+    for start in range(0, max(len(df), 1), chunk_rows):
+        profile.update(df.iloc[start:start + chunk_rows])
+    return profile
+
+def _profile_units(path: str, units: list, columns, batch_rows: int, options: dict) -> DataProfile:
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    fragments = {f.path: f for f in dataset.get_fragments()}
+    profile = DataProfile(**options)
+    for file, row_group in units:
+        fragment = fragments[file].subset(row_group_ids=[row_group])
+        for batch in fragment.to_batches(schema=dataset.schema, columns=columns,
+                                         batch_size=batch_rows):
+            profile.update(batch.to_pandas())
+    return profile
+
+def profile_parquet(path: Path, columns: list = None, batch_rows: int = CHUNK_ROWS,
+                    workers: int = None, **options) -> DataProfile:
+    """Profile a Parquet file or (hive-partitioned) directory in one streaming pass.
+
+    Row groups are profiled in up to workers processes and the partial
+    profiles merged.
+    """
+    path = str(path)
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    columns = [c for c in (columns or dataset.schema.names) if c in dataset.schema.names]
+    units = [(f.path, rg.id) for f in dataset.get_fragments() for rg in f.row_groups]
+    workers = max(1, min(workers or 1, len(units)))
+    if workers == 1:
+        profile = _profile_units(path, units, columns, batch_rows, options)
+    else:
+        shares = [units[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_profile_units, [path] * workers, shares, [columns] * workers,
+                                  [batch_rows] * workers, [options] * workers))
+        profile = parts[0]
+        for part in parts[1:]:
+            profile.merge(part)
+    if not profile.columns:   # no rows at all: still report the columns
+        profile.update(dataset.schema.empty_table().select(columns).to_pandas())
+    return profile
+
+def write_profile(profile: DataProfile, report_dir: Path) -> tuple:
+    """Write data_quality_profile.json and data_quality_summary.txt; returns both paths."""
+    json_path = report_dir / "data_quality_profile.json"
+    summary_path = report_dir / "data_quality_summary.txt"
+    tmp_path = json_path.with_name(f".{json_path.name}.{os.getpid()}.part")
+    with open(tmp_path, "w") as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    os.replace(tmp_path, json_path)
+    with open(summary_path, "w") as f:
+        f.write(profile.summary_text())
+    return json_path, summary_path
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Profile a processed Parquet dataset.")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", type=Path, default=Path(__file__).resolve().parents[1] / "data" / "reports")
+    args = parser.parse_args()
+    args.out.mkdir(parents=True, exist_ok=True)
+    for p in write_profile(profile_parquet(args.path, workers=args.workers), args.out):
+        print(f" Profile saved to {p}")
@@ -0,0 +1,16 @@
+"""
+Project root on sys.path
+------------------------
+The pipeline scripts run as `python pipelines/<name>.py`, which puts only
+pipelines/ on sys.path. Importing this module first also makes the project
+root importable, so the scripts (and their sibling modules) can import the
+warehouse package.
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
@@ -0,0 +1,170 @@
+"""
+Raw snapshot store
+------------------
+Every downloaded payload is kept once, compressed, under its SHA-256, and
+each dated snapshot is a symlink to it:
+
+  data/raw/objects/<sha[:2]>/<sha>.csv.zst            one file per distinct payload
+  data/raw/<name>_<YYYYMMDD>.csv.zst → objects/...    one link per download
+
+A download identical to an earlier one only adds a link, so disk use grows
+with actual changes, not with days of operation. zstd is used when the
+optional zstandard package is installed, gzip otherwise.
+
+Snapshots stay ordinary paths for readers: pandas and DuckDB decompress
+while streaming based on the extension, and open_text() does the same for
+plain line reads. Uncompressed <name>_<YYYYMMDD>.csv files (from before
+the store) are still read; `python pipelines/raw_store.py --migrate`
+moves them into the store.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import os
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+RAW_DIR = PROJECT_ROOT / "data" / "raw"
+OBJECTS_DIR_NAME = "objects"
+CODECS = (".zst", ".gz")
+CHUNK_SIZE = 1 << 16
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+def default_codec() -> str:
+    return ".zst" if zstandard is not None else ".gz"
+
+def codec_of(path: Path) -> str:
+    """".zst", ".gz" or "" (uncompressed) for a snapshot or object path."""
+    suffix = Path(path).suffix
+    return suffix if suffix in CODECS else ""
+
+def snapshot_name(path: Path) -> str:
+    """Snapshot file name without its compression suffix (gdp_20251016.csv)."""
+    name = Path(path).name
+    codec = codec_of(path)
+    return name[:-len(codec)] if codec else name
+
+# ───────────────────────────────
+# Reading
+# ───────────────────────────────
+def open_text(path: Path):
+    """Open a snapshot for reading text, decompressing on the fly."""
+    codec = codec_of(path)
+    if codec == ".gz":
+        return gzip.open(path, "rt", newline="")
+    if codec == ".zst":
+        if zstandard is None:
+            raise ImportError(f" {path} is zstd-compressed; install the zstandard package")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, newline="")
+    return open(path, newline="")
+
+def find_snapshots(raw_dir: Path, pattern: str) -> list:
+    """Snapshots matching pattern (e.g. "gdp_*.csv") in any codec, oldest first.
+
+    When a date exists both uncompressed and in the store, the stored one sorts last.
+    """
+    raw_dir = Path(raw_dir)
+    matches = {p for suffix in ("", *CODECS) for p in raw_dir.glob(pattern + suffix)}
+    return sorted(matches, key=lambda p: (snapshot_name(p), codec_of(p) != ""))
+
+# ───────────────────────────────
+# Writing
+# ───────────────────────────────
+def _compressor(f, codec: str):
+    if codec == ".zst":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(f, closefd=False)
+    # mtime=0: the same payload always compresses to the same bytes.
+    return gzip.GzipFile(fileobj=f, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+
+def _existing_object(objects_dir: Path, digest: str):
+    matches = sorted(objects_dir.glob(f"{digest[:2]}/{digest}.*"))
+    return next((m for m in matches if not m.name.endswith(".part")), None)
+
+def _link(link: Path, target: Path):
+    """Atomically make link a relative symlink to target."""
+    tmp_link = link.with_name(f".{link.name}.link")
+    tmp_link.unlink(missing_ok=True)
+    os.symlink(os.path.relpath(target, link.parent), tmp_link)
+    os.replace(tmp_link, link)
+
+def store(chunks, raw_dir: Path, name: str, codec: str = None) -> dict:
+    """Store the bytes in chunks as snapshot name (e.g. "gdp_20251016.csv").
+
+    Compresses and hashes while streaming; the payload is written to the
+    object store only if no identical one exists. Returns {"path" (the
+    snapshot link), "sha256", "bytes", "stored_bytes", "new"}.
+    """
+    raw_dir = Path(raw_dir)
+    codec = codec or default_codec()
+    objects_dir = raw_dir / OBJECTS_DIR_NAME
+    objects_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = objects_dir / f".{name}.{os.getpid()}{codec}.part"
+
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(tmp_path, "wb") as f:
+            with _compressor(f, codec) as out:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        digest = digest.hexdigest()
+        obj = _existing_object(objects_dir, digest)
+        new = obj is None
+        if new:
+            obj = objects_dir / digest[:2] / f"{digest}{Path(name).suffix}{codec}"
+            obj.parent.mkdir(exist_ok=True)
+            os.replace(tmp_path, obj)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    link = raw_dir / f"{name}{codec_of(obj)}"
+    _link(link, obj)
+    for other in ("", *CODECS):
+        # Replace any copy of the same snapshot kept under another codec.
+        stale = raw_dir / f"{name}{other}"
+        if stale != link and (stale.exists() or stale.is_symlink()):
+            stale.unlink()
+    return {"path": link, "sha256": digest, "bytes": size,
+            "stored_bytes": obj.stat().st_size if new else 0, "new": new}
+
+def _file_chunks(path: Path):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+def migrate(raw_dir: Path = RAW_DIR, codec: str = None) -> list:
+    """Move the uncompressed snapshots of raw_dir into the store; returns the results."""
+    results = []
+    for path in sorted(Path(raw_dir).glob("*.csv")):
+        if path.is_symlink():
+            continue
+        results.append(store(_file_chunks(path), raw_dir, path.name, codec))
+    return results
+
+def disk_usage(raw_dir: Path = RAW_DIR) -> int:
+    """Bytes used by raw_dir (symlinks count as nothing)."""
+    return sum(p.stat().st_size for p in Path(raw_dir).rglob("*")
+               if p.is_file() and not p.is_symlink())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the content-addressed raw snapshot store.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Move uncompressed data/raw/*.csv snapshots into the store.")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR)
+    args = parser.parse_args()
+    before = disk_usage(args.raw_dir)
+    if args.migrate:
+        for r in migrate(args.raw_dir):
+            state = "stored" if r["new"] else "deduplicated"
+            print(f" {r['path'].name}: {r['bytes']:,} bytes, {state} ({r['sha256'][:12]})")
+    print(f" {args.raw_dir}: {before:,} → {disk_usage(args.raw_dir):,} bytes on disk")
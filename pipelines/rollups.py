@@ -0,0 +1,102 @@
+"""
+Materialized rollup tables
+--------------------------
+Pre-aggregated tables built from clean_data at load time, so the dashboard
+and the report charts read a few hundred rows instead of re-aggregating
+the fact table on every request:
+
+  rollup_yearly_totals    – per-year population / GDP / CO₂ sums
+  rollup_gdp_rank         – per-year GDP ranking (top GDP_RANK_DEPTH countries)
+  rollup_gdp_co2          – GDP / CO₂ pairs for ROLLUP_MIN_YEAR and later
+  rollup_country_summary  – per-country year span and latest values
+
+A replace load rebuilds every rollup. An incremental load passes the keys
+it touched and only the affected years (or countries) are recomputed.
+
+Used by: load_to_duckdb.py (build), analyze_duckdb.py and app/streamlit_app.py (read)
+"""
+
+SOURCE_TABLE = "clean_data"
+GDP_RANK_DEPTH = 25
+ROLLUP_MIN_YEAR = 2000
+
+# Each rollup is a SELECT over {source}; {filter} restricts it to the
+# changed values of its refresh key during an incremental refresh.
+ROLLUPS = {
+    "rollup_yearly_totals": {
+        "key": "year",
+        "sql": """
+            SELECT year,
+                   COUNT(*)           AS countries,
+                   SUM(population)    AS total_population,
+                   SUM(gdp)           AS total_gdp,
+                   SUM(co2_emissions) AS total_co2
+            FROM {source}
+            WHERE true {filter}
+            GROUP BY year
+        """,
+    },
+    "rollup_gdp_rank": {
+        "key": "year",
+        "sql": f"""
+            SELECT year, country_name, gdp,
+                   ROW_NUMBER() OVER (PARTITION BY year ORDER BY gdp DESC, country_name) AS gdp_rank
+            FROM {{source}}
+            WHERE gdp IS NOT NULL {{filter}}
+            QUALIFY gdp_rank <= {GDP_RANK_DEPTH}
+        """,
+    },
+    "rollup_gdp_co2": {
+        "key": "year",
+        "sql": f"""
+            SELECT year, country_name, gdp, co2_emissions
+            FROM {{source}}
+            WHERE year >= {ROLLUP_MIN_YEAR}
+              AND gdp IS NOT NULL AND co2_emissions IS NOT NULL {{filter}}
+        """,
+    },
+    "rollup_country_summary": {
+        "key": "country_name",
+        "sql": """
+            SELECT country_name,
+                   MIN(year)                               AS first_year,
+                   MAX(year)                               AS last_year,
+                   arg_max(population, year)    FILTER (WHERE population IS NOT NULL)    AS latest_population,
+                   arg_max(gdp, year)           FILTER (WHERE gdp IS NOT NULL)           AS latest_gdp,
+                   arg_max(co2_emissions, year) FILTER (WHERE co2_emissions IS NOT NULL) AS latest_co2,
+                   SUM(co2_emissions)                      AS total_co2
+            FROM {source}
+            WHERE true {filter}
+            GROUP BY country_name
+        """,
+    },
+}
+
+def table_exists(con, table_name):
+    return con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?;",
+        [table_name],
+    ).fetchone()[0] > 0
+
+def refresh_rollups(con, changed_keys: str = None, source: str = SOURCE_TABLE) -> dict:
+    """Rebuild the rollups from source; returns {rollup: rows written}.
+
+    changed_keys names a table of (country_name, year) keys touched by an
+    incremental load; only the years / countries in it are recomputed.
+    Without it (or when a rollup does not exist yet) rollups are rebuilt in full.
+    """
+    written = {}
+    for name, spec in ROLLUPS.items():
+        key = spec["key"]
+        if changed_keys is None or not table_exists(con, name):
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS "
+                        f"{spec['sql'].format(source=source, filter='')} ORDER BY {key};")
+            written[name] = con.execute(f"SELECT COUNT(*) FROM {name};").fetchone()[0]
+            continue
+        subset = f"SELECT DISTINCT {key} FROM {changed_keys}"
+        con.execute(f"DELETE FROM {name} WHERE {key} IN ({subset});")
+        before = con.execute(f"SELECT COUNT(*) FROM {name};").fetchone()[0]
+        con.execute(f"INSERT INTO {name} "
+                    f"{spec['sql'].format(source=source, filter=f'AND {key} IN ({subset})')};")
+        written[name] = con.execute(f"SELECT COUNT(*) FROM {name};").fetchone()[0] - before
+    return written
@@ -0,0 +1,91 @@
+"""
+Stage cache for the Prefect flow
+--------------------------------
+Content-hash keys for pipeline stages, stored in a small JSON manifest
+(data/.cache/stage_manifest.json). A stage key covers the bytes of its
+input files, the source of the code that implements it, any parameters,
+and the keys of upstream stages. When the key matches the last successful
+run and the stage's outputs are still on disk, the stage can be skipped.
+Outputs are compared by resolved path, so an output that is a symlink
+switched to another file since the run is not fresh.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+CACHE_PATH = PROJECT_ROOT / "data" / ".cache" / "stage_manifest.json"
+CHUNK_SIZE = 1 << 20
+
+# ───────────────────────────────
+# Hashing
+# ───────────────────────────────
+def hash_file(path: Path) -> str:
+    """sha256 of a file's bytes, or of every file under a directory (with relative names)."""
+    path = Path(path)
+    digest = hashlib.sha256()
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for f in files:
+        if path.is_dir():
+            digest.update(str(f.relative_to(path)).encode())
+        with open(f, "rb") as fh:
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def stage_key(stage: str, inputs=(), code=(), params=None, upstream=()) -> str:
+    """Combine input contents, code version, params and upstream keys into one key."""
+    digest = hashlib.sha256(stage.encode())
+    # Only contents count: a new dated snapshot with identical bytes is a hit.
+    for label, paths in (("in", inputs), ("code", code)):
+        for p in paths:
+            digest.update(f"{label}:{hash_file(p)}".encode())
+    digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+    for key in upstream:
+        digest.update(f"up:{key}".encode())
+    return digest.hexdigest()
+
+# ───────────────────────────────
+# Manifest
+# ───────────────────────────────
+def _resolve(outputs) -> list:
+    """Output paths with symlinks resolved, as recorded in the manifest."""
+    return [os.path.realpath(p) for p in outputs]
+
+class StageCache:
+    """Last successful key per stage, persisted as JSON."""
+
+    def __init__(self, path: Path = CACHE_PATH):
+        self.path = Path(path)
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def is_fresh(self, stage: str, key: str, outputs=()) -> bool:
+        entry = self.entries.get(stage)
+        return (bool(entry) and entry["key"] == key
+                and entry.get("outputs") == _resolve(outputs)
+                and all(Path(p).exists() for p in outputs))
+
+    def record(self, stage: str, key: str, outputs=()):
+        self.entries[stage] = {
+            "key": key,
+            "outputs": _resolve(outputs),
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.save()
+
+    def invalidate(self, stage: str):
+        self.entries.pop(stage, None)
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.part")
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
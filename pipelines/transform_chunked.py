@@ -0,0 +1,220 @@
+"""
+Step 3 (alt engine): Streaming / chunked Transform & Clean
+----------------------------------------------------------
+Bounded-memory version of transform_clean's pandas path for raw files
+larger than memory:
+
+  1. Count pass   – stream only the country column of each raw file and
+                    count rows per country.
+  2. Plan         – split the sorted country list into contiguous ranges
+                    ("buckets") whose estimated merged size fits the
+                    memory budget.
+  3. Spill pass   – stream each raw file in bounded batches (usecols +
+                    explicit dtypes), clean each batch with the same code
+                    as load_and_clean, and append it to a per-source,
+                    per-bucket Parquet spill file.
+  4. Merge        – for each bucket in order, load its spill files, run the
+                    usual outer join + per-country gap fill, and append
+                    the result to clean_data.parquet.
+
+Gap filling is per country and every country lives in exactly one
+bucket, so the output is identical to the in-memory path (and already
+globally sorted by country_name, year).
+
+Used via: python pipelines/transform_clean.py --engine chunked
+"""
+
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import raw_store
+from instrumentation import span
+from transform_clean import (
+    INDICATORS, _clean_frame, _clear_output, _compact_columns, _code_column, _layout_for, _merge_frames,
+    _standardize_long_format, processed_schema, to_arrow,
+)
+
+DEFAULT_CHUNKSIZE = 100_000
+DEFAULT_MEMORY_BUDGET_MB = 512
+# Rough in-memory cost of one merged row (object country string, keys,
+# values and the temporary copies made by merge/gap fill).
+BYTES_PER_ROW = 400
+
+# ───────────────────────────────
+# Batched raw readers
+# ───────────────────────────────
+def _raw_columns(path: Path, value_name: str):
+    """Raw (country col or None, year col, value col, ISO3 code col or None) from the header."""
+    header = pd.read_csv(path, nrows=0).columns
+    normalized = {c.strip().lower().replace(" ", "_"): c for c in header}
+    country_col, year_col, value_col = _layout_for(normalized, value_name)
+    code_col = _code_column(normalized, country_col)
+    return tuple(normalized[c] if c else None for c in (country_col, year_col, value_col, code_col))
+
+def _read_batches(path: Path, usecols, dtype, chunksize: int):
+    return pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize,
+                       float_precision="round_trip")
+
+def iter_clean_batches(path: Path, value_name: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                       index=None):
+    """Yield cleaned (country_name, year, value_name) batches of at most chunksize rows."""
+    country_col, year_col, value_col, code_col = _raw_columns(path, value_name)
+    usecols = [c for c in (country_col, year_col, value_col, code_col) if c]
+    fast = {year_col: "float64", value_col: "float64"}
+    for col in (country_col, code_col):
+        if col:
+            fast[col] = "object"
+    consumed = 0
+    # Fast path: numeric columns parsed straight to float64. Only reading is
+    # guarded, so an error while cleaning a batch is never mistaken for a
+    # parse failure, and consumed counts only the rows already yielded.
+    with _read_batches(path, usecols, fast, chunksize) as reader:
+        while True:
+            try:
+                batch = next(reader)
+            except StopIteration:
+                return
+            except ValueError:
+                break
+            consumed += len(batch)
+            yield _clean_frame(_standardize_long_format(batch, value_name), value_name, index)
+    # A non-numeric token (e.g. "..") in the next batch: stream the rest of
+    # the file as text and let _clean_frame coerce, exactly like load_and_clean.
+    with pd.read_csv(path, usecols=usecols, dtype="object", chunksize=chunksize,
+                     skiprows=range(1, consumed + 1)) as rest:
+        for batch in rest:
+            yield _clean_frame(_standardize_long_format(batch, value_name), value_name, index)
+
+def _count_countries(path: Path, value_name: str, chunksize: int, index=None) -> pd.Series:
+    """Rows per (canonical, when index is given) country name."""
+    country_col, _, _, code_col = _raw_columns(path, value_name)
+    if country_col is None:
+        with raw_store.open_text(path) as f:
+            default = INDICATORS.get(value_name, {}).get("default_country", "World")
+            if index is not None:
+                default = index.canonical_name(default)
+            return pd.Series({default: sum(1 for _ in f) - 1})
+    counts = []
+    usecols = [c for c in (country_col, code_col) if c]
+    for batch in pd.read_csv(path, usecols=usecols, dtype=object, chunksize=chunksize):
+        names = batch[country_col].astype(str).str.strip()
+        if index is not None:
+            names = index.canonicalize(names, batch[code_col] if code_col else None)
+        counts.append(names.value_counts())
+    return pd.concat(counts).groupby(level=0).sum() if counts else pd.Series(dtype="int64")
+
+# ───────────────────────────────
+# Bucket planning
+# ───────────────────────────────
+def plan_buckets(counts: pd.Series, memory_budget_mb: int) -> list:
+    """Split the sorted countries into contiguous ranges that fit the budget.
+
+    Returns the first country of every bucket after the first; a name's
+    bucket is searchsorted(boundaries, name, side="right").
+    """
+    budget_rows = max(1, memory_budget_mb * 1024 * 1024 // BYTES_PER_ROW)
+    boundaries, rows = [], 0
+    for country, n in counts.sort_index().items():
+        if rows and rows + n > budget_rows:
+            boundaries.append(country)
+            rows = 0
+        rows += n
+    return boundaries
+
+def _bucket_of(names: pd.Series, boundaries: list) -> np.ndarray:
+    if not boundaries:
+        return np.zeros(len(names), dtype=np.int64)
+    return np.searchsorted(np.array(boundaries, dtype=object), names.to_numpy(dtype=object),
+                           side="right")
+
+# ───────────────────────────────
+# Engine entry point
+# ───────────────────────────────
+def merge_chunked(files: dict, out_dir: Path, chunksize: int = DEFAULT_CHUNKSIZE,
+                  memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB,
+                  partition_by_year: bool = False, export_csv: bool = False,
+                  spill_dir: Path = None, index=None) -> Path:
+    """Stream files → clean_data.parquet in out_dir without materializing the merged frame.
+
+    index (a countries.CountryIndex) canonicalizes names before bucketing,
+    so every spelling of a country lands in the same bucket.
+    """
+    out_path = out_dir / "clean_data.parquet"
+    _clear_output(out_path)
+    csv_path = out_dir / "clean_data.csv"
+    if export_csv and csv_path.exists():
+        csv_path.unlink()
+
+    # 1-2. Count rows per country, then plan country-range buckets.
+    counts = pd.concat([_count_countries(p, name, chunksize, index) for name, p in files.items()])
+    counts = counts.groupby(level=0).sum()
+    boundaries = plan_buckets(counts, memory_budget_mb)
+    n_buckets = len(boundaries) + 1
+    print(f" Streaming {len(files)} sources in {n_buckets} bucket(s) "
+          f"(chunksize={chunksize:,}, budget={memory_budget_mb} MB)")
+
+    with tempfile.TemporaryDirectory(dir=spill_dir, prefix="clean_spill_") as tmp:
+        tmp = Path(tmp)
+
+        # 3. Spill cleaned batches into per-source, per-bucket Parquet files.
+        spill_schemas = {}
+        for name, path in files.items():
+            schema = pa.schema([("country_name", pa.string()), ("year", pa.int64()),
+                                processed_schema([name]).field(name)])
+            spill_schemas[name] = schema
+            writers = {}
+            try:
+                with span("transform.chunked.spill", source=name,
+                          bytes_read=Path(path).stat().st_size) as spill_span:
+                    for batch in iter_clean_batches(path, name, chunksize, index):
+                        spill_span.count(rows_out=len(batch), batches=1)
+                        buckets = _bucket_of(batch["country_name"], boundaries)
+                        for b in np.unique(buckets):
+                            part = batch[buckets == b]
+                            if b not in writers:
+                                writers[b] = pq.ParquetWriter(tmp / f"{name}_{b}.parquet", schema)
+                            writers[b].write_table(
+                                pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+            finally:
+                for w in writers.values():
+                    w.close()
+
+        # 4. Merge bucket by bucket and append to the processed output.
+        writer = None
+        try:
+            for b in range(n_buckets):
+                with span("transform.chunked.merge_bucket", bucket=b) as bucket_span:
+                    frames = {}
+                    for name, schema in spill_schemas.items():
+                        spill = tmp / f"{name}_{b}.parquet"
+                        table = pq.read_table(spill) if spill.exists() else schema.empty_table()
+                        frames[name] = _compact_columns(table.to_pandas(), [name])
+                        if spill.exists():
+                            spill.unlink()
+                    merged = _merge_frames(frames)
+                    bucket_span.count(rows_out=len(merged))
+                    if merged.empty:
+                        continue
+                    table = to_arrow(merged)
+                    if partition_by_year:
+                        pq.write_to_dataset(table, root_path=out_path, partition_cols=["year"],
+                                            basename_template=f"bucket-{b}-{{i}}.parquet")
+                    else:
+                        if writer is None:
+                            writer = pq.ParquetWriter(out_path, table.schema)
+                        writer.write_table(table)
+                    if export_csv:
+                        merged.to_csv(csv_path, mode="a", header=not csv_path.exists(), index=False)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    if writer is None and not partition_by_year:
+        pq.write_table(processed_schema(list(files)).empty_table(), out_path)
+    print(f" Cleaned dataset saved to {out_path}")
+    return out_path
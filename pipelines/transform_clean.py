@@ -1,30 +1,202 @@
 """
 Step 3: Transform, Clean & Profile
-Cleans Population, GDP, and CO₂ data, merges into one CSV,
-and generates data-quality visuals.
+Cleans every registered indicator (Population, GDP and CO₂ by default),
+merges them into one Parquet file (optionally partitioned by year, with an
+opt-in CSV export), and generates data-quality visuals.
+
+New sources are added with register_indicator(); each one is cleaned in
+its own worker process and all of them are combined in a single
+multi-way outer join on (country, year).
+
+Gaps are then filled per country with each indicator's strategy (see
+gapfill.py); <name>_imputed marks the filled values.
+
+Country names (and ISO3 codes, where a source has them) are mapped to one
+canonical name per country through an alias index built from the raw
+files (see countries.py), so spellings that differ between sources still
+join. The join itself runs on integer country keys. Names the index cannot
+resolve are kept and listed in data/reports/unmatched_countries.csv.
+
+In memory the merged frame is kept compact: country_name is categorical,
+year is int16, integer indicators are nullable Int64 (no float64
+round-trip) and float indicators use their registered dtype, so an
+indicator registered with dtype="float32" halves its footprint.
+
+Raw snapshots may be compressed (see raw_store.py); they are decompressed
+while being read. All paths are relative to the project root, whatever
+the working directory.
 """
 
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import logging
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+import countries
+import gapfill
+import profiler
+import raw_store
+from instrumentation import attach, capture, pipeline_run, span
+from stage_cache import hash_file, stage_key
+
 # ───────────────────────────────
 # Setup
 # ───────────────────────────────
-RAW_DIR = Path("data/raw")
-PROCESSED_DIR = Path("data/processed")
-REPORT_DIR = Path("data/reports")
-LOG_DIR = Path("logs")
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PIPELINES_DIR = PROJECT_ROOT / "pipelines"
+LOG_DIR = PROJECT_ROOT / "logs"
+STATE_NAME = "transform_state.json"
+CHANGES_NAME = "clean_data_changes.parquet"
+
+# Every module whose code shapes the processed output: the flow's stage
+# cache key and the incremental state hash them, so a new helper module of
+# the transform goes here.
+TRANSFORM_MODULES = [
+    "transform_clean.py", "transform_duckdb.py", "transform_chunked.py",
+    "transform_incremental.py", "countries.py", "raw_store.py", "profiler.py", "gapfill.py",
+]
+
+def transform_code() -> list:
+    """Paths of TRANSFORM_MODULES."""
+    return [PIPELINES_DIR / name for name in TRANSFORM_MODULES]
+
+def use_data_dir(data_dir: Path):
+    """Read raw files from and write outputs to data_dir (default: the project's data/)."""
+    global DATA_DIR, RAW_DIR, PROCESSED_DIR, REPORT_DIR, CACHE_DIR, COUNTRY_INDEX_PATH
+    DATA_DIR = Path(data_dir)
+    RAW_DIR = DATA_DIR / "raw"
+    PROCESSED_DIR = DATA_DIR / "processed"
+    REPORT_DIR = DATA_DIR / "reports"
+    CACHE_DIR = DATA_DIR / ".cache"
+    COUNTRY_INDEX_PATH = CACHE_DIR / "country_index.json"
+
+use_data_dir(PROJECT_ROOT / "data")
 
-for d in [PROCESSED_DIR, REPORT_DIR, LOG_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
+logger = logging.getLogger("transform_clean")
 
-logging.basicConfig(
-    filename=LOG_DIR / "transform_clean.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+def _setup():
+    """Create output dirs and attach the transform_clean.log handler (on first use, not at import)."""
+    for d in [PROCESSED_DIR, REPORT_DIR, LOG_DIR]:
+        d.mkdir(parents=True, exist_ok=True)
+    if not logger.handlers:
+        handler = logging.FileHandler(LOG_DIR / "transform_clean.log")
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+# ───────────────────────────────
+# Indicator registry
+# ───────────────────────────────
+# name → how to find and read its raw snapshots:
+#   pattern          glob under RAW_DIR (compressed snapshots match too); the
+#                    lexicographically latest match is used
+#   columns          normalized raw column for "country", "year" and "value"
+#                    ("country": None → every row belongs to default_country);
+#                    omit to auto-detect one of the known layouts
+#   default_country  country for country-less layouts
+#   dtype            Arrow type of the column in clean_data.parquet (integer
+#                    types are held as nullable Int64 in memory)
+#   fill / max_gap   gap-filling strategy ("ffill", "interpolate" or "none")
+#                    and the most missing years in a row it may fill
+#                    (None: no limit); see gapfill.py. The default, an
+#                    unlimited forward fill, is what the pipeline has always
+#                    done; an indicator opts in to interpolation or a limit.
+INDICATORS = {}
+
+def register_indicator(name: str, pattern: str, columns: dict = None,
+                       default_country: str = "World", dtype: str = "float64",
+                       fill: str = "ffill", max_gap: int = None):
+    """Add (or replace) an indicator; it becomes a column of clean_data (plus <name>_imputed)."""
+    if fill not in gapfill.STRATEGIES:
+        raise ValueError(f"Unknown gap-fill strategy for {name}: {fill}")
+    INDICATORS[name] = {
+        "pattern": pattern,
+        "columns": columns,
+        "default_country": default_country,
+        "dtype": dtype,
+        "fill": fill,
+        "max_gap": max_gap,
+    }
+
+def fill_spec(name: str) -> tuple:
+    """(strategy, max_gap) used to fill indicator name."""
+    spec = INDICATORS.get(name, {})
+    return spec.get("fill", "ffill"), spec.get("max_gap")
+
+register_indicator("population", "population_*.csv",
+                   columns={"country": "country_name", "year": "year", "value": "value"},
+                   dtype="int64")
+register_indicator("gdp", "gdp_*.csv",
+                   columns={"country": "country_name", "year": "year", "value": "value"})
+register_indicator("co2_emissions", "co2_emissions_*.csv",
+                   columns={"country": None, "year": "year", "value": "total"})
+
+def processed_schema(names=None) -> pa.Schema:
+    """Explicit schema for the processed hand-off to load_to_duckdb."""
+    names = list(INDICATORS) if names is None else names
+    fields = [
+        ("country_name", pa.dictionary(pa.int32(), pa.string())),
+        ("year", pa.int32()),
+    ]
+    for name in names:
+        fields.append((name, pa.type_for_alias(INDICATORS.get(name, {}).get("dtype", "float64"))))
+    fields += [(gapfill.imputed_column(name), pa.bool_()) for name in names]
+    return pa.schema(fields)
+
+def indicator_columns(columns) -> list:
+    """The indicator columns among columns (not the keys or the imputation masks)."""
+    return [c for c in columns if c not in ("country_name", "year")
+            and not c.endswith(gapfill.IMPUTED_SUFFIX)]
+
+# ───────────────────────────────
+# Compact in-memory dtypes
+# ───────────────────────────────
+YEAR_DTYPE = np.int16
+
+def memory_dtype(name: str) -> str:
+    """pandas dtype an indicator is held in: nullable Int64 for integer indicators."""
+    dtype = INDICATORS.get(name, {}).get("dtype", "float64")
+    return "Int64" if np.dtype(dtype).kind in "iu" else dtype
+
+def _compact_year(years: pd.Series) -> pd.Series:
+    bounds = np.iinfo(YEAR_DTYPE)
+    if years.empty or (years.min() >= bounds.min and years.max() <= bounds.max):
+        return years.astype(YEAR_DTYPE)
+    return years.astype("int64")
+
+def _compact_columns(df: pd.DataFrame, value_names) -> pd.DataFrame:
+    """Cast year and the given indicator columns to their compact in-memory dtypes."""
+    df["year"] = _compact_year(df["year"])
+    for name in value_names:
+        dtype = memory_dtype(name)
+        # Integer indicators may carry fractional values (e.g. 852664500.5 head-counts).
+        values = df[name].round() if dtype == "Int64" else df[name]
+        df[name] = values.astype(dtype)
+    return df
+
+def _from_float(values: np.ndarray, name: str):
+    """float64 values (NaN = missing) in name's memory dtype; integers rounded half-even."""
+    dtype = memory_dtype(name)
+    if dtype == "Int64":
+        missing = np.isnan(values)
+        return pd.arrays.IntegerArray(np.where(missing, 0, np.round(values)).astype(np.int64),
+                                      missing)
+    return values.astype(dtype)
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Compact dtypes for a merged frame: categorical country_name plus _compact_columns."""
+    df["country_name"] = df["country_name"].astype("category")
+    return _compact_columns(df, indicator_columns(df.columns))
 
 # ───────────────────────────────
 # Cleaning helpers (load_and_clean, merge_datasets)
@@ -33,84 +205,395 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
     return df
 
+def _detect_layout(columns) -> tuple:
+    """Return (country_col, year_col, value_col) for a normalized header.
+
+    country_col is None for the country-less ``Year,Total,...`` layout,
+    whose rows all belong to "World".
+    """
+    cols = set(columns)
+    if {"country_name", "year", "value"}.issubset(cols):
+        return "country_name", "year", "value"
+    if {"country", "year", "total"}.issubset(cols):
+        return "country", "year", "total"
+    if {"year", "total"}.issubset(cols) and "country" not in cols:
+        return None, "year", "total"
+    raise KeyError(f"Unexpected columns: {list(columns)}")
+
+def _layout_for(columns, value_name: str) -> tuple:
+    """(country_col, year_col, value_col) from the indicator's mapping, else auto-detected."""
+    mapping = INDICATORS.get(value_name, {}).get("columns")
+    if mapping is None:
+        return _detect_layout(columns)
+    missing = {c for c in mapping.values() if c} - set(columns)
+    if missing:
+        raise KeyError(f"{value_name}: columns {sorted(missing)} not in {list(columns)}")
+    return mapping["country"], mapping["year"], mapping["value"]
+
+def _code_column(columns, country_col):
+    """Normalized ISO3 code column of a layout with a country column, if the file has one."""
+    return "country_code" if country_col and "country_code" in set(columns) else None
+
 def _standardize_long_format(df: pd.DataFrame, value_name: str) -> pd.DataFrame:
     df = _normalize_columns(df)
-    if {"country_name", "year", "value"}.issubset(df.columns):
-        out = df[["country_name", "year", "value"]].copy()
-        out.rename(columns={"value": value_name}, inplace=True)
-        return out
-    if {"country", "year", "total"}.issubset(df.columns):
-        out = df[["country", "year", "total"]].copy()
-        out.rename(columns={"country": "country_name", "total": value_name}, inplace=True)
-        return out
-    if {"year", "total"}.issubset(df.columns) and "country" not in df.columns:
-        out = df[["year", "total"]].copy()
-        out.rename(columns={"total": value_name}, inplace=True)
-        out["country_name"] = "World"
+    country_col, year_col, value_col = _layout_for(df.columns, value_name)
+    if country_col is None:
+        out = df[[year_col, value_col]].copy()
+        out.rename(columns={year_col: "year", value_col: value_name}, inplace=True)
+        out["country_name"] = INDICATORS.get(value_name, {}).get("default_country", "World")
         return out[["country_name", "year", value_name]]
-    raise KeyError(f"Unexpected columns: {list(df.columns)}")
+    code_col = _code_column(df.columns, country_col)
+    cols = [country_col, year_col, value_col] + ([code_col] if code_col else [])
+    out = df[cols].copy()
+    out.rename(columns={country_col: "country_name", year_col: "year", value_col: value_name},
+               inplace=True)
+    return out
+
+def load_and_clean(path: Path, value_name: str,
+                   index: countries.CountryIndex = None) -> pd.DataFrame:
+    with span("transform.load_and_clean", source=value_name) as s:
+        # round_trip parsing is exact (the default fast parser can be off by 1 ulp)
+        df = pd.read_csv(path, float_precision="round_trip")
+        s.count(rows_in=len(df), bytes_read=Path(path).stat().st_size)
+        df = _clean_frame(_standardize_long_format(df, value_name), value_name, index)
+        s.count(rows_out=len(df))
+    return df
 
-def load_and_clean(path: Path, value_name: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    df = _standardize_long_format(df, value_name)
+def _load_and_clean_job(job) -> tuple:
+    # Worker processes may not see indicators registered at runtime, so the
+    # spec travels with the job; span records travel back with the result.
+    path, value_name, spec, index = job
+    INDICATORS[value_name] = spec
+    with capture() as records:
+        df = load_and_clean(path, value_name, index)
+    return df, records
+
+def _clean_frame(df: pd.DataFrame, value_name: str,
+                 index: countries.CountryIndex = None) -> pd.DataFrame:
+    """Coerce types and drop unusable rows of a standardized (long-format) frame.
+
+    With an index, country names are replaced by their canonical names.
+    """
     df["year"] = pd.to_numeric(df["year"], errors="coerce")
     df[value_name] = pd.to_numeric(df[value_name], errors="coerce")
     df = df.dropna(subset=["year", value_name])
     df["year"] = df["year"].astype(int)
     df["country_name"] = df["country_name"].astype(str).str.strip()
-    return df[["country_name", "year", value_name]]
-
-def merge_datasets() -> pd.DataFrame:
-    pop_file = sorted(RAW_DIR.glob("population_*.csv"))[-1]
-    gdp_file = sorted(RAW_DIR.glob("gdp_*.csv"))[-1]
-    co2_file = sorted(RAW_DIR.glob("co2_emissions_*.csv"))[-1]
-    pop = load_and_clean(pop_file, "population")
-    gdp = load_and_clean(gdp_file, "gdp")
-    co2 = load_and_clean(co2_file, "co2_emissions")
-    df = pop.merge(gdp, on=["country_name", "year"], how="outer")
-    df = df.merge(co2, on=["country_name", "year"], how="outer")
-    for col in ["population", "gdp", "co2_emissions"]:
-        if col in df.columns:
-            df.loc[df[col] < 0, col] = pd.NA
-            df[col] = df.groupby("country_name")[col].ffill()
-    df = df.sort_values(["country_name", "year"])
-    out_path = PROCESSED_DIR / "clean_data.csv"
-    df.to_csv(out_path, index=False)
-    print(f" Cleaned dataset saved to {out_path}")
+    if index is not None:
+        df["country_name"] = index.canonicalize(df["country_name"], df.get("country_code"))
+    df["country_name"] = df["country_name"].astype("category")
+    return _compact_columns(df, [value_name])[["country_name", "year", value_name]]
+
+def latest_raw_files(raw_dir: Path = None) -> dict:
+    """Map each registered indicator to the newest raw snapshot for its source."""
+    raw_dir = raw_dir or RAW_DIR
+    files = {}
+    for name, spec in INDICATORS.items():
+        matches = raw_store.find_snapshots(raw_dir, spec["pattern"])
+        if not matches:
+            raise FileNotFoundError(f"No raw file for {name} ({raw_dir / spec['pattern']})")
+        files[name] = matches[-1]
+    return files
+
+# ───────────────────────────────
+# Country alias index
+# ───────────────────────────────
+def _country_pairs(path: Path, value_name: str) -> pd.DataFrame:
+    """Distinct (country_name, country_code) pairs of a raw file with their row counts."""
+    raw = {c.strip().lower().replace(" ", "_"): c for c in pd.read_csv(path, nrows=0).columns}
+    header = list(raw)
+    country_col, _, _ = _layout_for(header, value_name)
+    if country_col is None:
+        with raw_store.open_text(path) as f:
+            rows = sum(1 for _ in f) - 1
+        default = INDICATORS.get(value_name, {}).get("default_country", "World")
+        return pd.DataFrame({"country_name": [default], "country_code": [None], "rows": [rows]})
+    code_col = _code_column(header, country_col)
+    usecols = [raw[country_col]] + ([raw[code_col]] if code_col else [])
+    df = pd.read_csv(path, usecols=usecols, dtype=str, keep_default_na=True)
+    df.columns = ["country_name"] + (["country_code"] if code_col else [])
+    df["country_name"] = df["country_name"].astype(str).str.strip()
+    if not code_col:
+        df["country_code"] = None
+    pairs = df.groupby(["country_name", "country_code"], dropna=False, sort=False).size()
+    return pairs.rename("rows").reset_index()
+
+def country_index(files: dict) -> countries.CountryIndex:
+    """Alias index for this set of raw files (cached per file contents); reports unmatched names."""
+    _setup()
+    key = stage_key("country_index", inputs=files.values(),
+                    code=[Path(countries.__file__)],
+                    params={name: INDICATORS.get(name, {}) for name in files})
+    cached = countries.load_index(key, COUNTRY_INDEX_PATH)
+    if cached is not None:
+        index, missing = cached
+    else:
+        with span("transform.country_index", sources=len(files)) as s:
+            pairs = {name: _country_pairs(path, name) for name, path in files.items()}
+            index = countries.CountryIndex.build(
+                (n, c) for p in pairs.values() for n, c in zip(p["country_name"], p["country_code"]))
+            missing = [
+                {"source": name, "country_name": row.country_name, "rows": int(row.rows)}
+                for name, p in pairs.items()
+                for row in countries.unmatched(index, p).itertuples()
+            ]
+            s.count(countries=len(index.names), aliases=len(index.aliases), unmatched=len(missing))
+        countries.save_index(index, key, missing, COUNTRY_INDEX_PATH)
+
+    report_path = REPORT_DIR / "unmatched_countries.csv"
+    pd.DataFrame(missing, columns=["source", "country_name", "rows"]).to_csv(report_path, index=False)
+    if missing:
+        logger.warning(f"{len(missing)} country name(s) not in the alias index; see {report_path}")
+        print(f" {len(missing)} unmatched country name(s) — see {report_path}")
+    return index
+
+def clean_all(files: dict, workers: int = None, index: countries.CountryIndex = None) -> dict:
+    """load_and_clean every source, in parallel worker processes when workers > 1."""
+    workers = min(len(files), os.cpu_count() or 1) if workers is None else workers
+    if workers <= 1 or len(files) <= 1:
+        return {name: load_and_clean(path, name, index) for name, path in files.items()}
+    jobs = [(path, name, INDICATORS.get(name, {}), index) for name, path in files.items()]
+    frames = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, (df, records) in zip(files, pool.map(_load_and_clean_job, jobs)):
+            attach(records)
+            frames[name] = df
+    return frames
+
+def _outer_join(frames: dict) -> pd.DataFrame:
+    """Single multi-way outer join of all sources on (country, year).
+
+    Country names and years are factorized into shared, sorted code sets
+    and combined into one int64 key per row, so the join is a sorted union
+    of integer keys plus one take() per column — no hashing of strings or
+    MultiIndex tuples. Returns a frame sorted by (country_name, year) with
+    a categorical country_name.
+    """
+    keys = ["country_name", "year"]
+    countries_of = {name: f["country_name"].astype("category").cat for name, f in frames.items()}
+    names = pd.Index(pd.unique(np.concatenate(
+        [c.categories.to_numpy(dtype=object) for c in countries_of.values()]))).sort_values()
+    years = np.unique(np.concatenate([f["year"].to_numpy() for f in frames.values()]))
+    row_keys = {
+        name: names.get_indexer(c.categories)[c.codes].astype(np.int64) * len(years)
+              + np.searchsorted(years, frames[name]["year"].to_numpy())
+        for name, c in countries_of.items()
+    }
+    if all(len(np.unique(k)) == len(k) for k in row_keys.values()):
+        union = np.unique(np.concatenate(list(row_keys.values())))
+        df = pd.DataFrame({
+            "country_name": pd.Categorical.from_codes(union // len(years), names),
+            "year": years[union % len(years)],
+        })
+        for name, f in frames.items():
+            # Row of f holding each union key, -1 (→ missing) where f has none.
+            rows = np.full(len(union), -1, dtype=np.int64)
+            rows[np.searchsorted(union, row_keys[name])] = np.arange(len(f))
+            for col in f.columns.drop(keys):
+                df[col] = f[col].array.take(rows, allow_fill=True)
+        return df
+    # Duplicate keys inside a source: keep merge()'s many-to-many semantics.
+    logger.warning("Duplicate (country_name, year) keys found; using pairwise merges")
+    sources = list(frames)
+    df = frames[sources[0]]
+    for name in sources[1:]:
+        df = df.merge(frames[name], on=keys, how="outer")
+    df["country_name"] = pd.Categorical(df["country_name"], categories=names)
+    return df.sort_values(keys, kind="stable", ignore_index=True)
+
+def _merge_frames(frames: dict) -> pd.DataFrame:
+    """Outer-join cleaned per-source frames, null negatives and fill gaps per country."""
+    names = list(frames)
+    with span("transform.outer_join", sources=len(frames),
+              rows_in=sum(len(f) for f in frames.values())) as s:
+        df = _outer_join(frames)
+        s.count(rows_out=len(df))
+    with span("transform.gapfill", rows_in=len(df)) as s:
+        # df is already sorted by (country, year): every country is one segment.
+        first, last = gapfill.segment_bounds(df["country_name"].cat.codes.to_numpy())
+        years = df["year"].to_numpy()
+        cols = [c for c in names if c in df.columns]
+        for col in cols:
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            values[values < 0] = np.nan
+            filled, imputed = gapfill.fill_gaps(values, years, first, last, *fill_spec(col))
+            df[col] = _from_float(filled, col)
+            df[gapfill.imputed_column(col)] = imputed
+            s.count(imputed=int(imputed.sum()))
+        return df
+
+def _merge_pandas(files: dict, workers: int = None,
+                  index: countries.CountryIndex = None) -> pd.DataFrame:
+    return _merge_frames(clean_all(files, workers, index))
+
+def merge_datasets(partition_by_year: bool = False, export_csv: bool = False,
+                   engine: str = "pandas", chunksize: int = None,
+                   memory_budget_mb: int = None, workers: int = None,
+                   incremental: bool = False):
+    """Clean and merge the latest raw files with the chosen engine.
+
+    engine is "pandas", "duckdb" or "chunked". The chunked engine streams
+    the raw files within memory_budget_mb and writes the processed output
+    itself, so it returns None instead of the merged frame. workers caps
+    the process pool used to clean sources in parallel (pandas engine).
+
+    incremental=True re-transforms only the countries whose raw rows changed
+    since the last run (see transform_incremental.py) and returns just that
+    slice, with df.attrs["scope"] set; it falls back to a full merge when
+    that is not possible.
+    """
+    _setup()
+    files = latest_raw_files()
+    logger.info(f"Merging {', '.join(str(p) for p in files.values())} with {engine} engine")
+    if engine not in ("pandas", "duckdb", "chunked"):
+        raise ValueError(f"Unknown transform engine: {engine}")
+    index = country_index(files)
+    state_path = CACHE_DIR / STATE_NAME
+    if incremental and (partition_by_year or export_csv):
+        print(" Incremental transform not possible with a partitioned output or a CSV export; "
+              "running a full transform")
+    elif incremental:
+        from transform_incremental import merge_incremental
+        if engine != "pandas":
+            # The changed slice is small, so it is always re-merged in memory.
+            print(f" Incremental transform re-merges the changed countries with pandas; "
+                  f"the {engine} engine only runs if a full transform is needed")
+        df = merge_incremental(files, index, PROCESSED_DIR, state_path)
+        if df is not None:
+            return df
+    (PROCESSED_DIR / CHANGES_NAME).unlink(missing_ok=True)
+    state_path.unlink(missing_ok=True)
+    if engine == "chunked":
+        from transform_chunked import merge_chunked, DEFAULT_CHUNKSIZE, DEFAULT_MEMORY_BUDGET_MB
+        merge_chunked(files, PROCESSED_DIR,
+                      chunksize=chunksize or DEFAULT_CHUNKSIZE,
+                      memory_budget_mb=memory_budget_mb or DEFAULT_MEMORY_BUDGET_MB,
+                      partition_by_year=partition_by_year, export_csv=export_csv, index=index)
+        record_state(files, index, PROCESSED_DIR / "clean_data.parquet", partition_by_year,
+                     state_path)
+        return None
+    if engine == "duckdb":
+        from transform_duckdb import merge_duckdb
+        df = compact_frame(merge_duckdb(files, index=index))
+    else:
+        df = _merge_pandas(files, workers, index)
+    out_path = write_processed(df, partition_by_year=partition_by_year, export_csv=export_csv)
+    record_state(files, index, out_path, partition_by_year, state_path)
     return df
 
+# ───────────────────────────────
+# Transform state (read by transform_incremental.py)
+# ───────────────────────────────
+def _code_hash() -> str:
+    return stage_key("transform_code", code=transform_code())
+
+def record_state(files: dict, index, out_path: Path, partitioned: bool, state_path: Path):
+    """Remember the raw snapshots (and their hashes), fill settings and code behind the processed output."""
+    state = {
+        "files": {name: str(path) for name, path in files.items()},
+        "hashes": {name: hash_file(path) for name, path in files.items()},
+        "index": index.to_json(),
+        "fill": {name: list(fill_spec(name)) for name in files},
+        "code": _code_hash(),
+        "output": str(out_path),
+        "partitioned": partitioned,
+    }
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(state_path, "w") as f:
+        json.dump(state, f, indent=2)
+
+# ───────────────────────────────
+# Processed output (Parquet + optional CSV)
+# ───────────────────────────────
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    """Convert the merged frame to an Arrow table with the processed schema."""
+    schema = processed_schema(indicator_columns(df.columns))
+    # A few World Bank aggregates carry fractional head-counts (e.g. 852664500.5);
+    # round integer columns so the int64 cast is exact.
+    int_cols = [f.name for f in schema if pa.types.is_integer(f.type)]
+    df = df.assign(**{c: df[c].round() for c in int_cols})
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    return table.replace_schema_metadata(None)
+
+def _clear_output(out_path: Path):
+    if out_path.is_dir():
+        shutil.rmtree(out_path)
+    elif out_path.exists():
+        out_path.unlink()
+
+def write_processed(df: pd.DataFrame, out_dir: Path = None,
+                    partition_by_year: bool = False, export_csv: bool = False) -> Path:
+    """Write clean_data.parquet (a single file, or a year-partitioned dataset directory)."""
+    out_dir = out_dir or PROCESSED_DIR
+    out_path = out_dir / "clean_data.parquet"
+    _clear_output(out_path)
+
+    with span("transform.write", rows_out=len(df), partitioned=partition_by_year) as s:
+        table = to_arrow(df)
+        if partition_by_year:
+            pq.write_to_dataset(table, root_path=out_path, partition_cols=["year"])
+            s.count(bytes_written=sum(f.stat().st_size for f in out_path.rglob("*.parquet")))
+        else:
+            pq.write_table(table, out_path)
+            s.count(bytes_written=out_path.stat().st_size)
+    print(f" Cleaned dataset saved to {out_path}")
+
+    if export_csv:
+        csv_path = out_dir / "clean_data.csv"
+        df.to_csv(csv_path, index=False)
+        print(f" CSV export saved to {csv_path}")
+    return out_path
+
 # ───────────────────────────────
 # 🔍 Data-quality visualizations
 # ───────────────────────────────
-def create_visuals(df: pd.DataFrame):
-    """Lightweight data-quality summary + charts (no profiling package)."""
-    summary_path = REPORT_DIR / "data_quality_summary.txt"
-
-    # 1️⃣ Save quick stats
-    with open(summary_path, "w") as f:
-        f.write("=== Basic Dataset Summary ===\n")
-        f.write(f"Rows: {len(df)}\nColumns: {list(df.columns)}\n\n")
-        f.write("=== Missing Values ===\n")
-        f.write(str(df.isna().sum()))
-        f.write("\n\n=== Data Types ===\n")
-        f.write(str(df.dtypes))
-        f.write("\n\n=== Numeric Summary ===\n")
-        f.write(str(df.describe().T))
-    print(f" Text summary saved to {summary_path}")
-
-    # 2️⃣ Missing-value heatmap
-    plt.figure(figsize=(10, 5))
-    plt.imshow(df.isna(), aspect="auto", interpolation="nearest", cmap="viridis")
-    plt.title("Missing Values Heatmap")
-    plt.xlabel("Columns")
-    plt.ylabel("Rows")
-    plt.tight_layout()
-    plt.savefig(REPORT_DIR / "missing_heatmap.png")
-    plt.close()
+HEATMAP_BINS = 500
+
+def binned_null_mask(df: pd.DataFrame, bins: int = HEATMAP_BINS) -> np.ndarray:
+    """(bins × columns) share of missing values per contiguous block of rows."""
+    n = len(df)
+    if n == 0:
+        return np.zeros((1, len(df.columns)))
+    starts = np.linspace(0, n, min(bins, n) + 1).astype(np.int64)[:-1]
+    sizes = np.diff(np.append(starts, n))
+    shares = np.empty((len(starts), len(df.columns)))
+    for j, col in enumerate(df.columns):
+        missing = df[col].isna().to_numpy(dtype=np.int64)
+        shares[:, j] = np.add.reduceat(missing, starts) / sizes
+    return shares
+
+def create_visuals(df: pd.DataFrame = None, profile: profiler.DataProfile = None):
+    """Data-quality profile, summary + charts (see profiler.py).
+
+    df is profiled chunk by chunk unless a profile is given; without df
+    (chunked engine, incremental run) the row-block heatmap is skipped.
+    """
+    _setup()
+
+    # 1️⃣ Profile (one streaming pass) → JSON profile + text summary
+    with span("transform.profile") as s:
+        profile = profile or profiler.profile_frame(df)
+        s.count(rows_in=profile.rows)
+    json_path, summary_path = profiler.write_profile(profile, REPORT_DIR)
+    print(f" Text summary saved to {summary_path}, profile to {json_path}")
+
+    # 2️⃣ Missing-value heatmap (binned: share missing per block of rows)
+    if df is not None:
+        shares = binned_null_mask(df)
+        plt.figure(figsize=(10, 5))
+        plt.imshow(shares, aspect="auto", interpolation="nearest", cmap="viridis", vmin=0, vmax=1)
+        plt.colorbar(label="Share missing")
+        plt.xticks(range(len(df.columns)), df.columns, rotation=45, ha="right")
+        plt.title("Missing Values Heatmap")
+        plt.xlabel("Columns")
+        plt.ylabel(f"Rows ({len(df):,} in {len(shares)} bins)")
+        plt.tight_layout()
+        plt.savefig(REPORT_DIR / "missing_heatmap.png")
+        plt.close()
 
     # 3️⃣ Missing counts per column
     plt.figure(figsize=(6, 4))
-    df.isna().sum().plot(kind="bar")
+    profile.null_counts().plot(kind="bar")
     plt.title("Missing Values per Column")
     plt.ylabel("Count")
     plt.tight_layout()
@@ -122,7 +605,51 @@ def create_visuals(df: pd.DataFrame):
 # ───────────────────────────────
 # Main
 # ───────────────────────────────
+def run(partition_by_year: bool = False, export_csv: bool = False,
+        engine: str = "pandas", visuals: bool = True, **engine_options):
+    """Whole transform stage: merge, write processed output, profile.
+
+    Returns the merged frame (None for the chunked engine, which never
+    materializes it), or only the changed slice for an incremental run.
+    """
+    with span("transform", engine=engine) as s:
+        df = merge_datasets(partition_by_year=partition_by_year, export_csv=export_csv,
+                            engine=engine, **engine_options)
+        if df is not None:
+            s.count(rows_out=len(df))
+        if visuals and (df is None or "scope" in df.attrs):
+            # Chunked engine (no merged frame) or incremental run (only the
+            # changed slice): profile the written output in one streaming pass.
+            with span("transform.visuals"):
+                create_visuals(profile=profiler.profile_parquet(
+                    PROCESSED_DIR / "clean_data.parquet", columns=processed_schema().names))
+        elif visuals:
+            with span("transform.visuals"):
+                create_visuals(df)
+    if visuals:
+        print(" Data profiling complete! Check data/reports/ for visuals.")
+    return df
+
 if __name__ == "__main__":
-    df = merge_datasets()
-    create_visuals(df)
-    print(" Data profiling complete! Check data/reports/ for visuals.")
+    parser = argparse.ArgumentParser(description="Clean and merge raw datasets.")
+    parser.add_argument("--partition-by-year", action="store_true",
+                        help="Write clean_data.parquet as a year-partitioned dataset.")
+    parser.add_argument("--csv", action="store_true",
+                        help="Also export data/processed/clean_data.csv.")
+    parser.add_argument("--engine", choices=["pandas", "duckdb", "chunked"], default="pandas",
+                        help="Run the clean/merge/gap-fill in pandas, inside DuckDB, or "
+                             "streamed in bounded-memory chunks.")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Rows per raw-file batch (chunked engine).")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Peak memory budget for the merge (chunked engine).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to clean sources in parallel (pandas engine).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-transform only countries whose raw rows changed since the last "
+                             "run; writes the changed slice to clean_data_changes.parquet.")
+    args = parser.parse_args()
+    with pipeline_run("transform_clean"):
+        run(partition_by_year=args.partition_by_year, export_csv=args.csv, engine=args.engine,
+            chunksize=args.chunksize, memory_budget_mb=args.memory_budget_mb,
+            workers=args.workers, incremental=args.incremental)
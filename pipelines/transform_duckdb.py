@@ -0,0 +1,195 @@
+"""
+Step 3 (alt engine): Transform & Clean inside DuckDB
+----------------------------------------------------
+Same job as transform_clean's pandas path — normalize columns, coerce
+numbers, drop unparseable rows, null out negatives, outer join every
+registered indicator on (country_name, year) and fill gaps per country
+(each indicator's gapfill.py strategy, with its <name>_imputed mask) —
+expressed as one DuckDB query so it runs multi-threaded and out of
+pandas' memory.
+
+Country names are canonicalized with the same alias index as the pandas
+path: each source's distinct (name, code) pairs are resolved once in
+Python and joined back as a small mapping table.
+
+Used via: python pipelines/transform_clean.py --engine duckdb
+"""
+
+import duckdb
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+import gapfill
+from instrumentation import span
+from transform_clean import INDICATORS, _code_column, _layout_for, fill_spec
+
+# Tokens pandas.read_csv treats as missing by default; mirrored here so
+# both engines agree on which rows survive cleaning.
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null",
+]
+
+# ───────────────────────────────
+# SQL builders
+# ───────────────────────────────
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _read_csv_sql(path: Path) -> str:
+    nullstr = ", ".join("'" + v.replace("'", "''") + "'" for v in PANDAS_NA_VALUES)
+    return f"read_csv('{path}', header = true, all_varchar = true, nullstr = [{nullstr}])"
+
+def _as_number(column: str) -> str:
+    # TRY_CAST mirrors pd.to_numeric(errors="coerce"); NaN is treated as missing.
+    return f"NULLIF(TRY_CAST({column} AS DOUBLE), 'NaN'::DOUBLE)"
+
+def _register_country_map(con, table: str, source: str, name_expr: str, code_expr: str, index):
+    """Resolve a source's distinct (name, code) pairs and register them on con as table."""
+    pairs = con.execute(f"SELECT DISTINCT {name_expr}, {code_expr} FROM {source}").fetchall()
+    mapping = pd.DataFrame(pairs, columns=["raw_name", "raw_code"], dtype=object)
+    mapping["country_name"] = [index.canonical_name(n, c) for n, c in pairs]
+    con.register(table, mapping)
+
+def _clean_source_sql(con, path: Path, value_name: str, index=None) -> str:
+    """SELECT country_name, year, <value_name> for one raw CSV (load_and_clean in SQL)."""
+    raw_cols = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM {_read_csv_sql(path)}").fetchall()]
+    normalized = {c.strip().lower().replace(" ", "_"): c for c in raw_cols}
+    country_col, year_col, value_col = _layout_for(normalized, value_name)
+    source = f"{_read_csv_sql(path)} AS src"
+    join = ""
+
+    if country_col is None:
+        default = INDICATORS.get(value_name, {}).get("default_country", "World")
+        if index is not None:
+            default = index.canonical_name(default)
+        country_expr = "'" + default.replace("'", "''") + "'"
+    else:
+        # astype(str).str.strip(): missing names become the literal "nan"
+        country_expr = (f"COALESCE(regexp_replace(src.{_quote(normalized[country_col])}, "
+                        r"'^\s+|\s+$', '', 'g'), 'nan')")
+        if index is not None:
+            code_col = _code_column(normalized, country_col)
+            code_expr = f"src.{_quote(normalized[code_col])}" if code_col else "NULL::VARCHAR"
+            table = f"_countries_{value_name}"
+            _register_country_map(con, table, source, country_expr, code_expr, index)
+            join = (f"LEFT JOIN {table} AS m ON m.raw_name = {country_expr} "
+                    f"AND m.raw_code IS NOT DISTINCT FROM {code_expr}")
+            country_expr = "m.country_name"
+    year_expr = _as_number(f"src.{_quote(normalized[year_col])}")
+    value_expr = _as_number(f"src.{_quote(normalized[value_col])}")
+    return f"""
+        SELECT {country_expr} AS country_name,
+               CAST(TRUNC({year_expr}) AS BIGINT) AS year,
+               {value_expr} AS {value_name}
+        FROM {source}
+        {join}
+        WHERE {year_expr} IS NOT NULL AND {value_expr} IS NOT NULL
+    """
+
+def _stored_sql(name: str, expr: str) -> str:
+    """expr as the pandas path holds it before filling (integers rounded half-even, float32)."""
+    dtype = np.dtype(INDICATORS.get(name, {}).get("dtype", "float64"))
+    if dtype.kind in "iu":
+        return f"round_even({expr}, 0)"
+    if dtype == np.float32:
+        return f"CAST({expr} AS FLOAT)"
+    return expr
+
+def _gapfill_sql(name: str) -> tuple:
+    """(value, imputed) expressions filling name from the gap CTE (see gapfill.fill_gaps)."""
+    strategy, max_gap = fill_spec(name)
+    if strategy == "none":
+        return name, "false"
+    prev, prev_year = f"_prev_{name}", f"_prev_year_{name}"
+    nxt, next_year = f"_next_{name}", f"_next_year_{name}"
+    if strategy == "ffill":
+        fill = f"{name} IS NULL AND {prev} IS NOT NULL"
+        if max_gap is not None:
+            fill += f" AND year - {prev_year} <= {int(max_gap)}"
+        return f"CASE WHEN {fill} THEN {prev} ELSE {name} END", fill
+    fill = f"{name} IS NULL AND {prev} IS NOT NULL AND {nxt} IS NOT NULL"
+    if max_gap is not None:
+        fill += f" AND {next_year} - {prev_year} - 1 <= {int(max_gap)}"
+    line = f"{prev} + ({nxt} - {prev}) * (year - {prev_year}) / ({next_year} - {prev_year})"
+    return f"CASE WHEN {fill} THEN {line} ELSE {name} END", fill
+
+def build_merge_sql(con, files: dict, index=None) -> str:
+    """Outer join all sources, null out negatives and fill gaps per country.
+
+    The outer join is one multi-way join: the union of every source's keys,
+    left-joined to each source. With an index (countries.CountryIndex),
+    mapping tables are registered on con, so the SQL must run on con.
+    """
+    names = list(files)
+    ctes = ",\n".join(
+        f"{name} AS ({_clean_source_sql(con, path, name, index)})" for name, path in files.items()
+    )
+    keys = "\n            UNION\n            ".join(
+        f"SELECT country_name, year FROM {name}" for name in names
+    )
+    joined = "keys"
+    for name in names:
+        joined += f"\n        LEFT JOIN {name} USING (country_name, year)"
+    values = ",\n                   ".join(
+        f"{_stored_sql(n, f'CASE WHEN {n} < 0 THEN NULL ELSE {n} END')} AS {n}" for n in names
+    )
+    # Previous / next observed value and year of every row, within its country.
+    neighbours = []
+    for n in names:
+        strategy = fill_spec(n)[0]
+        if strategy != "none":
+            neighbours += [f"LAST_VALUE({n} IGNORE NULLS) OVER before AS _prev_{n}",
+                           f"LAST_VALUE(CASE WHEN {n} IS NOT NULL THEN year END IGNORE NULLS) "
+                           f"OVER before AS _prev_year_{n}"]
+        if strategy == "interpolate":
+            neighbours += [f"FIRST_VALUE({n} IGNORE NULLS) OVER after AS _next_{n}",
+                           f"FIRST_VALUE(CASE WHEN {n} IS NOT NULL THEN year END IGNORE NULLS) "
+                           f"OVER after AS _next_year_{n}"]
+    fills = {n: _gapfill_sql(n) for n in names}
+    filled = ",\n               ".join(
+        [f"{value} AS {n}" for n, (value, _) in fills.items()]
+        + [f"{imputed} AS {gapfill.imputed_column(n)}" for n, (_, imputed) in fills.items()]
+    )
+    return f"""
+        WITH {ctes},
+        keys AS (
+            {keys}
+        ),
+        merged AS (
+            SELECT country_name, year,
+                   {values}
+            FROM {joined}
+        ),
+        gaps AS (
+            SELECT *{"".join(f", {e}" for e in neighbours)}
+            FROM merged
+            WINDOW before AS (PARTITION BY country_name ORDER BY year
+                              ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW),
+                   after AS (PARTITION BY country_name ORDER BY year
+                             ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING)
+        )
+        SELECT country_name, year,
+               {filled}
+        FROM gaps
+        ORDER BY country_name, year
+    """
+
+# ───────────────────────────────
+# Engine entry point
+# ───────────────────────────────
+def merge_duckdb(files: dict, threads: int = None, index=None) -> pd.DataFrame:
+    """DuckDB equivalent of transform_clean._merge_pandas; returns the same frame."""
+    con = duckdb.connect()
+    if threads:
+        con.execute(f"SET threads = {int(threads)};")
+    try:
+        with span("transform.duckdb_merge", sources=len(files),
+                  bytes_read=sum(Path(p).stat().st_size for p in files.values())) as s:
+            df = con.execute(build_merge_sql(con, files, index)).fetchdf()
+            s.count(rows_out=len(df))
+    finally:
+        con.close()
+    return df
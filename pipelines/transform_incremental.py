@@ -0,0 +1,212 @@
+"""
+Step 3 (incremental): Re-transform only what changed
+----------------------------------------------------
+Compares each source's newest raw snapshot with the snapshot the current
+processed output was built from (recorded in data/.cache/transform_state.json)
+and re-cleans and re-merges only the countries whose rows differ.
+
+  1. diff     row hashes of the standardized raw rows (country, code, year,
+              value) of both snapshots; a row present on one side only marks
+              its (canonical) country as affected, and so does a name the new
+              alias index maps to another country than the old one did
+  2. merge    every source's rows for the affected countries are cleaned,
+              joined and gap-filled — filling never crosses countries, so
+              no other country can change
+  3. patch    the affected countries' rows in clean_data.parquet are replaced
+              by the new slice, which is also written on its own to
+              clean_data_changes.parquet for an incremental load
+
+The slice's schema metadata lists the affected countries ("scope"), so
+the loader can also delete rows of those countries that disappeared.
+
+Falls back to a full transform (returns None) when there is no usable
+state: first run, a different set of indicators or gap-fill settings,
+changed transform code (transform_clean.TRANSFORM_MODULES), a partitioned
+output or one with other columns, or a base snapshot that is gone or was
+rewritten.
+
+Used via: python pipelines/transform_clean.py --incremental
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from countries import CountryIndex
+from instrumentation import span
+from stage_cache import hash_file
+from transform_clean import (
+    CHANGES_NAME, _clean_frame, _code_hash, _merge_frames, _standardize_long_format,
+    fill_spec, processed_schema, record_state, to_arrow,
+)
+
+SCOPE_KEY = b"scope"
+
+# ───────────────────────────────
+# State: what the processed output was built from (see transform_clean.record_state)
+# ───────────────────────────────
+def _same_snapshot(base: Path, path: Path) -> bool:
+    """Same file, or dated snapshots of one stored payload (see raw_store.py)."""
+    return Path(base).resolve() == Path(path).resolve()
+
+def _load_state(state_path: Path):
+    if not state_path.exists():
+        return None
+    with open(state_path) as f:
+        return json.load(f)
+
+def _full_reason(state, files: dict, out_path: Path):
+    """Why an incremental transform is not possible, or None if it is."""
+    if state is None:
+        return "no previous transform state"
+    if set(state["files"]) != set(files):
+        return "the set of indicators changed"
+    if state["partitioned"] or state["output"] != str(out_path) or not out_path.is_file():
+        return "no single-file processed output to patch"
+    if state.get("fill") != {name: list(fill_spec(name)) for name in files}:
+        return "the gap-fill settings changed"
+    if state.get("code") != _code_hash():
+        return "the transform code changed"
+    if pq.read_schema(out_path).names != processed_schema(list(files)).names:
+        return "the processed output has other columns"
+    for name, path in files.items():
+        base = Path(state["files"][name])
+        if not base.exists():
+            return f"base snapshot {base} is gone"
+        if _same_snapshot(base, path) and hash_file(path) != state["hashes"][name]:
+            return f"{path} was rewritten in place"
+    return None
+
+# ───────────────────────────────
+# Diff
+# ───────────────────────────────
+def _standardized(path: Path, value_name: str) -> pd.DataFrame:
+    # Parsed exactly as load_and_clean parses it.
+    df = pd.read_csv(path, float_precision="round_trip")
+    return _standardize_long_format(df, value_name)
+
+def _canonical(df: pd.DataFrame, index) -> pd.Series:
+    names = df["country_name"].astype(str).str.strip()
+    return index.canonicalize(names, df.get("country_code"))
+
+def _row_hashes(df: pd.DataFrame, value_name: str) -> np.ndarray:
+    """Hash per raw row, with year and value compared as numbers (5 == 5.0)."""
+    key = pd.DataFrame({
+        "country_name": df["country_name"].astype(str).str.strip(),
+        "country_code": df["country_code"].astype(str) if "country_code" in df else "",
+        "year": pd.to_numeric(df["year"], errors="coerce"),
+        "value": pd.to_numeric(df[value_name], errors="coerce"),
+    })
+    return pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+def remapped_countries(df: pd.DataFrame, old_index, index) -> set:
+    """Canonical countries (old and new) of rows the two indexes map differently."""
+    before, after = _canonical(df, old_index), _canonical(df, index)
+    moved = (before != after).to_numpy()
+    return set(before[moved]) | set(after[moved])
+
+def changed_countries(old: pd.DataFrame, new: pd.DataFrame, value_name: str,
+                      old_index, index) -> set:
+    """Canonical countries with a row added, removed or changed between two snapshots.
+
+    old was canonicalized with old_index when the processed output was built.
+    """
+    old_hashes, new_hashes = _row_hashes(old, value_name), _row_hashes(new, value_name)
+    added = ~np.isin(new_hashes, old_hashes)
+    removed = old[~np.isin(old_hashes, new_hashes)]
+    return (set(_canonical(new[added], index)) | set(_canonical(removed, old_index))
+            | set(_canonical(removed, index)))
+
+# ───────────────────────────────
+# Patch
+# ───────────────────────────────
+def _write_atomic(table: pa.Table, path: Path):
+    tmp_path = path.with_name(f".{path.name}.part")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+def _patch_processed(out_path: Path, changes: pa.Table, affected: set) -> int:
+    """Replace the affected countries' rows of out_path by changes; returns the row count."""
+    table = pq.read_table(out_path)
+    names = pc.cast(table["country_name"], pa.string())
+    kept = table.filter(pc.invert(pc.is_in(names, value_set=pa.array(sorted(affected)))))
+    table = pa.concat_tables([kept, changes]).unify_dictionaries()
+    order = pc.sort_indices(
+        pa.table({"c": pc.cast(table["country_name"], pa.string()), "y": table["year"]}),
+        sort_keys=[("c", "ascending"), ("y", "ascending")],
+    )
+    table = table.take(order).combine_chunks()
+    _write_atomic(table, out_path)
+    return table.num_rows
+
+def with_scope(table: pa.Table, scope: dict) -> pa.Table:
+    return table.replace_schema_metadata({SCOPE_KEY: json.dumps(scope)})
+
+def changes_scope(source) -> dict:
+    """{"country_name": [...]} stored by with_scope in a changes file (path) or table."""
+    schema = source.schema if isinstance(source, pa.Table) else pq.read_schema(source)
+    metadata = schema.metadata or {}
+    return json.loads(metadata[SCOPE_KEY]) if SCOPE_KEY in metadata else None
+
+# ───────────────────────────────
+# Entry point
+# ───────────────────────────────
+def merge_incremental(files: dict, index, out_dir: Path, state_path: Path):
+    """Re-merge only the countries that changed since the last transform.
+
+    Returns the changed slice (all rows of the affected countries) with
+    df.attrs["scope"] set, or None when a full transform is needed.
+    """
+    out_path = out_dir / "clean_data.parquet"
+    state = _load_state(state_path)
+    reason = _full_reason(state, files, out_path)
+    if reason:
+        print(f" Incremental transform not possible ({reason}); running a full transform")
+        return None
+    old_index = CountryIndex.from_json(state["index"])
+    reindexed = old_index.to_json() != index.to_json()
+
+    affected, latest = set(), {}
+    with span("transform.incremental.diff", sources=len(files)) as s:
+        for name, path in files.items():
+            base = Path(state["files"][name])
+            if _same_snapshot(base, path) and not reindexed:
+                continue
+            latest[name] = _standardized(path, name)
+            old = latest[name] if _same_snapshot(base, path) else _standardized(base, name)
+            changed = changed_countries(old, latest[name], name, old_index, index)
+            if reindexed:
+                changed |= remapped_countries(old, old_index, index)
+            print(f" {name}: {base.name} → {Path(path).name}, {len(changed)} country(ies) changed")
+            affected |= changed
+        s.count(countries=len(affected))
+
+    with span("transform.incremental.merge", countries=len(affected)) as s:
+        frames = {}
+        for name, path in files.items():
+            std = latest[name] if name in latest else _standardized(path, name)
+            rows = _canonical(std, index).isin(affected).to_numpy()
+            frames[name] = _clean_frame(std[rows].copy(), name, index)
+        df = _merge_frames(frames)
+        s.count(rows_out=len(df))
+
+    scope = {"country_name": sorted(affected)}
+    changes = to_arrow(df) if len(df) else processed_schema(list(files)).empty_table()
+    changes = with_scope(changes, scope)
+    with span("transform.write", rows_out=len(df), incremental=True) as s:
+        _write_atomic(changes, out_dir / CHANGES_NAME)
+        total = _patch_processed(out_path, changes.replace_schema_metadata(None), affected) \
+            if affected else pq.read_metadata(out_path).num_rows
+        s.count(bytes_written=out_path.stat().st_size + (out_dir / CHANGES_NAME).stat().st_size)
+    record_state(files, index, out_path, partitioned=False, state_path=state_path)
+
+    print(f" {len(affected)} country(ies) re-transformed: {len(df):,} changed rows "
+          f"written to {out_dir / CHANGES_NAME}; {out_path} now has {total:,} rows")
+    df.attrs["scope"] = scope
+    return df
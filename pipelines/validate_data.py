@@ -3,114 +3,294 @@ Step 5: Validate Data Quality in DuckDB
 ---------------------------------------
 Performs automated validation checks on the cleaned dataset
 stored in data/warehouse/data-cleaning.duckdb.
+
+Checks are declared as rules (DEFAULT_RULES, or a JSON list passed with
+--rules) and compiled into a single DuckDB aggregate query, so the table
+is scanned once no matter how many rules there are. Every rule is
+evaluated — nothing stops at the first failure — and the outcome is
+written as a machine-readable report to data/reports/validation_report.json.
+
+Rule types:
+  row_count    {"min": n}                           rows in the table
+  columns      {"columns": [...]}                   expected columns exist (metadata only)
+  null_ratio   {"column": c, "max": r}              share of NULLs in c
+  imputed_ratio {"column": c, "max": r}             share of c's values filled, not observed
+                                                    (from c_imputed, see gapfill.py)
+  range        {"column": c, "min": a, "max": b}    MIN/MAX of c within bounds
+  unique       {"columns": [...]}                   no duplicate key combinations
+  yoy_change   {"column": c, "max_ratio": r}        |c - prev year| / |prev year| per country
+  correlation  {"x": c1, "y": c2, "min": r}         corr(c1, c2) over rows where both are set
+
+Every rule may also set "name" and "severity" ("error" fails validation,
+"warn" is reported only).
 """
 
-import duckdb
-import pandas as pd
+import argparse
+import json
+import time
+from datetime import datetime
 from pathlib import Path
 
+import gapfill
+import project_path  # noqa: F401  (makes the warehouse package importable)
+from instrumentation import pipeline_run, span
+from warehouse import connect as warehouse
+
 # Use absolute path relative to the project root
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-DB_PATH = PROJECT_ROOT / "data" / "warehouse" / "data-cleaning.duckdb"
+DB_PATH = warehouse.DB_PATH
+REPORT_PATH = PROJECT_ROOT / "data" / "reports" / "validation_report.json"
+
+# ───────────────────────────────
+# Default rule set
+# ───────────────────────────────
+# Errors are for invariants the data must hold (key uniqueness, non-negative
+# quantities, plausible years). Year-over-year and correlation rules are
+# heuristics that real data can legitimately break, so they only warn.
+DEFAULT_RULES = [
+    {"type": "row_count", "min": 1},
+    {"type": "columns", "columns": ["country_name", "year", "population", "gdp", "co2_emissions"]},
+    {"type": "unique", "columns": ["country_name", "year"]},
+    {"type": "null_ratio", "column": "gdp", "max": 0.2},
+    {"type": "null_ratio", "column": "population", "max": 0.1, "severity": "warn"},
+    {"type": "imputed_ratio", "column": "gdp", "max": 0.1, "severity": "warn"},
+    {"type": "imputed_ratio", "column": "population", "max": 0.1, "severity": "warn"},
+    {"type": "range", "column": "year", "min": 1700, "max": 2100},
+    {"type": "range", "column": "population", "min": 0},
+    {"type": "range", "column": "gdp", "min": 0},
+    {"type": "range", "column": "co2_emissions", "min": 0},
+    {"type": "yoy_change", "column": "population", "max_ratio": 0.5, "severity": "warn"},
+    {"type": "yoy_change", "column": "gdp", "max_ratio": 10.0, "severity": "warn"},
+    {"type": "correlation", "x": "gdp", "y": "co2_emissions", "min": 0.0, "severity": "warn"},
+]
+
+def load_rules(path: Path) -> list:
+    with open(path) as f:
+        return json.load(f)
 
 # ───────────────────────────────
 # Connection
 # ───────────────────────────────
 def connect_duckdb(db_path: Path = DB_PATH):
-    """Connect to the local DuckDB database file."""
+    """Pooled read-only cursor on the DuckDB database file (see warehouse/connect.py)."""
     if not db_path.exists():
         raise FileNotFoundError(f" DuckDB file not found: {db_path.resolve()}")
-    con = duckdb.connect(str(db_path))
+    con = warehouse.reader(db_path)
     print(f" Connected to {db_path}")
     return con
 
 # ───────────────────────────────
-# Validation checks
+# Rule compilation: rule → aggregate expressions over one scan
 # ───────────────────────────────
-def validate_basic(con):
-    """Confirm table exists and has rows."""
-    tables = con.execute("SHOW TABLES").fetchdf()
-    if "clean_data" not in tables["name"].values:
-        raise RuntimeError(" Table 'clean_data' not found in database.")
-    row_count = con.execute("SELECT COUNT(*) FROM clean_data;").fetchone()[0]
-    assert row_count > 0, " No rows found in table!"
-    print(f" Row count: {row_count:,}")
-
-def validate_schema(con):
-    """Ensure expected columns exist."""
-    df = con.execute("DESCRIBE clean_data;").fetchdf()
-    expected = {"country_name", "year", "population", "gdp", "co2_emissions"}
-    found = set(df["column_name"].tolist())
-    missing = expected - found
-    assert not missing, f" Missing columns: {missing}"
-    print(" All expected columns present")
-
-def validate_missing_values(con):
-    """Count missing values and ensure they are within acceptable limits."""
-    missing_df = con.execute("""
-        SELECT 
-            SUM(population IS NULL) AS missing_population,
-            SUM(gdp IS NULL) AS missing_gdp,
-            SUM(co2_emissions IS NULL) AS missing_co2
-        FROM clean_data;
-    """).fetchdf()
-    print("\n Missing values summary:")
-    print(missing_df.to_string(index=False))
-
-    total = con.execute("SELECT COUNT(*) FROM clean_data;").fetchone()[0]
-    gdp_missing = missing_df.loc[0, "missing_gdp"]
-    assert gdp_missing / total < 0.2, f" Too many missing GDP values: {gdp_missing/total:.1%}"
-    print(" Missing-value ratios acceptable")
-
-def validate_ranges(con):
-    """Validate numeric ranges for sanity."""
-    stats = con.execute("""
-        SELECT 
-            MIN(year) AS min_year, MAX(year) AS max_year,
-            MIN(population) AS min_pop, MAX(population) AS max_pop,
-            MIN(gdp) AS min_gdp, MAX(gdp) AS max_gdp,
-            MIN(co2_emissions) AS min_co2, MAX(co2_emissions) AS max_co2
-        FROM clean_data;
-    """).fetchdf()
-    print("\n Numeric summary:")
-    print(stats.T)
-    
-    min_year, max_year = int(stats.loc[0, "min_year"]), int(stats.loc[0, "max_year"])
-    assert 1700 <= min_year <= 2100, f" Year range invalid: {min_year}"
-    assert 1700 <= max_year <= 2100, f" Year range invalid: {max_year}"
-    print(" Year range valid")
-    
-def validate_correlations(con):
-    """Check correlation between GDP and CO₂ emissions."""
-    corr = con.execute("""
-        SELECT corr(gdp, co2_emissions) AS corr_value
-        FROM clean_data
-        WHERE gdp IS NOT NULL AND co2_emissions IS NOT NULL;
-    """).fetchone()[0]
-
-    if corr is None:
-        print("\n Not enough data to compute correlation.")
-        return
-
-    print(f"\n GDP–CO₂ correlation: {corr:.3f}")
-    if corr < 0:
-        print(" Negative correlation detected (unexpected pattern)")
-    else:
-        print(" Positive correlation (plausible economic relationship)")
+def _rule_name(rule: dict) -> str:
+    if "name" in rule:
+        return rule["name"]
+    target = rule.get("column") or "_".join(rule.get("columns", [])) or \
+        "_".join(c for c in (rule.get("x"), rule.get("y")) if c)
+    return f"{rule['type']}:{target}" if target and rule["type"] != "columns" else rule["type"]
+
+def _referenced_columns(rule: dict) -> set:
+    cols = set(rule.get("columns", []))
+    cols.update(c for c in (rule.get("column"), rule.get("x"), rule.get("y")) if c)
+    if rule["type"] == "imputed_ratio":
+        cols.add(gapfill.imputed_column(rule["column"]))
+    return cols
+
+def _compile(rule: dict, alias: str) -> dict:
+    """Aggregate expressions (alias → SQL) needed to evaluate one rule."""
+    kind = rule["type"]
+    col = rule.get("column")
+    if kind == "row_count":
+        return {f"{alias}_n": "COUNT(*)"}
+    if kind == "null_ratio":
+        return {f"{alias}_nulls": f"COUNT(*) FILTER (WHERE {col} IS NULL)",
+                f"{alias}_n": "COUNT(*)"}
+    if kind == "imputed_ratio":
+        return {f"{alias}_imputed": f"COUNT(*) FILTER (WHERE {gapfill.imputed_column(col)})",
+                f"{alias}_n": f"COUNT({col})"}
+    if kind == "range":
+        return {f"{alias}_min": f"MIN({col})", f"{alias}_max": f"MAX({col})"}
+    if kind == "unique":
+        key = ", ".join(rule["columns"])
+        return {f"{alias}_dupes": f"COUNT(*) - COUNT(DISTINCT ({key}))"}
+    if kind == "yoy_change":
+        ratio = f"ABS({col} - _prev_{col}) / NULLIF(ABS(_prev_{col}), 0)"
+        return {f"{alias}_max": f"MAX({ratio})",
+                f"{alias}_violations": f"COUNT(*) FILTER (WHERE {ratio} > {float(rule['max_ratio'])})"}
+    if kind == "correlation":
+        return {f"{alias}_corr": f"corr({rule['x']}, {rule['y']})"}
+    raise ValueError(f"Unknown rule type: {kind}")
+
+def _evaluate(rule: dict, alias: str, row: dict, columns: set) -> tuple:
+    """(passed, observed, message) for one rule from the aggregate row."""
+    kind = rule["type"]
+    col = rule.get("column")
+    if kind == "columns":
+        missing = sorted(set(rule["columns"]) - columns)
+        return not missing, {"missing": missing}, \
+            f"Missing columns: {missing}" if missing else "All expected columns present"
+    if kind == "row_count":
+        n = row[f"{alias}_n"]
+        return n >= rule.get("min", 1), {"rows": n}, f"Row count: {n:,}"
+    if kind == "null_ratio":
+        n, nulls = row[f"{alias}_n"], row[f"{alias}_nulls"]
+        ratio = nulls / n if n else 0.0
+        return ratio <= rule["max"], {"nulls": nulls, "ratio": ratio}, \
+            f"{col}: {nulls:,} missing ({ratio:.1%}, max {rule['max']:.0%})"
+    if kind == "imputed_ratio":
+        n, imputed = row[f"{alias}_n"], row[f"{alias}_imputed"]
+        ratio = imputed / n if n else 0.0
+        return ratio <= rule["max"], {"imputed": imputed, "ratio": ratio}, \
+            f"{col}: {imputed:,} of {n:,} values imputed ({ratio:.1%}, max {rule['max']:.0%})"
+    if kind == "range":
+        lo, hi = row[f"{alias}_min"], row[f"{alias}_max"]
+        ok = (lo is None or "min" not in rule or lo >= rule["min"]) and \
+             (hi is None or "max" not in rule or hi <= rule["max"])
+        return ok, {"min": lo, "max": hi}, f"{col} range: [{lo}, {hi}]"
+    if kind == "unique":
+        dupes = row[f"{alias}_dupes"]
+        return dupes == 0, {"duplicates": dupes}, \
+            f"{', '.join(rule['columns'])}: {dupes:,} duplicate key(s)"
+    if kind == "yoy_change":
+        worst, violations = row[f"{alias}_max"], row[f"{alias}_violations"]
+        return violations == 0, {"max_ratio": worst, "violations": violations}, \
+            f"{col}: {violations:,} year-over-year change(s) above {rule['max_ratio']:.0%}"
+    if kind == "correlation":
+        corr = row[f"{alias}_corr"]
+        if corr is None:
+            return True, {"corr": None}, "Not enough data to compute correlation"
+        return corr >= rule.get("min", -1.0), {"corr": corr}, \
+            f"{rule['x']}–{rule['y']} correlation: {corr:.3f}"
+    raise ValueError(f"Unknown rule type: {kind}")
+
+def build_scan_sql(rules: list, table: str) -> tuple:
+    """One SELECT computing every rule's aggregates; returns (sql, {rule index: alias})."""
+    aliases, exprs = {}, {}
+    yoy_cols = set()
+    for i, rule in enumerate(rules):
+        if rule["type"] == "columns":
+            continue
+        alias = f"r{i}"
+        aliases[i] = alias
+        exprs.update(_compile(rule, alias))
+        if rule["type"] == "yoy_change":
+            yoy_cols.add(rule["column"])
+    if not exprs:
+        return None, aliases
+    source = table
+    if yoy_cols:
+        lags = ", ".join(
+            f"LAG({c}) OVER (PARTITION BY country_name ORDER BY year) AS _prev_{c}"
+            for c in sorted(yoy_cols)
+        )
+        source = f"(SELECT *, {lags} FROM {table})"
+    select = ",\n            ".join(f"{sql} AS {a}" for a, sql in exprs.items())
+    return f"SELECT\n            {select}\n        FROM {source}", aliases
+
+# ───────────────────────────────
+# Validation run
+# ───────────────────────────────
+def run_validation(con, rules: list = DEFAULT_RULES, table: str = "clean_data") -> dict:
+    """Evaluate all rules against table and return a structured report."""
+    started = time.perf_counter()
+    report = {
+        "table": table,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "queries": [],
+        "rules": [],
+    }
+
+    t0 = time.perf_counter()
+    columns = {r[0] for r in con.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = ?;", [table]
+    ).fetchall()}
+    report["queries"].append({"id": "metadata", "elapsed_ms": (time.perf_counter() - t0) * 1000})
+
+    if not columns:
+        report["rules"].append({"name": "table_exists", "type": "table_exists", "severity": "error",
+                                "status": "fail", "observed": {}, "elapsed_ms": 0.0,
+                                "message": f"Table '{table}' not found in database."})
+        rules = []
+
+    # Rules that reference missing columns can't be compiled; report them as failures.
+    runnable = []
+    for rule in rules:
+        unknown = _referenced_columns(rule) - columns
+        if rule["type"] != "columns" and unknown:
+            report["rules"].append({"name": _rule_name(rule), "type": rule["type"],
+                                    "severity": rule.get("severity", "error"), "status": "fail",
+                                    "observed": {"missing": sorted(unknown)}, "elapsed_ms": 0.0,
+                                    "message": f"Columns not found: {sorted(unknown)}"})
+        else:
+            runnable.append(rule)
+
+    row, query_ms = {}, 0.0
+    sql, aliases = build_scan_sql(runnable, table)
+    if sql:
+        t0 = time.perf_counter()
+        with span("validate.scan", rules=len(runnable)):
+            cur = con.execute(sql)
+            names = [d[0] for d in cur.description]
+            row = dict(zip(names, cur.fetchone()))
+        query_ms = (time.perf_counter() - t0) * 1000
+        report["queries"].append({"id": "scan", "elapsed_ms": query_ms, "sql": sql})
+
+    for i, rule in enumerate(runnable):
+        t0 = time.perf_counter()
+        passed, observed, message = _evaluate(rule, aliases.get(i), row, columns)
+        severity = rule.get("severity", "error")
+        report["rules"].append({
+            "name": _rule_name(rule),
+            "type": rule["type"],
+            "severity": severity,
+            "status": "pass" if passed else ("warn" if severity == "warn" else "fail"),
+            "observed": observed,
+            "message": message,
+            # The scan is shared; its time is reported per rule alongside evaluation time.
+            "query": "metadata" if rule["type"] == "columns" else "scan",
+            "query_ms": 0.0 if rule["type"] == "columns" else query_ms,
+            "elapsed_ms": (time.perf_counter() - t0) * 1000,
+        })
+
+    report["passed"] = all(r["status"] != "fail" for r in report["rules"])
+    report["elapsed_ms"] = (time.perf_counter() - started) * 1000
+    return report
+
+def write_report(report: dict, path: Path = REPORT_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+
+def print_report(report: dict):
+    marks = {"pass": "✅", "warn": "⚠️ ", "fail": "❌"}
+    for r in report["rules"]:
+        print(f" {marks[r['status']]} {r['name']:<32} {r['message']}")
+    scan = next((q for q in report["queries"] if q["id"] == "scan"), None)
+    if scan:
+        print(f"\n {len(report['rules'])} rules evaluated in one scan ({scan['elapsed_ms']:.1f} ms)")
 
 # ───────────────────────────────
 # Main
 # ───────────────────────────────
-def main():
-    con = connect_duckdb()
-    validate_basic(con)
-    validate_schema(con)
-    validate_missing_values(con)
-    validate_ranges(con)
-    validate_correlations(con)
-    con.close()
+def main(db_path: Path = DB_PATH, rules: list = DEFAULT_RULES, report_path: Path = REPORT_PATH):
+    with span("validate", rules=len(rules)) as s:
+        report = run_validation(connect_duckdb(db_path), rules)
+        s.count(failed=sum(r["status"] == "fail" for r in report["rules"]),
+                warned=sum(r["status"] == "warn" for r in report["rules"]))
+    report["database"] = str(db_path)
+    print_report(report)
+    write_report(report, report_path)
+    print(f" Report saved to {report_path}")
+    if not report["passed"]:
+        failed = [r["name"] for r in report["rules"] if r["status"] == "fail"]
+        raise RuntimeError(f" Validation failed: {', '.join(failed)}")
     print("\n Validation complete — data quality confirmed!")
+    return report
 
 if __name__ == "__main__":
-    main()
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Validate clean_data in DuckDB.")
+    parser.add_argument("--rules", type=Path, default=None,
+                        help="JSON file with a list of rules (defaults to DEFAULT_RULES).")
+    args = parser.parse_args()
+    with pipeline_run("validate_data"):
+        main(rules=load_rules(args.rules) if args.rules else DEFAULT_RULES)
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# The pipeline scripts import their siblings flat (they run from pipelines/);
+# the warehouse package is imported from the project root.
+sys.path.insert(0, str(PROJECT_ROOT / "pipelines"))
+sys.path.insert(0, str(PROJECT_ROOT))
@@ -0,0 +1,44 @@
+"""Country alias resolution and canonicalization."""
+
+import pandas as pd
+
+from countries import CountryIndex, normalize_name, unmatched
+
+def test_normalize_name_ignores_case_accents_and_punctuation():
+    assert normalize_name("  Côte d'Ivoire ") == normalize_name("cote d ivoire")
+    assert normalize_name("Trinidad & Tobago") == "trinidad and tobago"
+
+def test_seed_aliases_resolve_to_one_code():
+    index = CountryIndex.build([])
+    assert {index.resolve(n) for n in ("United States", "U.S.", "usa")} == {"USA"}
+    # Without a source spelling, the first seed alias is the display name.
+    assert index.canonical_name("south korea") == "Korea, Rep."
+
+def test_source_spelling_becomes_the_display_name():
+    index = CountryIndex.build([("Korea, Rep.", "KOR"), ("South Korea", None)])
+    assert index.canonical_name("South Korea") == "Korea, Rep."
+    assert index.canonical_name("Anything", "kor") == "Korea, Rep."
+
+def test_unknown_names_are_kept_and_reported():
+    index = CountryIndex.build([("Aruba", "ABW")])
+    assert index.resolve("Atlantis") is None
+    assert index.canonical_name(" Atlantis ") == "Atlantis"
+
+    pairs = pd.DataFrame({"country_name": ["Aruba", "Atlantis"], "rows": [3, 1]})
+    assert unmatched(index, pairs)["country_name"].tolist() == ["Atlantis"]
+
+def test_canonicalize_maps_every_row_and_keeps_missing_names():
+    index = CountryIndex.build([("Aruba", "ABW")])
+    names = pd.Series(["Viet Nam", "Aruba", None, "Vietnam", "Atlantis"])
+    codes = pd.Series([None, "ABW", None, "VNM", None])
+
+    expected = [index.canonical_name(n, c) if n is not None else None for n, c in zip(names, codes)]
+    assert index.canonicalize(names, codes).tolist() == expected
+    assert index.canonicalize(names).tolist()[:2] == ["Viet Nam", "Aruba"]
+    assert index.canonicalize(names)[3] == "Viet Nam"
+
+def test_json_round_trip():
+    index = CountryIndex.build([("Aruba", "ABW")])
+    restored = CountryIndex.from_json(index.to_json())
+    assert restored.resolve("aruba") == "ABW"
+    assert restored.names == index.names
@@ -0,0 +1,86 @@
+"""download_csv against a local HTTP server standing in for the data sources."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import extract_sources
+import raw_store
+
+BODY = b"Country Name,Year,Value\n" + b"Aruba,2000,90853\n" * 500
+
+class _Source(BaseHTTPRequestHandler):
+    """Answers each GET with the next scripted response: 200, 304, 503 or "truncated"."""
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        action = self.server.script.pop(0)
+        if action in (304, 503):
+            self.send_response(action)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        # A truncated body promises the full length and then drops the connection.
+        self.wfile.write(BODY[:len(BODY) // 3] if action == "truncated" else BODY)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(autouse=True)
+def _no_log_file(monkeypatch):
+    """Keep test downloads out of logs/extraction.log."""
+    monkeypatch.setattr(extract_sources, "_setup_logging", lambda: None)
+
+@pytest.fixture
+def source():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Source)
+    server.script, server.requests = [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}/gdp.csv"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _content(path) -> bytes:
+    with raw_store.open_text(path) as f:
+        return f.read().encode()
+
+def _download(source, raw_dir, manifest):
+    return extract_sources.download_csv("gdp", source.url, manifest=manifest, raw_dir=raw_dir,
+                                        retries=2, backoff=0)
+
+def test_not_modified_keeps_previous_snapshot(source, tmp_path):
+    manifest = {}
+    source.script = [200, 304]
+    first = _download(source, tmp_path, manifest)
+    second = _download(source, tmp_path, manifest)
+
+    assert second == first
+    assert _content(first) == BODY
+    assert source.requests[1]["If-None-Match"] == '"v1"'
+
+def test_retries_server_error(source, tmp_path):
+    source.script = [503, 200]
+    path = _download(source, tmp_path, {})
+
+    assert _content(path) == BODY
+    assert len(source.requests) == 2
+
+def test_retries_body_truncated_mid_stream(source, tmp_path):
+    source.script = ["truncated", 200]
+    path = _download(source, tmp_path, {})
+
+    assert _content(path) == BODY
+    assert len(source.requests) == 2
+    assert not list(tmp_path.rglob("*.part"))
+
+def test_gives_up_after_retries(source, tmp_path):
+    source.script = ["truncated"] * 3
+    assert _download(source, tmp_path, {}) is None
+    assert not [p for p in tmp_path.rglob("*") if p.is_file()]
@@ -0,0 +1,55 @@
+"""fill_gaps: strategies, max_gap and country boundaries."""
+
+import numpy as np
+import pytest
+
+from gapfill import fill_gaps, segment_bounds
+
+nan = np.nan
+
+def _fill(values, years, codes=None, **spec):
+    values = np.array(values, dtype=np.float64)
+    codes = np.zeros(len(values), dtype=int) if codes is None else np.array(codes)
+    first, last = segment_bounds(codes)
+    return fill_gaps(values, np.array(years), first, last, **spec)
+
+def test_segment_bounds():
+    first, last = segment_bounds(np.array([0, 0, 1, 1, 1, 2]))
+    assert first.tolist() == [0, 0, 2, 2, 2, 5]
+    assert last.tolist() == [1, 1, 4, 4, 4, 5]
+
+def test_ffill_without_limit_carries_the_last_value_forward():
+    filled, imputed = _fill([nan, 1, nan, nan, 4, nan], [2000, 2001, 2002, 2003, 2004, 2005])
+    np.testing.assert_array_equal(filled, [nan, 1, 1, 1, 4, 4])
+    assert imputed.tolist() == [False, False, True, True, False, True]
+
+def test_gap_longer_than_max_gap_stays_nan():
+    years = list(range(2000, 2006))
+    filled, imputed = _fill([1, nan, nan, nan, nan, nan], years, max_gap=2)
+    np.testing.assert_array_equal(filled, [1, 1, 1, nan, nan, nan])
+
+    # Interpolation fills a gap whole or not at all.
+    filled, imputed = _fill([1, nan, nan, nan, 5, nan], years, strategy="interpolate", max_gap=2)
+    np.testing.assert_array_equal(filled, [1, nan, nan, nan, 5, nan])
+    assert not imputed.any()
+
+def test_interpolate_is_linear_in_year_and_never_extrapolates():
+    filled, imputed = _fill([nan, 10, nan, nan, 40, nan], [1999, 2000, 2001, 2003, 2004, 2005],
+                            strategy="interpolate")
+    np.testing.assert_allclose(filled, [nan, 10, 17.5, 32.5, 40, nan])
+    assert imputed.tolist() == [False, False, True, True, False, False]
+
+def test_gaps_do_not_borrow_from_another_country():
+    codes = [0, 0, 1, 1]
+    years = [2000, 2001, 2000, 2001]
+    filled, _ = _fill([1, 2, nan, 3], years, codes)
+    np.testing.assert_array_equal(filled, [1, 2, nan, 3])
+    filled, _ = _fill([1, nan, 5, 6], years, codes, strategy="interpolate")
+    np.testing.assert_array_equal(filled, [1, nan, 5, 6])
+
+def test_none_leaves_gaps_and_unknown_strategy_is_rejected():
+    filled, imputed = _fill([1, nan, 3], [2000, 2001, 2002], strategy="none")
+    np.testing.assert_array_equal(filled, [1, nan, 3])
+    assert not imputed.any()
+    with pytest.raises(ValueError):
+        _fill([1, nan], [2000, 2001], strategy="mean")
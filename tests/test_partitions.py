@@ -0,0 +1,60 @@
+"""Year-partitioned tables: per-year rewrites and partition garbage collection."""
+
+import logging
+import shutil
+
+import duckdb
+
+from warehouse import partitions
+
+ROWS = ("SELECT country_name, year::INTEGER AS year, gdp::DOUBLE AS gdp FROM "
+        "(VALUES ('A', 2000, 1.0), ('A', 2001, 2.0), ('B', 2001, 3.0)) t(country_name, year, gdp)")
+
+def _connect(version):
+    con = duckdb.connect(str(version))
+    # connect.py does the same: manifest paths are relative to the database file.
+    con.execute(f"SET file_search_path = '{version.parent}';")
+    return con
+
+def _version(tmp_path, name):
+    (tmp_path / "versions").mkdir(exist_ok=True)
+    return tmp_path / "versions" / name
+
+def test_rewriting_one_year_keeps_the_others(tmp_path):
+    con = _connect(_version(tmp_path, "v1.duckdb"))
+    assert partitions.write_partitions(con, "clean_data", ROWS) == 2
+    assert partitions.layout(con, "clean_data") == "partitioned"
+
+    rewrite = f"SELECT country_name, year, gdp * 10 AS gdp FROM ({ROWS}) WHERE year = 2001"
+    partitions.write_partitions(con, "clean_data", rewrite, years=[2001])
+    rows = con.execute("SELECT country_name, year, gdp FROM clean_data ORDER BY ALL").fetchall()
+    assert rows == [("A", 2000, 1.0), ("A", 2001, 20.0), ("B", 2001, 30.0)]
+    assert con.execute("SELECT count(*) FROM clean_data WHERE year = 2000").fetchone()[0] == 1
+
+def test_garbage_collection_keeps_files_of_kept_versions(tmp_path):
+    v1, v2 = _version(tmp_path, "v1.duckdb"), _version(tmp_path, "v2.duckdb")
+    con = _connect(v1)
+    partitions.write_partitions(con, "clean_data", ROWS)
+    con.close()
+    shutil.copyfile(v1, v2)
+    con = _connect(v2)
+    partitions.write_partitions(con, "clean_data", f"SELECT * FROM ({ROWS}) WHERE year = 2001",
+                                years=[2001])
+    con.close()
+
+    assert partitions.collect_garbage([v1, v2]) == 0
+    # Without v1, its 2001 file is listed nowhere.
+    assert partitions.collect_garbage([v2]) == 1
+    con = _connect(v2)
+    assert con.execute("SELECT count(*) FROM clean_data").fetchone()[0] == 3
+
+def test_garbage_collection_skips_a_locked_version(tmp_path, caplog):
+    v1 = _version(tmp_path, "v1.duckdb")
+    con = _connect(v1)
+    partitions.write_partitions(con, "clean_data", ROWS)
+
+    # Still open read-write in this process: the read-only open is refused.
+    with caplog.at_level(logging.WARNING, logger="warehouse.partitions"):
+        assert partitions.collect_garbage([v1]) == 0
+    assert "skipped" in caplog.text
+    con.close()
@@ -0,0 +1,56 @@
+"""DataProfile: exact statistics, and merging partial profiles."""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from profiler import RELATIVE_ACCURACY, DataProfile, profile_frame, profile_parquet
+
+def _frame(n=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "country_name": rng.choice(["Chad", "Peru", "Fiji", "Oman"], n),
+        "year": rng.integers(1960, 2020, n),
+        "gdp": np.where(rng.random(n) < 0.1, np.nan, rng.lognormal(10, 2, n)),
+    })
+
+def _assert_same(a, b, path="profile"):
+    """a == b, floats up to rounding (merged means and variances add in another order)."""
+    if isinstance(a, dict):
+        assert a.keys() == b.keys(), path
+        for key in a:
+            _assert_same(a[key], b[key], f"{path}/{key}")
+    elif isinstance(a, float):
+        assert a == pytest.approx(b, rel=1e-9), path
+    else:
+        assert a == b, path
+
+def test_exact_statistics():
+    df = _frame()
+    stats = DataProfile().update(df).to_dict()["columns"]["gdp"]
+
+    assert stats["count"] == df["gdp"].count()
+    assert stats["nulls"] == df["gdp"].isna().sum()
+    assert stats["min"] == df["gdp"].min() and stats["max"] == df["gdp"].max()
+    assert stats["mean"] == pytest.approx(df["gdp"].mean(), rel=1e-9)
+    median = stats["quantiles"]["0.5"]
+    assert median == pytest.approx(df["gdp"].median(), rel=2 * RELATIVE_ACCURACY)
+
+def test_profiles_merged_from_split_data_equal_a_single_profile():
+    df = _frame()
+    whole = DataProfile().update(df)
+    merged = DataProfile().update(df.iloc[:1234])
+    merged.merge(DataProfile().update(df.iloc[1234:3000]))
+    merged.merge(DataProfile().update(df.iloc[3000:]))
+
+    _assert_same(whole.to_dict(), merged.to_dict())
+
+def test_parquet_profile_in_parallel_equals_frame_profile(tmp_path):
+    df = _frame()
+    path = tmp_path / "clean_data.parquet"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=700)
+
+    parallel = profile_parquet(path, workers=2, batch_rows=300)
+    _assert_same(profile_frame(df, chunk_rows=1000).to_dict(), parallel.to_dict())
@@ -0,0 +1,60 @@
+"""Serving snapshot: built per version, ignored once stale, follows rollback."""
+
+import duckdb
+import pytest
+
+import rollups
+from warehouse import serving, versions
+
+ROWS = [("Chad", 2000, 8_000_000, 1.5e9, 0.2), ("Chad", 2001, 8_300_000, 1.7e9, 0.3),
+        ("Peru", 2000, 26_000_000, 5.1e10, 30.0), ("Peru", 2001, 26_400_000, 5.3e10, 31.0)]
+
+def _load(db_path, gdp_factor=1.0):
+    """A load: stage a version, fill clean_data and the rollups, snapshot it, publish it."""
+    staged = versions.stage(db_path)
+    con = duckdb.connect(str(staged))
+    con.execute("CREATE OR REPLACE TABLE clean_data (country_name VARCHAR, year INTEGER, "
+                "population BIGINT, gdp DOUBLE, co2_emissions DOUBLE)")
+    con.executemany("INSERT INTO clean_data VALUES (?, ?, ?, ?, ?)",
+                    [(c, y, p, g * gdp_factor, e) for c, y, p, g, e in ROWS])
+    rollups.refresh_rollups(con)
+    con.close()
+    # As the loader does: snapshot the finished file through a read-only connection.
+    with duckdb.connect(str(staged), read_only=True) as reader:
+        serving.write_snapshot(reader, staged)
+    versions.publish(db_path, staged, keep=10)
+    return staged
+
+def _top_gdp(db_path):
+    return serving.read_snapshot(db_path)["top_gdp"].column("gdp").to_pylist()
+
+def test_snapshot_holds_the_series(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    _load(db)
+    snapshot = serving.read_snapshot(db)
+
+    assert set(snapshot) == set(serving.SERIES)
+    assert snapshot["years"].column("year").to_pylist() == [2000, 2001]
+    assert snapshot["countries"].column("country_name").to_pylist() == ["Chad", "Peru"]
+    assert snapshot["preview"].num_rows == len(ROWS)
+
+def test_snapshot_of_a_changed_version_file_is_ignored(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    version = _load(db)
+    with duckdb.connect(str(version)) as con:
+        con.execute("DELETE FROM clean_data WHERE country_name = 'Peru'")
+
+    assert serving.read_snapshot(db) is None
+
+def test_snapshot_follows_rollback_and_goes_with_its_version(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    first = _load(db)
+    second = _load(db, gdp_factor=2.0)
+    assert _top_gdp(db)[0] == pytest.approx(2 * 5.1e10)
+
+    versions.rollback(db)
+    assert _top_gdp(db)[0] == pytest.approx(5.1e10)
+
+    versions.prune(db, keep=0)
+    assert not serving.snapshot_path(second).exists()
+    assert serving.snapshot_path(first).exists()
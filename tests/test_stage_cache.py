@@ -0,0 +1,34 @@
+"""StageCache freshness: key, output existence and output identity."""
+
+from stage_cache import StageCache, stage_key
+
+def test_key_follows_input_contents(tmp_path):
+    data = tmp_path / "in.csv"
+    data.write_text("a,b\n1,2\n")
+    key = stage_key("transform", inputs=[data])
+    data.write_text("a,b\n1,3\n")
+    assert stage_key("transform", inputs=[data]) != key
+
+def test_fresh_until_key_or_output_changes(tmp_path):
+    cache = StageCache(tmp_path / "manifest.json")
+    out = tmp_path / "out.duckdb"
+    out.write_bytes(b"v1")
+    cache.record("load", "k1", [out])
+
+    assert StageCache(tmp_path / "manifest.json").is_fresh("load", "k1", [out])
+    assert not cache.is_fresh("load", "k2", [out])
+    out.unlink()
+    assert not cache.is_fresh("load", "k1", [out])
+
+def test_symlinked_output_switched_to_another_file_is_stale(tmp_path):
+    cache = StageCache(tmp_path / "manifest.json")
+    (tmp_path / "v1.duckdb").write_bytes(b"v1")
+    (tmp_path / "v2.duckdb").write_bytes(b"v2")
+    link = tmp_path / "current.duckdb"
+    link.symlink_to(tmp_path / "v2.duckdb")
+    cache.record("load", "k1", [link])
+
+    assert cache.is_fresh("load", "k1", [link])
+    link.unlink()
+    link.symlink_to(tmp_path / "v1.duckdb")
+    assert not cache.is_fresh("load", "k1", [link])
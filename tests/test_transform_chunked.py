@@ -0,0 +1,51 @@
+"""iter_clean_batches against load_and_clean on small raw files."""
+
+import pandas as pd
+import pytest
+
+import transform_chunked
+from transform_clean import load_and_clean
+
+def _write_raw(path, values):
+    rows = [f"Country{i % 3},{2000 + i},{v}" for i, v in enumerate(values)]
+    path.write_text("Country Name,Year,Value\n" + "\n".join(rows) + "\n")
+    return path
+
+def _plain(df):
+    # Each batch has its own country categories; compare the names themselves.
+    return df.reset_index(drop=True).astype({"country_name": object})
+
+def _batches(path, chunksize):
+    frames = list(transform_chunked.iter_clean_batches(path, "gdp", chunksize=chunksize))
+    return _plain(pd.concat(frames))
+
+def test_numeric_file_matches_load_and_clean(tmp_path):
+    path = _write_raw(tmp_path / "gdp.csv", [1.5 * i for i in range(10)])
+    expected = _plain(load_and_clean(path, "gdp"))
+    pd.testing.assert_frame_equal(_batches(path, 3), expected)
+
+def test_non_numeric_token_mid_file_keeps_every_row(tmp_path):
+    values = [1.5 * i for i in range(10)]
+    values[7] = ".."
+    path = _write_raw(tmp_path / "gdp.csv", values)
+    expected = _plain(load_and_clean(path, "gdp"))
+
+    result = _batches(path, 3)
+    assert len(result) == len(expected) == 9
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_cleaning_error_is_not_taken_for_a_parse_error(tmp_path, monkeypatch):
+    path = _write_raw(tmp_path / "gdp.csv", range(10))
+    clean_frame, calls = transform_chunked._clean_frame, []
+
+    def fails_once(df, value_name, index=None):
+        calls.append(len(df))
+        if len(calls) == 1:
+            raise ValueError("bad batch")
+        return clean_frame(df, value_name, index)
+
+    # Raised while cleaning the first batch: it must surface, not restart
+    # the read past rows that were never yielded.
+    monkeypatch.setattr(transform_chunked, "_clean_frame", fails_once)
+    with pytest.raises(ValueError, match="bad batch"):
+        list(transform_chunked.iter_clean_batches(path, "gdp", chunksize=3))
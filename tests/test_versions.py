@@ -0,0 +1,70 @@
+"""Blue/green warehouse versions: stage, publish, prune and rollback."""
+
+import pytest
+
+from warehouse import versions
+
+def _load(db_path, payload: bytes):
+    """What a load does: stage, write the new version, publish it."""
+    staged = versions.stage(db_path)
+    staged.write_bytes(payload)
+    versions.publish(db_path, staged, keep=10)
+    return staged
+
+def test_publish_points_the_link_at_the_staged_version(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    staged = _load(db, b"v1")
+
+    assert db.is_symlink()
+    assert versions.current(db) == staged
+    assert db.read_bytes() == b"v1"
+
+def test_stage_leaves_the_current_version_untouched(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    _load(db, b"v1")
+    staged = versions.stage(db)
+
+    assert staged.read_bytes() == b"v1"
+    staged.write_bytes(b"v2 in progress")
+    assert db.read_bytes() == b"v1"
+    versions.discard(staged)
+    assert not staged.exists()
+
+def test_rollback_restores_the_previous_target(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    first = _load(db, b"v1")
+    second = _load(db, b"v2")
+
+    assert versions.rollback(db) == first
+    assert versions.current(db) == first
+    assert db.read_bytes() == b"v1"
+    assert versions.rollback(db, second.name) == second
+    assert db.read_bytes() == b"v2"
+
+def test_rollback_errors(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    _load(db, b"v1")
+
+    with pytest.raises(RuntimeError):
+        versions.rollback(db)
+    with pytest.raises(FileNotFoundError):
+        versions.rollback(db, "wh-19990101T000000000000.duckdb")
+
+def test_publish_adopts_an_unversioned_database(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    db.write_bytes(b"legacy")
+    _load(db, b"v1")
+
+    legacy = versions.rollback(db)
+    assert legacy.name == "wh-00000000T000000000000.duckdb"
+    assert db.read_bytes() == b"legacy"
+
+def test_prune_keeps_the_current_and_newest_versions(tmp_path):
+    db = tmp_path / "wh.duckdb"
+    loaded = [_load(db, f"v{i}".encode()) for i in range(5)]
+    versions.rollback(db, loaded[0].name)
+
+    pruned = versions.prune(db, keep=2)
+    assert pruned == loaded[1:3]
+    assert versions.list_versions(db) == [loaded[0]] + loaded[3:]
+    assert db.read_bytes() == b"v0"
@@ -0,0 +1 @@
+"""DuckDB warehouse: shared connection handling (connect.py) and SQL assets."""
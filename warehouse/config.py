@@ -0,0 +1,44 @@
+"""
+Warehouse location
+------------------
+Where the DuckDB warehouse lives, without importing DuckDB (so the
+dashboard can find its serving snapshot before it needs a connection):
+
+  DB_PATH   from DB_URL (environment, else the project's .env), e.g.
+            duckdb:///data/warehouse/data-cleaning.duckdb (relative to
+            the project root; duckdb:////abs/path for an absolute path)
+
+connect.py re-exports everything here.
+"""
+
+import os
+from pathlib import Path
+
+try:
+    from dotenv import dotenv_values
+except ImportError:  # python-dotenv is optional; DB_URL can come from the environment
+    dotenv_values = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_DB_PATH = PROJECT_ROOT / "data" / "warehouse" / "data-cleaning.duckdb"
+URL_PREFIX = "duckdb:///"
+
+def _setting(name: str):
+    if name in os.environ:
+        return os.environ[name]
+    env_file = PROJECT_ROOT / ".env"
+    if dotenv_values is not None and env_file.exists():
+        return dotenv_values(env_file).get(name)
+    return None
+
+def resolve_db_path(url: str = None) -> Path:
+    """Database file for a duckdb:/// URL (default: DB_URL, else DEFAULT_DB_PATH)."""
+    url = url or _setting("DB_URL")
+    if not url:
+        return DEFAULT_DB_PATH
+    if not url.startswith(URL_PREFIX):
+        raise ValueError(f" Unsupported DB_URL (expected {URL_PREFIX}<path>): {url}")
+    path = Path(url[len(URL_PREFIX):])
+    return path if path.is_absolute() else PROJECT_ROOT / path
+
+DB_PATH = resolve_db_path()
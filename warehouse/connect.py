@@ -0,0 +1,143 @@
+"""
+Warehouse access
+----------------
+The one place that opens the DuckDB warehouse. Pipelines, the dashboard
+and ad-hoc scripts share it:
+
+  DB_PATH      where it lives, from DB_URL (see config.py)
+  reader()     a read-only cursor, reused per thread, on one shared
+               connection per database file
+  writer()     the single read-write connection, used by loads; writes are
+               serialized by a lock
+  configure()  DuckDB threads / memory_limit (DUCKDB_THREADS and
+               DUCKDB_MEMORY_LIMIT by default)
+
+DuckDB lets one process hold a database file either read-only or
+read-write, not both, so the pool keeps one base connection per file:
+read-only until a writer is needed, then read-write, with readers served
+cursors on it. Read-only connections are reopened when the file changes
+on disk, and when the database path is a symlink that now points at a new
+version (see versions.py), readers move to the new file on their next
+reader() call.
+
+Cursors from reader() and writer() belong to the pool — do not close them.
+Their file_search_path is the database file's directory, so relative file
+paths stored in the database (partitioned tables, see partitions.py)
+resolve wherever the project lives.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+from .config import DB_PATH, DEFAULT_DB_PATH, PROJECT_ROOT, URL_PREFIX, _setting, resolve_db_path
+
+# ───────────────────────────────
+# Configuration
+# ───────────────────────────────
+SETTINGS = {
+    "threads": _setting("DUCKDB_THREADS"),
+    "memory_limit": _setting("DUCKDB_MEMORY_LIMIT"),
+}
+
+def _config() -> dict:
+    return {k: str(v) for k, v in SETTINGS.items() if v is not None}
+
+def configure(threads: int = None, memory_limit: str = None):
+    """Set DuckDB threads / memory_limit (e.g. "4GB") for open and future connections."""
+    with _lock:
+        if threads is not None:
+            SETTINGS["threads"] = threads
+        if memory_limit is not None:
+            SETTINGS["memory_limit"] = memory_limit
+        for base in _bases.values():
+            for key, value in _config().items():
+                base["con"].execute(f"SET {key} = '{value}';")
+
+# ───────────────────────────────
+# Connection pool
+# ───────────────────────────────
+_lock = threading.RLock()
+_write_lock = threading.Lock()
+_bases = {}      # db file → {"con", "read_only", "stamp", "generation"}
+_generations = {}
+_targets = {}    # path as given → db file it resolved to last time
+_local = threading.local()
+
+def _key(db_path) -> str:
+    """The database file behind db_path (symlinks resolved)."""
+    link = os.path.abspath(db_path or DB_PATH)
+    path = os.path.realpath(link)
+    with _lock:
+        previous = _targets.get(link)
+        if previous is not None and previous != path:
+            # Published a new version: drop the old one. Its connection is
+            # closed once the last cursor still using it is released.
+            _bases.pop(previous, None)
+        _targets[link] = path
+    return path
+
+def _stamp(path: str):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+def _close(path: str):
+    base = _bases.pop(path, None)
+    if base is not None:
+        base["con"].close()
+
+def _base(path: str, write: bool) -> dict:
+    """The shared connection for path, (re)opened as needed."""
+    with _lock:
+        base = _bases.get(path)
+        if base is not None and base["read_only"] and (write or base["stamp"] != _stamp(path)):
+            _close(path)
+            base = None
+        if base is None:
+            if not write and not os.path.exists(path):
+                raise FileNotFoundError(f" DuckDB file not found: {path}")
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            _generations[path] = _generations.get(path, 0) + 1
+            base = {
+                "con": duckdb.connect(path, read_only=not write, config=_config()),
+                "read_only": not write,
+                "stamp": _stamp(path),
+                "generation": _generations[path],
+            }
+            _bases[path] = base
+        return base
+
+def _cursor(base: dict, path: str) -> duckdb.DuckDBPyConnection:
+    cur = base["con"].cursor()
+    cur.execute(f"SET file_search_path = '{os.path.dirname(path)}';")
+    return cur
+
+def reader(db_path=None) -> duckdb.DuckDBPyConnection:
+    """Read-only cursor on the warehouse, reused by the calling thread."""
+    path = _key(db_path)
+    base = _base(path, write=False)
+    cursors = _local.__dict__.setdefault("cursors", {})
+    link = os.path.abspath(db_path or DB_PATH)
+    cached = cursors.get(link)
+    if cached is None or cached[:2] != (path, base["generation"]):
+        cached = cursors[link] = (path, base["generation"], _cursor(base, path))
+    return cached[2]
+
+@contextmanager
+def writer(db_path=None):
+    """The read-write connection to the warehouse; one writer at a time."""
+    path = _key(db_path)
+    with _write_lock:
+        cur = _cursor(_base(path, write=True), path)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+def close(db_path=None):
+    """Close the pooled connection for db_path (all of them when None)."""
+    with _lock:
+        for path in [_key(db_path)] if db_path else list(_bases):
+            _close(path)
@@ -0,0 +1,158 @@
+"""
+Partitioned table layout
+------------------------
+A warehouse table can live as year-partitioned Parquet next to the
+versions directory instead of inside the database file:
+
+  data/warehouse/partitions/<table>/<load stamp>/year=<year>/data_0.parquet
+
+The database then holds a view of the same name over the files listed for
+it in the _partitions manifest (table_name, year, path). Every filter on
+year prunes whole files, and a load rewrites only the years it touches:
+the new files replace those years' manifest rows, the other years keep
+theirs. Files are never modified, so each warehouse version (see
+versions.py) keeps reading exactly the files of its own manifest;
+collect_garbage() deletes the files no kept version lists any more.
+
+Manifest paths are relative to the database file's directory, which
+connect.py sets as file_search_path on every cursor it hands out.
+"""
+
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+logger = logging.getLogger("warehouse.partitions")
+
+PARTITION_COLUMN = "year"
+PARTITION_TYPE = "INTEGER"
+MANIFEST_TABLE = "_partitions"
+
+def _db_file(con) -> Path:
+    return Path(con.execute(
+        "SELECT path FROM duckdb_databases() WHERE database_name = current_database();"
+    ).fetchone()[0])
+
+def partitions_dir(db_file: Path) -> Path:
+    """Partition root for a version file (versions/<name>.duckdb → partitions/)."""
+    return Path(db_file).resolve().parent.parent / "partitions"
+
+def layout(con, table_name: str):
+    """"partitioned" (a view over Parquet), "table", or None if table_name does not exist."""
+    row = con.execute(
+        "SELECT table_type FROM information_schema.tables WHERE table_name = ?;", [table_name]
+    ).fetchone()
+    if row is None:
+        return None
+    return "partitioned" if row[0] == "VIEW" else "table"
+
+def drop(con, table_name: str):
+    """Drop table_name whatever its layout (its partition files stay for older versions)."""
+    kind = layout(con, table_name)
+    if kind == "partitioned":
+        con.execute(f"DROP VIEW {table_name};")
+        con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ?;", [table_name])
+    elif kind == "table":
+        con.execute(f"DROP TABLE {table_name};")
+
+def _ensure_manifest(con):
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            table_name VARCHAR,
+            year       INTEGER,
+            path       VARCHAR
+        );
+    """)
+
+# ───────────────────────────────
+# Write / swap partitions
+# ───────────────────────────────
+def write_partitions(con, table_name: str, select_sql: str, years: list = None) -> int:
+    """Write select_sql as new partition files and point table_name's view at them.
+
+    years=None replaces the whole table; otherwise only those years are
+    replaced (a year select_sql has no rows for is dropped). Returns the
+    number of files written.
+    """
+    db_file = _db_file(con)
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    out_dir = partitions_dir(db_file) / table_name / stamp
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    con.execute(f"COPY ({select_sql}) TO '{out_dir}' "
+                f"(FORMAT parquet, PARTITION_BY ({PARTITION_COLUMN}));")
+
+    files = sorted(out_dir.rglob("*.parquet")) if out_dir.exists() else []
+    entries = [
+        (table_name, int(f.parent.name.split("=", 1)[1]), os.path.relpath(f, db_file.parent))
+        for f in files
+    ]
+    _ensure_manifest(con)
+    if years is None:
+        con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ?;", [table_name])
+    elif years:
+        con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ? AND year IN "
+                    f"({', '.join('?' * len(years))});", [table_name, *years])
+    if entries:
+        con.executemany(f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?, ?);", entries)
+    _create_view(con, table_name)
+    return len(files)
+
+def _create_view(con, table_name: str):
+    paths = [r[0] for r in con.execute(
+        f"SELECT path FROM {MANIFEST_TABLE} WHERE table_name = ? ORDER BY year, path;",
+        [table_name],
+    ).fetchall()]
+    if not paths:
+        raise RuntimeError(f" Partitioned table {table_name} would have no data files")
+    files = ", ".join(f"'{p}'" for p in paths)
+    if layout(con, table_name) == "table":
+        con.execute(f"DROP TABLE {table_name};")
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {table_name} AS
+        SELECT country_name, {PARTITION_COLUMN}, * EXCLUDE (country_name, {PARTITION_COLUMN})
+        FROM read_parquet([{files}], hive_partitioning = true,
+                          hive_types = {{'{PARTITION_COLUMN}': {PARTITION_TYPE}}});
+    """)
+
+# ───────────────────────────────
+# Garbage collection
+# ───────────────────────────────
+def _listed_files(version: Path) -> set:
+    con = duckdb.connect(str(version), read_only=True)
+    try:
+        if layout(con, MANIFEST_TABLE) is None:
+            return set()
+        return {os.path.realpath(version.parent / p)
+                for (p,) in con.execute(f"SELECT path FROM {MANIFEST_TABLE};").fetchall()}
+    finally:
+        con.close()
+
+def collect_garbage(version_files: list) -> int:
+    """Delete partition files that none of version_files lists; returns the files deleted.
+
+    Does nothing (and logs a warning) if a version is locked, e.g. by a
+    load writing it in another process or a read-write connection in this one.
+    """
+    if not version_files:
+        return 0
+    root = partitions_dir(version_files[0])
+    if not root.exists():
+        return 0
+    try:
+        listed = set().union(*(_listed_files(Path(v)) for v in version_files))
+    except (duckdb.IOException, duckdb.ConnectionException) as e:
+        # IOException: lock held by another process; ConnectionException: open here with another config.
+        logger.warning(f"Partition garbage collection skipped, a version is locked ({e})")
+        return 0
+    removed = 0
+    for f in root.rglob("*.parquet"):
+        if os.path.realpath(f) not in listed:
+            f.unlink()
+            removed += 1
+    for d in sorted((p for p in root.rglob("*") if p.is_dir()), key=lambda p: len(p.parts), reverse=True):
+        if not any(d.iterdir()):
+            d.rmdir()
+    return removed
@@ -0,0 +1,91 @@
+"""
+Arrow query results
+-------------------
+Query results as Arrow tables, without converting them to pandas:
+
+  fetch_arrow()  run a query on a pooled reader() cursor and return a
+                 pyarrow.Table (DuckDB hands its result over as Arrow)
+  ResultCache    results kept as Arrow IPC files under data/.cache/, read
+                 back memory-mapped: every process (e.g. each dashboard
+                 server) maps the same file, so the OS page cache holds one
+                 copy of a result however many processes use it
+
+Cache entries are keyed on the query, its parameters and the database
+version (file and modification time), so a new load never serves stale
+results; the oldest entries are evicted beyond max_bytes.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+from . import connect
+
+CACHE_DIR = connect.PROJECT_ROOT / "data" / ".cache" / "query_results"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def fetch_arrow(sql: str, params=None, db_path=None) -> pa.Table:
+    """Result of sql (with params) on the warehouse as an Arrow table."""
+    return connect.reader(db_path).execute(sql, params or []).fetch_arrow_table()
+
+def _db_version(db_path) -> list:
+    path = os.path.realpath(db_path or connect.DB_PATH)
+    return [path, os.stat(path).st_mtime_ns]
+
+def read_ipc(path: Path) -> pa.Table:
+    """Arrow IPC file as a table whose buffers point into a read-only memory map."""
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+def write_ipc(table: pa.Table, path: Path):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.part")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+class ResultCache:
+    """Query results shared between processes as memory-mapped Arrow IPC files."""
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES,
+                 db_path=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+
+    def path(self, sql: str, params=()) -> Path:
+        key = json.dumps([_db_version(self.db_path), sql, list(params)], default=str)
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.arrow"
+
+    def query(self, sql: str, params=()) -> pa.Table:
+        """Cached result of sql; treat it as read-only (it is shared)."""
+        path = self.path(sql, params)
+        try:
+            return read_ipc(path)
+        except FileNotFoundError:
+            pass
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        write_ipc(fetch_arrow(sql, list(params), self.db_path), path)
+        self.evict(keep=path)
+        return read_ipc(path)
+
+    def evict(self, keep: Path = None):
+        """Delete the least recently written entries (except keep) beyond max_bytes."""
+        entries = []
+        for p in self.cache_dir.glob("*.arrow"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if p == keep:
+                continue
+            # Processes that mapped the file keep their mapping after unlink.
+            p.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,130 @@
+"""
+Dashboard serving snapshot
+--------------------------
+What the dashboard shows on its first render, computed at load time so a
+cold dashboard process can draw it without opening DuckDB or scanning a
+table:
+
+  years, countries  slider bounds and the country list
+  default_totals    per-year totals of the default country selection
+  top_gdp           the TOP_N countries by GDP, for every year
+  co2_trend         global CO₂ per year
+  gdp_co2           GDP / CO₂ pairs from SCATTER_MIN_YEAR on
+  preview           the first PREVIEW_ROWS rows of clean_data
+
+write_snapshot() runs on a staged version just before it is published
+(load_to_duckdb.py). All series go into one Arrow IPC file next to the
+version file (versions.SERVING_SUFFIX), as a single row with one
+list<struct> column per series. read_snapshot() memory-maps the snapshot
+of the version DB_PATH points to, so opening it costs the same whatever
+the size of the warehouse. It returns None when there is no snapshot or
+the version file changed after it was built; the dashboard then queries
+DuckDB as before.
+
+Imports only pyarrow, so the dashboard can read it before loading DuckDB.
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow as pa
+
+from .versions import SERVING_SUFFIX
+
+FORMAT_VERSION = 1
+METADATA_KEY = b"serving"
+DEFAULT_COUNTRIES = 5
+TOP_N = 10
+SCATTER_MIN_YEAR = 2000
+PREVIEW_ROWS = 20
+
+_COUNTRIES_SQL = "SELECT DISTINCT country_name FROM clean_data WHERE country_name IS NOT NULL ORDER BY 1"
+
+# One query per series; the charts read the rollups, which a load has just refreshed.
+SERIES = {
+    "years": "SELECT DISTINCT year FROM clean_data ORDER BY year",
+    "countries": _COUNTRIES_SQL,
+    "default_totals": f"""
+        SELECT year,
+               COALESCE(SUM(population), 0)    AS population,
+               COALESCE(SUM(gdp), 0)           AS gdp,
+               COALESCE(SUM(co2_emissions), 0) AS co2_emissions
+        FROM clean_data
+        WHERE country_name IN ({_COUNTRIES_SQL} LIMIT {DEFAULT_COUNTRIES})
+        GROUP BY year
+        ORDER BY year
+    """,
+    "top_gdp": f"""
+        SELECT year, country_name, gdp
+        FROM rollup_gdp_rank
+        WHERE gdp_rank <= {TOP_N}
+        ORDER BY year, gdp_rank
+    """,
+    "co2_trend": """
+        SELECT year, COALESCE(total_co2, 0) AS co2_emissions
+        FROM rollup_yearly_totals
+        ORDER BY year
+    """,
+    "gdp_co2": f"""
+        SELECT year, gdp, co2_emissions
+        FROM rollup_gdp_co2
+        WHERE year >= {SCATTER_MIN_YEAR}
+        ORDER BY year, country_name
+    """,
+    "preview": f"SELECT * FROM clean_data LIMIT {PREVIEW_ROWS}",
+}
+
+def snapshot_path(db_path) -> Path:
+    """Serving snapshot of the version db_path points to (or of db_path itself)."""
+    return Path(f"{os.path.realpath(db_path)}{SERVING_SUFFIX}")
+
+def _as_list(table: pa.Table) -> pa.Array:
+    """table as a one-element list<struct> array."""
+    rows = table.to_struct_array().combine_chunks()
+    return pa.ListArray.from_arrays(pa.array([0, len(rows)], pa.int32()), rows)
+
+# ───────────────────────────────
+# Build (at load time)
+# ───────────────────────────────
+def write_snapshot(con, db_file) -> Path:
+    """Build the serving snapshot of db_file from con, a connection to it.
+
+    Run it once the version is final: the snapshot records the file's
+    modification time and is ignored if the file changes afterwards.
+    """
+    from .results import write_ipc
+
+    table = pa.table({name: _as_list(con.execute(sql).fetch_arrow_table())
+                      for name, sql in SERIES.items()})
+    metadata = {
+        "format": FORMAT_VERSION,
+        "version": Path(db_file).name,
+        "mtime_ns": os.stat(db_file).st_mtime_ns,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    path = snapshot_path(db_file)
+    write_ipc(table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)}), path)
+    return path
+
+# ───────────────────────────────
+# Read (dashboard)
+# ───────────────────────────────
+def read_snapshot(db_path) -> dict:
+    """{series: Arrow table} of the current version's snapshot, or None if it has no valid one.
+
+    The tables point into a read-only memory map; treat them as read-only.
+    """
+    db_file = os.path.realpath(db_path)
+    try:
+        with pa.memory_map(str(snapshot_path(db_file)), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        mtime_ns = os.stat(db_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b"{}"))
+    if metadata.get("format") != FORMAT_VERSION or metadata.get("mtime_ns") != mtime_ns:
+        return None
+    return {name: pa.Table.from_batches([pa.RecordBatch.from_struct_array(table[name].chunk(0)[0].values)])
+            for name in table.column_names}
@@ -0,0 +1,141 @@
+"""
+Warehouse versions (blue/green)
+-------------------------------
+Loads never write the database readers are using. Each load builds a new
+version file, and publishing it is one atomic rename of a symlink:
+
+  data/warehouse/data-cleaning.duckdb            → symlink to the current version
+  data/warehouse/versions/data-cleaning-<ts>.duckdb   one file per load
+
+stage()    clone the current version (if any) into a new version file
+publish()  point the symlink at a staged version (os.replace) and prune
+           all but the newest `keep` previous versions
+rollback() point the symlink back at an older version
+discard()  delete a staged version that failed
+
+stage() clones copy-on-write where the filesystem can (FICLONE on Linux
+btrfs/XFS, clonefile() on macOS APFS): the clone is instant and a load,
+incremental or not, only pays for the blocks it rewrites. Elsewhere (e.g.
+ext4) it falls back to a full copy, whose I/O grows with the warehouse
+rather than with the change. That is the price of never writing the
+version readers use; the benchmark's stage_version row measures it.
+
+A version's serving snapshot for the dashboard (see serving.py) sits next
+to it as <version file>.serving.arrow and is removed with it, so a
+rollback brings back the matching snapshot.
+
+Readers that opened the old version keep it until they reconnect (the
+pool in connect.py does so as soon as the link changes). A plain database
+file left by older loads is adopted as the first version on publish.
+The link and the versions are local build output and are not tracked by
+git (see .gitignore).
+"""
+
+import ctypes
+import os
+import shutil
+import sys
+from datetime import datetime
+from pathlib import Path
+
+KEEP_VERSIONS = 3
+SERVING_SUFFIX = ".serving.arrow"
+FICLONE = 0x40049409  # Linux ioctl: share src's extents with dst (btrfs, XFS)
+
+def versions_dir(db_path: Path) -> Path:
+    return Path(db_path).parent / "versions"
+
+def list_versions(db_path: Path) -> list:
+    """Version files of db_path, oldest first."""
+    db_path = Path(db_path)
+    return sorted(versions_dir(db_path).glob(f"{db_path.stem}-*{db_path.suffix}"))
+
+def current(db_path: Path):
+    """Version file db_path points to, or None if it is not (yet) versioned."""
+    db_path = Path(db_path)
+    return Path(os.path.realpath(db_path)) if db_path.is_symlink() else None
+
+def _new_version_path(db_path: Path) -> Path:
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    return versions_dir(db_path) / f"{db_path.stem}-{stamp}{db_path.suffix}"
+
+def _remove(path: Path):
+    for p in (path, Path(f"{path}.wal"), Path(f"{path}{SERVING_SUFFIX}")):
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+
+def _clone(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone of src to dst; False (and no dst) where the filesystem can't."""
+    try:
+        if sys.platform == "darwin":
+            libc = ctypes.CDLL(None, use_errno=True)
+            return libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+        import fcntl
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except (ImportError, AttributeError, OSError):
+        _remove(dst)
+        return False
+
+# ───────────────────────────────
+# Stage → publish / discard
+# ───────────────────────────────
+def stage(db_path: Path) -> Path:
+    """New version file seeded with the current database (empty if there is none)."""
+    db_path = Path(db_path)
+    staged = _new_version_path(db_path)
+    staged.parent.mkdir(parents=True, exist_ok=True)
+    if db_path.exists():
+        current_file = Path(os.path.realpath(db_path))
+        if not _clone(current_file, staged):
+            shutil.copyfile(current_file, staged)
+    return staged
+
+def discard(staged: Path):
+    _remove(Path(staged))
+
+def _point(db_path: Path, target: Path):
+    """Atomically make db_path a symlink to target."""
+    link = db_path.with_name(f".{db_path.name}.link")
+    _remove(link)
+    os.symlink(os.path.relpath(target, db_path.parent), link)
+    os.replace(link, db_path)
+
+def publish(db_path: Path, staged: Path, keep: int = KEEP_VERSIONS) -> list:
+    """Make staged the current version; returns the versions pruned."""
+    db_path, staged = Path(db_path), Path(staged)
+    if db_path.exists() and not db_path.is_symlink():
+        # Adopt the unversioned database (hard link: no copy, no gap) so it can be rolled back to.
+        legacy = versions_dir(db_path) / f"{db_path.stem}-00000000T000000000000{db_path.suffix}"
+        os.link(db_path, legacy)
+    _point(db_path, staged)
+    return prune(db_path, keep)
+
+def prune(db_path: Path, keep: int = KEEP_VERSIONS) -> list:
+    """Delete all but the current version and the `keep` newest others."""
+    live = current(db_path)
+    others = [v for v in list_versions(db_path) if live is None or v.name != live.name]
+    pruned = others[:max(len(others) - keep, 0)]
+    for version in pruned:
+        _remove(version)
+    return pruned
+
+def rollback(db_path: Path, version: str = None) -> Path:
+    """Point db_path at version (a file name), or at the version before the current one."""
+    db_path = Path(db_path)
+    versions = list_versions(db_path)
+    if version is not None:
+        target = versions_dir(db_path) / version
+        if target not in versions:
+            raise FileNotFoundError(f" No such warehouse version: {version}")
+    else:
+        live = current(db_path)
+        older = [v for v in versions if live is None or v.name < live.name]
+        if not older:
+            raise RuntimeError(" No older warehouse version to roll back to")
+        target = older[-1]
+    _point(db_path, target)
+    return target